@@ -0,0 +1,53 @@
+import threading
+
+MAX_UINT256 = 2**256 - 1
+
+# 授权策略
+EXACT = 'exact'          # 按剩余循环数批准精确额度，运行结束时额度基本用完，不需要撤销
+PERMANENT = 'permanent'  # 无限批准并保留，之后的运行不再批准
+REVOKE = 'revoke'        # 无限批准，退出时撤销
+POLICIES = (EXACT, PERMANENT, REVOKE)
+
+
+class AllowanceTracker:
+    """本地授权额度跟踪器
+
+    启动时从状态快照读取一次链上授权额度，之后根据自己已上链的 approve/swap 在本地更新，
+    每轮不再读取授权额度。剩余额度不足以覆盖计划的循环时才需要批准。
+    无限授权（MAX_UINT256）与 PancakeSwap/OpenZeppelin 代币一致，transferFrom 不扣减。
+    """
+
+    def __init__(self, policy=EXACT):
+        if policy not in POLICIES:
+            raise ValueError(f"未知的授权策略: {policy}，可选: {', '.join(POLICIES)}")
+        self.policy = policy
+        self.allowance = None
+        self._lock = threading.Lock()
+
+    def sync(self, allowance):
+        """以链上读取的授权额度为准"""
+        with self._lock:
+            self.allowance = allowance
+
+    def approval_amount(self, amount_per_loop, loops):
+        """剩余额度不足以覆盖 loops 次循环时返回需要批准的金额，否则返回None"""
+        required = amount_per_loop * loops
+        with self._lock:
+            if self.allowance is not None and self.allowance >= required:
+                return None
+        return required if self.policy == EXACT else MAX_UINT256
+
+    def approved(self, amount):
+        """approve 已上链：授权额度被设置为 amount（不是累加）"""
+        with self._lock:
+            self.allowance = amount
+
+    def spent(self, amount):
+        """swap 已成功上链，router 消耗了 amount"""
+        with self._lock:
+            if self.allowance is not None and self.allowance != MAX_UINT256:
+                self.allowance = max(0, self.allowance - amount)
+
+    @property
+    def revoke_on_exit(self):
+        return self.policy == REVOKE
@@ -0,0 +1,353 @@
+"""异步多钱包引擎：一个进程内并发运行多组 钱包A/钱包B 的 transferFrom → swap 循环
+
+用法: python async_engine.py pairs.json
+
+配置文件格式见 pairs.example.json。所有钱包组共用一个HTTP连接池、一个区块流和
+每个区块只查询一次的gas价格缓存。未在配置文件中给出的参数沿用 .env 中的同名设置。
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import logging
+from decimal import Decimal
+import aiohttp
+from dotenv import load_dotenv
+from eth_account import Account
+from web3 import AsyncHTTPProvider, AsyncWeb3, Web3
+from web3.exceptions import TimeExhausted
+from allowance import AllowanceTracker
+from notifier import DEFAULT_BLOCK_TIME
+from quoter import PairQuoter, get_amount_out
+from rpc import async_batch_request, format_receipt, tx_hash_key
+from snapshot import MULTICALL3_ADDRESS, ContractRead, decode_aggregate3, encode_aggregate3
+from tx_factory import TxFactory, deadline_after
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s | %(message)s',
+    datefmt='%H:%M:%S'
+)
+
+load_dotenv()
+
+# 每组钱包的默认参数，与 tas.py 使用相同的环境变量
+DEFAULTS = {
+    'token_amount': os.getenv('TOKEN_AMOUNT', '100'),
+    'token_decimals': int(os.getenv('TOKEN_DECIMALS', '18')),
+    'deadline_minutes': int(os.getenv('DEADLINE_MINUTES', '20')),
+    'gas_limit_transfer': int(os.getenv('GAS_LIMIT_TRANSFER', '100000')),
+    'gas_limit_approve': int(os.getenv('GAS_LIMIT_APPROVE', '100000')),
+    'gas_limit_swap': int(os.getenv('GAS_LIMIT_SWAP', '300000')),
+    'loop_count': int(os.getenv('LOOP_COUNT', '10')),
+    'loop_interval': float(os.getenv('LOOP_INTERVAL', '2')),
+    'slippage': float(os.getenv('SLIPPAGE', '0.1')),
+    'approval_policy': os.getenv('APPROVAL_POLICY', 'exact'),
+}
+
+
+class AsyncBlockStream:
+    """共享区块流：按出块间隔自适应轮询，每个新区块一次批量回执查询并刷新gas价格缓存"""
+
+    def __init__(self, w3, min_poll_interval=0.2, max_poll_interval=3.0):
+        self.w3 = w3
+        self.min_poll_interval = min_poll_interval
+        self.max_poll_interval = max_poll_interval
+        self.latest_block = None
+        self._last_block_time = None
+        self._block_time = DEFAULT_BLOCK_TIME
+        self._new_block = asyncio.Event()
+        self._pending = {}          # 交易哈希 -> Future
+        self._gas_price = None
+        self._gas_price_block = None
+        self._gas_lock = asyncio.Lock()
+
+    async def run(self):
+        while True:
+            try:
+                await self._on_new_head(await self.w3.eth.block_number)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logging.warning(f"查询区块高度失败: {str(e)[:50]}")
+            await asyncio.sleep(self._next_poll_delay())
+
+    def _next_poll_delay(self):
+        if self._last_block_time is None:
+            return self.min_poll_interval
+        remaining = self._block_time - (time.time() - self._last_block_time)
+        return min(max(remaining, self.min_poll_interval), self.max_poll_interval)
+
+    async def _on_new_head(self, block_number):
+        if self.latest_block is not None and block_number <= self.latest_block:
+            return
+        now = time.time()
+        if self.latest_block is not None:
+            # 指数平滑的出块间隔
+            interval = (now - self._last_block_time) / (block_number - self.latest_block)
+            self._block_time = 0.8 * self._block_time + 0.2 * interval
+        self.latest_block = block_number
+        self._last_block_time = now
+
+        if self._pending:
+            keys = list(self._pending)
+            results = await async_batch_request(self.w3, [('eth_getTransactionReceipt', [k]) for k in keys])
+            for key, raw_receipt in zip(keys, results):
+                future = self._pending.get(key)
+                if raw_receipt is not None and future is not None and not future.done():
+                    future.set_result(format_receipt(raw_receipt))
+                    del self._pending[key]
+
+        # 唤醒所有等待新区块的协程
+        self._new_block.set()
+        self._new_block = asyncio.Event()
+
+    async def wait_for_block(self, current_block):
+        while self.latest_block is None or self.latest_block <= current_block:
+            await self._new_block.wait()
+        return self.latest_block
+
+    async def wait_for_receipt(self, tx_hash, timeout=120):
+        key = tx_hash_key(tx_hash)
+        future = self._pending.get(key)
+        if future is None:
+            future = asyncio.get_running_loop().create_future()
+            self._pending[key] = future
+        try:
+            return await asyncio.wait_for(asyncio.shield(future), timeout)
+        except asyncio.TimeoutError:
+            self._pending.pop(key, None)
+            raise TimeExhausted(f"交易 {key} 在 {timeout} 秒内未被打包")
+
+    async def gas_price(self):
+        """gas价格每个区块只查询一次，所有钱包组共用"""
+        async with self._gas_lock:
+            if self._gas_price is None or self._gas_price_block != self.latest_block:
+                self._gas_price = await self.w3.eth.gas_price
+                self._gas_price_block = self.latest_block
+            return self._gas_price
+
+
+class PairRunner:
+    """一组钱包的 transferFrom → swap 循环"""
+
+    def __init__(self, engine, config):
+        self.engine = engine
+        self.config = {**DEFAULTS, **config}
+        private_key = self.config.get('private_key') or os.getenv(self.config.get('private_key_env', ''))
+        if not private_key:
+            raise ValueError(f"钱包组 {config.get('name')} 缺少 private_key / private_key_env")
+        self.account = Account.from_key(private_key)
+        self.name = self.config.get('name') or self.account.address[:10]
+        self.wallet_a = Web3.to_checksum_address(self.config['wallet_a_address'])
+        self.token = Web3.to_checksum_address(self.config['token_address'])
+        self.amount = int(Decimal(str(self.config['token_amount'])) * (10 ** int(self.config['token_decimals'])))
+        self.path = [self.token, engine.wbnb]
+        self._nonce = None
+        self.allowance = AllowanceTracker(self.config['approval_policy'])
+
+        # 预编码交易模板，chain_id 在引擎连接节点后获取
+        self.factory = TxFactory(private_key, lambda: engine.chain_id)
+        self.factory.register('transfer', self.token, 'transferFrom(address,address,uint256)',
+                              [self.wallet_a, self.account.address, self.amount], self.config['gas_limit_transfer'])
+        self.factory.register('swap', engine.router, 'swapExactTokensForETH(uint256,uint256,address[],address,uint256)',
+                              [self.amount, 0, self.path, self.wallet_a, 0], int(self.config['gas_limit_swap'] * 1.3),
+                              variables={'amount_out_min': 1, 'deadline': 4},
+                              providers={'deadline': deadline_after(60 * int(self.config['deadline_minutes']))})
+        self.factory.register('approve', self.token, 'approve(address,uint256)',
+                              [engine.router, 0], self.config['gas_limit_approve'], variables={'amount': 1})
+
+    def log(self, level, message):
+        logging.log(level, f"[{self.name}] {message}")
+
+    async def _allocate_nonce(self):
+        # 同一事件循环内单线程执行，本地递增即可保证唯一
+        if self._nonce is None:
+            self._nonce = await self.engine.w3.eth.get_transaction_count(self.account.address, 'pending')
+        nonce = self._nonce
+        self._nonce += 1
+        return nonce
+
+    async def _send(self, signed_tx, tx_type):
+        try:
+            tx_hash = await self.engine.w3.eth.send_raw_transaction(signed_tx.raw_transaction)
+        except Exception as e:
+            if "already known" not in str(e):
+                raise
+            tx_hash = signed_tx.hash
+        self.log(logging.INFO, f"{tx_type} 发送成功 | Hash: {Web3.to_hex(tx_hash)[:10]}...")
+        return tx_hash
+
+    def _approve_tx(self, amount, gas_price, nonce):
+        return self.factory.build('approve', nonce, gas_price, amount=amount)
+
+    def _transfer_tx(self, gas_price, nonce):
+        return self.factory.build('transfer', nonce, gas_price)
+
+    def _swap_tx(self, amount_out_min, gas_price, nonce):
+        return self.factory.build('swap', nonce, int(gas_price * 1.2), amount_out_min=amount_out_min)
+
+    async def quote_amount_out_min(self):
+        """一次Multicall3读取交易对储备量，本地计算最小输出"""
+        pair = await self.engine.pair_for(self.token)
+        reserves = await self.engine.multicall([
+            ContractRead('reserves', pair, 'getReserves()', (), ['uint112', 'uint112', 'uint32']),
+        ])
+        reserve0, reserve1, _ = reserves['reserves']
+        token0, _ = PairQuoter.sort_tokens(self.token, self.engine.wbnb)
+        reserve_in, reserve_out = (reserve0, reserve1) if token0 == self.token else (reserve1, reserve0)
+        expected_amount = get_amount_out(self.amount, reserve_in, reserve_out)
+        return int(expected_amount * (1 - self.config['slippage'] / 100))
+
+    async def read_allowance(self):
+        """启动时读取一次授权额度，之后由 AllowanceTracker 在本地跟踪"""
+        values = await self.engine.multicall([
+            ContractRead('allowance', self.token, 'allowance(address,address)', [self.account.address, self.engine.router]),
+        ])
+        self.allowance.sync(values['allowance'])
+
+    async def run_round(self, approve_amount=None):
+        """approve(可选) → transferFrom → swap 背靠背发送，再统一等待确认"""
+        amount_out_min, gas_price = await asyncio.gather(self.quote_amount_out_min(), self.engine.blocks.gas_price())
+        steps = []
+        if approve_amount is not None:
+            steps.append(("批准", lambda nonce: self._approve_tx(approve_amount, gas_price, nonce)))
+        steps.append(("Transfer", lambda nonce: self._transfer_tx(gas_price, nonce)))
+        steps.append(("Swap", lambda nonce: self._swap_tx(amount_out_min, gas_price, nonce)))
+
+        sent = []
+        for tx_type, build_tx in steps:
+            nonce = await self._allocate_nonce()
+            try:
+                sent.append((tx_type, await self._send(build_tx(nonce), tx_type)))
+            except Exception as e:
+                self.log(logging.ERROR, f"{tx_type} 发送失败: {str(e)[:50]}")
+                # 以链上pending计数为准重新分配nonce
+                self._nonce = None
+                break
+
+        receipts = {}
+        results = await asyncio.gather(*(self.engine.blocks.wait_for_receipt(h) for _, h in sent), return_exceptions=True)
+        for (tx_type, _), result in zip(sent, results):
+            if isinstance(result, Exception):
+                self.log(logging.ERROR, f"{tx_type} 等待确认失败: {str(result)[:50]}")
+                self._nonce = None
+                continue
+            receipts[tx_type] = result
+            if result['status'] == 1:
+                if tx_type == "批准":
+                    self.allowance.approved(approve_amount)
+                elif tx_type == "Swap":
+                    self.allowance.spent(self.amount)
+            self.log(logging.INFO, f"{tx_type} 确认 | 区块: {result['blockNumber']} | 状态: {'成功' if result['status'] == 1 else '失败'}")
+        return receipts
+
+    async def revoke(self):
+        nonce = await self._allocate_nonce()
+        tx_hash = await self._send(self._approve_tx(0, await self.engine.blocks.gas_price(), nonce), "撤销批准")
+        receipt = await self.engine.blocks.wait_for_receipt(tx_hash)
+        if receipt['status'] == 1:
+            self.allowance.approved(0)
+        return receipt['status'] == 1
+
+    async def run(self):
+        loop_count = int(self.config['loop_count'])
+        success_count = 0
+        try:
+            await self.read_allowance()
+            for loop_counter in range(1, loop_count + 1):
+                self.log(logging.INFO, f"===== 开始第 {loop_counter}/{loop_count} 次循环 =====")
+                # 剩余授权额度不足以覆盖剩下的循环时才随本轮一起批准
+                approve_amount = self.allowance.approval_amount(self.amount, loop_count - loop_counter + 1)
+                receipts = await self.run_round(approve_amount)
+                if approve_amount is not None and receipts.get("批准", {}).get('status') != 1:
+                    self.log(logging.ERROR, "批准失败，无法继续")
+                    return success_count
+                if receipts.get("Transfer", {}).get('status') == 1 and receipts.get("Swap", {}).get('status') == 1:
+                    success_count += 1
+                    self.log(logging.INFO, f"✨ 循环 {loop_counter}: TransferFrom和Swap成功完成!")
+                else:
+                    self.log(logging.ERROR, f"循环 {loop_counter}: 未能完成transferFrom和swap")
+                if loop_counter < loop_count:
+                    await asyncio.sleep(float(self.config['loop_interval']))
+        finally:
+            if self.allowance.revoke_on_exit and self.allowance.allowance:
+                try:
+                    if await self.revoke():
+                        self.log(logging.INFO, "✅ 撤销批准成功")
+                except Exception as e:
+                    self.log(logging.ERROR, f"撤销批准错误: {str(e)[:50]}")
+        return success_count
+
+
+class AsyncEngine:
+    """共享 AsyncWeb3 连接、区块流和gas价格缓存，并发运行所有钱包组"""
+
+    def __init__(self, config):
+        self.config = config
+        self.rpc_url = config.get('rpc_url') or os.getenv('RPC_URL', 'https://bsc-dataseed.binance.org/')
+        self.router = Web3.to_checksum_address(config.get('router') or os.getenv('PANCAKESWAP_ROUTER_ADDRESS', '0x10ED43C718714eb63d5aA57B78B54704E256024E'))
+        self.wbnb = Web3.to_checksum_address(config.get('wbnb') or os.getenv('WBNB_ADDRESS', '0xbb4CdB9CBd36B01bD1cBaEBF2De08d9173bc095c'))
+        self.multicall_address = Web3.to_checksum_address(config.get('multicall') or MULTICALL3_ADDRESS)
+        self.pool_size = int(config.get('pool_size', 100))
+        self.w3 = None
+        self.blocks = None
+        self.chain_id = None
+        self._factory = None
+        self._pairs = {}
+        self._pair_lock = asyncio.Lock()
+        self.runners = [PairRunner(self, pair) for pair in config.get('pairs', [])]
+
+    async def multicall(self, calls, block_identifier='latest'):
+        data = encode_aggregate3(self.multicall_address, calls)
+        raw = await self.w3.eth.call({'to': self.multicall_address, 'data': data}, block_identifier)
+        return decode_aggregate3(raw, calls)
+
+    async def pair_for(self, token):
+        """交易对地址，同一代币的钱包组共用一次查询"""
+        async with self._pair_lock:
+            if token not in self._pairs:
+                if self._factory is None:
+                    result = await self.multicall([ContractRead('factory', self.router, 'factory()', (), ['address'])])
+                    self._factory = Web3.to_checksum_address(result['factory'])
+                key = PairQuoter.sort_tokens(token, self.wbnb)
+                result = await self.multicall([ContractRead('pair', self._factory, 'getPair(address,address)', key, ['address'])])
+                self._pairs[token] = Web3.to_checksum_address(result['pair'])
+            return self._pairs[token]
+
+    async def run(self):
+        provider = AsyncHTTPProvider(self.rpc_url, request_kwargs={'timeout': aiohttp.ClientTimeout(total=10)})
+        # 所有钱包组共用一个连接池
+        session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=self.pool_size, keepalive_timeout=60))
+        await provider.cache_async_session(session)
+        self.w3 = AsyncWeb3(provider)
+        self.blocks = AsyncBlockStream(self.w3)
+        block_task = asyncio.create_task(self.blocks.run())
+        try:
+            self.chain_id = await self.w3.eth.chain_id
+            logging.info(f"启动 {len(self.runners)} 组钱包 | RPC: {self.rpc_url}")
+            results = await asyncio.gather(*(runner.run() for runner in self.runners), return_exceptions=True)
+            for runner, result in zip(self.runners, results):
+                if isinstance(result, Exception):
+                    runner.log(logging.ERROR, f"运行出错: {str(result)[:100]}")
+                else:
+                    runner.log(logging.INFO, f"完成 {result}/{runner.config['loop_count']} 次循环")
+            return results
+        finally:
+            block_task.cancel()
+            await session.close()
+
+
+def load_config(path):
+    with open(path, 'r') as file:
+        return json.loads(file.read())
+
+
+def main():
+    config_path = sys.argv[1] if len(sys.argv) > 1 else os.getenv('PAIRS_CONFIG', 'pairs.json')
+    asyncio.run(AsyncEngine(load_config(config_path)).run())
+
+
+if __name__ == "__main__":
+    main()
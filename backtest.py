@@ -0,0 +1,145 @@
+"""滑点与拆单策略的离线回测（NumPy向量化）
+
+用法: python backtest.py [--db tas_index.db | --synthetic N] [--amount 数量] [--delay 区块数] [--z 2,3,4] [--parts 5]
+
+历史储备量来自 indexer.py 的索引数据库（每个区块结束时的储备量），也可以用 --synthetic 生成随机游走的储备量。
+对每个快照 t 假设按 t 的储备量报价、在 t+delay 的储备量成交，一次性对全部快照计算：
+  - 静态滑点（SLIPPAGE）与不同 z 值的动态滑点（z × 近期每区块波动 × sqrt(delay)，限制在 [SLIPPAGE_MIN, SLIPPAGE_MAX]）
+    的回滚率和平均滑点容忍度（可被夹子攻击拿走的上限）
+  - 把数量拆成 1..parts 笔、在相邻快照依次成交时相对中间价的平均成本和波动
+
+依赖（仅本脚本需要）: pip install numpy
+"""
+import os
+import sys
+import sqlite3
+import argparse
+from dotenv import load_dotenv
+from quoter import PANCAKE_V2_FEE_BPS
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+def load_reserves(path):
+    """从索引数据库读取 (区块, reserve_in, reserve_out)，按区块排序"""
+    conn = sqlite3.connect(path)
+    try:
+        rows = conn.execute('SELECT block, reserve_in, reserve_out FROM reserves ORDER BY block').fetchall()
+    finally:
+        conn.close()
+    blocks = np.array([row[0] for row in rows], dtype=np.int64)
+    reserve_in = np.array([float(row[1]) for row in rows])
+    reserve_out = np.array([float(row[2]) for row in rows])
+    return blocks, reserve_in, reserve_out
+
+
+def synthetic_reserves(count, sigma=0.002, reserve_in=1e24, reserve_out=1e21, seed=1):
+    """每区块对数价格按正态随机游走、流动性（乘积）不变的储备量序列；波动率分段变化，便于比较动态滑点"""
+    rng = np.random.default_rng(seed)
+    regimes = np.repeat(rng.choice([0.5, 1.0, 3.0], size=count // 500 + 1), 500)[:count]
+    log_price = np.cumsum(rng.normal(0.0, sigma * regimes))
+    k = reserve_in * reserve_out
+    price = reserve_out / reserve_in * np.exp(log_price)
+    return np.arange(count, dtype=np.int64), np.sqrt(k / price), np.sqrt(k * price)
+
+
+def amount_out(amount_in, reserve_in, reserve_out, fee_bps=PANCAKE_V2_FEE_BPS):
+    """向量化的恒定乘积输出（浮点，统计用）"""
+    amount_with_fee = amount_in * (10000 - fee_bps) / 10000
+    return amount_with_fee * reserve_out / (reserve_in + amount_with_fee)
+
+
+def rolling_volatility(blocks, reserve_in, reserve_out, window):
+    """每个快照处（只用当时及之前的数据）最近 window 个每区块对数收益的标准差，数据不足处为 nan"""
+    log_price = np.log(reserve_out / reserve_in)
+    returns = np.diff(log_price) / np.sqrt(np.maximum(np.diff(blocks), 1))
+    sums = np.concatenate([[0.0], np.cumsum(returns)])
+    squares = np.concatenate([[0.0], np.cumsum(returns ** 2)])
+    volatility = np.full(len(blocks), np.nan)
+    if len(returns) < window:
+        return volatility
+    total = sums[window:] - sums[:-window]
+    total_sq = squares[window:] - squares[:-window]
+    variance = (total_sq - total ** 2 / window) / (window - 1)
+    volatility[window:] = np.sqrt(np.maximum(variance, 0.0))
+    return volatility
+
+
+def slippage_table(reserve_in, reserve_out, volatility, amount, delay, static, z_values, low, high):
+    """各滑点策略的 (名称, 回滚率, 平均滑点%)"""
+    quoted = amount_out(amount, reserve_in[:-delay], reserve_out[:-delay])
+    filled = amount_out(amount, reserve_in[delay:], reserve_out[delay:])
+    sigma = volatility[:-delay]
+    valid = ~np.isnan(sigma)
+    quoted, filled, sigma = quoted[valid], filled[valid], sigma[valid]
+    rows = []
+    for name, slippage in [(f'静态 {static}%', np.full(len(quoted), static))] + [
+        (f'动态 z={z:g}', np.clip(z * sigma * np.sqrt(delay) * 100, low, high)) for z in z_values
+    ]:
+        reverted = filled < quoted * (1 - slippage / 100)
+        rows.append((name, reverted.mean() * 100, slippage.mean()))
+    return rows, int(valid.sum())
+
+
+def split_table(reserve_in, reserve_out, amount, max_parts):
+    """拆成 n 笔、在相邻快照依次成交时相对报价时中间价的成本 (n, 平均bps, 标准差bps)"""
+    count = len(reserve_in) - max_parts + 1
+    mid = reserve_out[:count] / reserve_in[:count]
+    rows = []
+    for parts in range(1, max_parts + 1):
+        received = sum(amount_out(amount / parts, reserve_in[k:k + count], reserve_out[k:k + count]) for k in range(parts))
+        cost = (1 - received / (amount * mid)) * 10000
+        rows.append((parts, cost.mean(), cost.std()))
+    return rows
+
+
+def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser(description='滑点与拆单策略的离线回测')
+    parser.add_argument('--db', default=os.getenv('INDEX_FILE', 'tas_index.db'), help='indexer.py 的索引数据库')
+    parser.add_argument('--synthetic', type=int, help='不读数据库，生成 N 个区块的随机游走储备量')
+    parser.add_argument('--amount', type=float, default=float(os.getenv('TOKEN_AMOUNT', '100')), help='每轮代币数量')
+    parser.add_argument('--decimals', type=int, default=int(os.getenv('TOKEN_DECIMALS', '18')))
+    parser.add_argument('--delay', type=int, default=1, help='报价到成交经过的快照数')
+    parser.add_argument('--window', type=int, default=50, help='波动率窗口')
+    parser.add_argument('--z', default='2,3,4', help='动态滑点的 z 值（逗号分隔）')
+    parser.add_argument('--parts', type=int, default=5, help='最多拆成几笔')
+    args = parser.parse_args()
+
+    if np is None:
+        print("需要安装 numpy: pip install numpy")
+        return 1
+    if args.synthetic:
+        blocks, reserve_in, reserve_out = synthetic_reserves(args.synthetic)
+    elif os.path.exists(args.db):
+        blocks, reserve_in, reserve_out = load_reserves(args.db)
+    else:
+        print(f"索引数据库不存在: {args.db}，先运行 indexer.py 或使用 --synthetic")
+        return 1
+    if len(blocks) < args.window + args.delay + args.parts:
+        print(f"储备量快照太少: {len(blocks)}，先运行 indexer.py 或使用 --synthetic")
+        return 1
+
+    amount = args.amount * 10 ** args.decimals
+    static = float(os.getenv('SLIPPAGE', '0.1'))
+    low, high = float(os.getenv('SLIPPAGE_MIN', '0.05')), float(os.getenv('SLIPPAGE_MAX', '1.0'))
+    z_values = [float(z) for z in args.z.split(',') if z]
+
+    volatility = rolling_volatility(blocks, reserve_in, reserve_out, args.window)
+    rows, samples = slippage_table(reserve_in, reserve_out, volatility, amount, args.delay, static, z_values, low, high)
+    print(f"快照: {len(blocks)}（区块 {blocks[0]}-{blocks[-1]}）| 每轮数量: {args.amount:g} | 延迟: {args.delay} | 样本: {samples}")
+    print(f"\n{'滑点策略':<16}{'回滚率%':>10}{'平均滑点%':>12}")
+    for name, revert_rate, mean_slippage in rows:
+        print(f"{name:<16}{revert_rate:>10.3f}{mean_slippage:>12.4f}")
+
+    print(f"\n{'拆单笔数':<10}{'平均成本bps':>14}{'标准差bps':>12}")
+    for parts, mean_cost, std_cost in split_table(reserve_in, reserve_out, amount, args.parts):
+        print(f"{parts:<10}{mean_cost:>14.2f}{std_cost:>12.2f}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
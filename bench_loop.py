@@ -0,0 +1,351 @@
+"""transferFrom → swap 循环的本地链基准测试与回归检查（不连接真实节点）
+
+用法: python bench_loop.py [--loops N] [--block-time 秒] [--sequential] [--batch-size K] [--baseline 文件] [--save-baseline 文件] [--tolerance 0.2]
+
+在进程内启动 eth-tester（py-evm）内存链，部署 contracts/ 下的模拟合约（与 tokenabi.js 接口一致的ERC20、
+WBNB、PancakeSwap V2 交易对/路由和 Multicall3），通过本地HTTP JSON-RPC服务对外提供，
+然后以该节点为 RPC_URL 导入 tas.py 运行 main()：按授权策略批准 → N 次 transferFrom+swap（revoke 策略下最后撤销批准）。
+
+输出每秒循环数、每次循环的RPC调用数（按方法）和各阶段耗时 p50/p99。
+传入 --baseline 时与基准结果比较，性能退化超过容差则以退出码1结束，可直接用于CI。
+
+依赖（仅本脚本需要）: pip install "eth-tester[py-evm]" vyper
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import threading
+from collections import Counter, defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from web3 import Web3
+
+CONTRACTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'contracts')
+MAX_UINT256 = 2 ** 256 - 1
+TOKEN_AMOUNT = 100                       # 每次循环转账/兑换的代币数量
+POOL_TOKEN = 1_000_000 * 10 ** 18        # 交易对初始代币储备
+POOL_WBNB = 1_000 * 10 ** 18             # 交易对初始WBNB储备
+
+# 绝对值低于这个差距（毫秒）的阶段耗时变化视为噪声，不算退化
+STAGE_NOISE_MS = 2.0
+
+
+def compile_contract(name):
+    """用 vyper 编译 contracts/<name>.vy，返回 (abi, bytecode)"""
+    import vyper
+    with open(os.path.join(CONTRACTS_DIR, f'{name}.vy'), 'r') as file:
+        output = vyper.compile_code(file.read(), output_formats=['abi', 'bytecode'])
+    return output['abi'], output['bytecode']
+
+
+def _to_wire(value):
+    """eth-tester 返回的Python值转为JSON-RPC格式：整数→十六进制数量，bytes→0x十六进制"""
+    if isinstance(value, bool) or value is None or isinstance(value, str):
+        return value
+    if isinstance(value, int):
+        return hex(value)
+    if isinstance(value, (bytes, bytearray)):
+        return Web3.to_hex(value)
+    if isinstance(value, dict):
+        return {key: _to_wire(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_to_wire(item) for item in value]
+    return value
+
+
+def _error_message(error):
+    """eth-tester 的异常转为与真实节点一致的错误信息"""
+    message = str(error)
+    if message.startswith('Invalid transaction nonce'):
+        # "Invalid transaction nonce: Expected 5, but got 4"
+        numbers = [int(part.strip(',')) for part in message.split() if part.strip(',').isdigit()]
+        if len(numbers) == 2 and numbers[1] < numbers[0]:
+            return f"nonce too low: next nonce {numbers[0]}, tx nonce {numbers[1]}"
+    return message
+
+
+class LocalChain:
+    """eth-tester（py-evm）内存链，经本地HTTP JSON-RPC提供服务
+
+    每笔交易立即单独出块；start_mining() 之后另按固定间隔出空块，让区块高度像真实链一样持续增长
+    （eth-tester 关闭自动出块后不支持连续的pending nonce，无法模拟同一区块打包多笔交易）。
+
+    服务端统计收到的每个RPC方法调用次数和HTTP往返次数（批量请求算一次往返）。
+    """
+
+    def __init__(self):
+        from eth_tester import EthereumTester, PyEVMBackend
+        from web3 import EthereumTesterProvider
+
+        self.tester = EthereumTester(PyEVMBackend())
+        provider = EthereumTesterProvider(self.tester)
+        self.w3 = Web3(provider)
+        # 只经过 eth-tester 自身的格式转换，得到接近节点原始返回的结果
+        raw_w3 = Web3(provider)
+        raw_w3.middleware_onion.clear()
+        self._request = provider.request_func(raw_w3, raw_w3.middleware_onion)
+        self._lock = threading.Lock()
+        self.calls = Counter()
+        self.round_trips = 0
+        self.server = None
+        self._stop = threading.Event()
+
+    @property
+    def accounts(self):
+        return self.tester.get_accounts()
+
+    @property
+    def private_keys(self):
+        return [key.to_hex() for key in self.tester.backend.account_keys]
+
+    def handle(self, request):
+        method, params = request.get('method'), request.get('params') or []
+        with self._lock:
+            self.calls[method] += 1
+            try:
+                response = self._request(method, params)
+            except Exception as e:
+                response = {'error': {'code': -32000, 'message': _error_message(e)}}
+        result = {'jsonrpc': '2.0', 'id': request.get('id')}
+        if response.get('error') is not None:
+            error = response['error']
+            result['error'] = error if isinstance(error, dict) else {'code': -32000, 'message': str(error)}
+        else:
+            result['result'] = _to_wire(response.get('result'))
+        return result
+
+    def serve(self):
+        chain = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            disable_nagle_algorithm = True
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+                with chain._lock:
+                    chain.round_trips += 1
+                if isinstance(body, list):
+                    payload = [chain.handle(item) for item in body]
+                else:
+                    payload = chain.handle(body)
+                data = json.dumps(payload).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, name='local-chain', daemon=True).start()
+        return f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def start_mining(self, block_time):
+        def mine():
+            while not self._stop.wait(block_time):
+                with self._lock:
+                    self.tester.mine_blocks(1)
+
+        threading.Thread(target=mine, name='local-miner', daemon=True).start()
+
+    def stop(self):
+        self._stop.set()
+        if self.server is not None:
+            self.server.shutdown()
+
+    def reset_counters(self):
+        with self._lock:
+            self.calls.clear()
+            self.round_trips = 0
+
+    def deploy(self, name, *args):
+        abi, bytecode = compile_contract(name)
+        contract = self.w3.eth.contract(abi=abi, bytecode=bytecode)
+        tx_hash = contract.constructor(*args).transact({'from': self.accounts[0]})
+        receipt = self.w3.eth.wait_for_transaction_receipt(tx_hash)
+        return self.w3.eth.contract(address=receipt['contractAddress'], abi=abi)
+
+    def transact(self, fn, sender=None, value=0):
+        tx_hash = fn.transact({'from': sender or self.accounts[0], 'value': value})
+        receipt = self.w3.eth.wait_for_transaction_receipt(tx_hash)
+        assert receipt['status'] == 1, f"部署交易失败: {fn.fn_name}"
+        return receipt
+
+
+def setup_market(chain, wallet_a, wallet_b, loops):
+    """部署代币、WBNB、交易对、路由和Multicall3，注入流动性，钱包A授权钱包B转账"""
+    token = chain.deploy('MockToken', 'Bench Token', 'BENCH')
+    wbnb = chain.deploy('MockToken', 'Wrapped BNB', 'WBNB')
+    router = chain.deploy('MockRouter', wbnb.address)
+    multicall = chain.deploy('Multicall3')
+    token0, token1 = sorted([token.address, wbnb.address], key=lambda address: int(address, 16))
+    pair = chain.deploy('MockPair', token0, token1)
+    chain.transact(router.functions.setPair(token.address, wbnb.address, pair.address))
+
+    chain.transact(token.functions.mint(pair.address, POOL_TOKEN))
+    chain.transact(wbnb.functions.deposit(), value=POOL_WBNB)
+    chain.transact(wbnb.functions.transfer(pair.address, POOL_WBNB))
+    chain.transact(pair.functions.sync())
+
+    chain.transact(token.functions.mint(wallet_a, (loops + 1) * TOKEN_AMOUNT * 10 ** 18))
+    chain.transact(token.functions.approve(wallet_b, MAX_UINT256), sender=wallet_a)
+    return {'token': token, 'wbnb': wbnb, 'router': router, 'multicall': multicall, 'pair': pair}
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+
+def stage_latencies(trace_path):
+    """从 tas.py 的JSON lines追踪文件统计各阶段耗时 p50/p99（毫秒）"""
+    samples = defaultdict(list)
+    with open(trace_path, 'r', encoding='utf-8') as file:
+        for line in file:
+            event = json.loads(line)
+            if 'ms' in event:
+                samples[event['event']].append(event['ms'])
+    return {stage: {'p50': round(percentile(values, 0.5), 3), 'p99': round(percentile(values, 0.99), 3), 'count': len(values)}
+            for stage, values in sorted(samples.items())}
+
+
+def run(loops, pipeline, block_time, batch_size=1):
+    chain = LocalChain()
+    url = chain.serve()
+    accounts, keys = chain.accounts, chain.private_keys
+    wallet_a, wallet_b, wallet_b_key = accounts[1], accounts[2], keys[2]
+    market = setup_market(chain, wallet_a, wallet_b, loops)
+    trace_path = os.path.join(tempfile.mkdtemp(prefix='bench_loop_'), 'trace.jsonl')
+
+    os.environ.update({
+        'RPC_URL': url,
+        'RPC_URLS': url,
+        'BROADCAST_URLS': url,
+        'WS_URL': '',
+        'PRIVATE_KEY': wallet_b_key,
+        'TOKEN_ADDRESS': market['token'].address,
+        'WALLET_A_ADDRESS': wallet_a,
+        'PANCAKESWAP_ROUTER_ADDRESS': market['router'].address,
+        'WBNB_ADDRESS': market['wbnb'].address,
+        'MULTICALL3_ADDRESS': market['multicall'].address,
+        'TOKEN_AMOUNT': str(TOKEN_AMOUNT),
+        'LOOP_COUNT': str(loops),
+        'LOOP_INTERVAL': '0',
+        'PIPELINE': 'true' if pipeline else 'false',
+        'BATCH_SIZE': str(batch_size),
+        'GAS_STRATEGY': 'legacy',
+        'METRICS_PORT': '',
+        'TRACE_FILE': trace_path,
+        'JOURNAL_FILE': '',
+    })
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    pair_balance_before = market['token'].functions.balanceOf(market['pair'].address).call()
+
+    chain.start_mining(block_time)
+    import tas
+    chain.reset_counters()
+    start_block = chain.w3.eth.block_number
+    start = time.perf_counter()
+    tas.main()
+    elapsed = time.perf_counter() - start
+    blocks = chain.w3.eth.block_number - start_block
+    tas.notifier.stop()
+    tas.metrics.close()
+    chain.stop()
+
+    # 每次循环兑换的代币都进入交易对：数量不对说明有循环没有真正完成
+    swapped = market['token'].functions.balanceOf(market['pair'].address).call() - pair_balance_before
+    completed_loops = swapped // (TOKEN_AMOUNT * 10 ** 18)
+
+    calls = dict(chain.calls)
+    return {
+        'mode': 'pipeline' if pipeline else 'sequential',
+        'batch_size': batch_size if pipeline else 1,
+        'block_time': block_time,
+        'loops': loops,
+        'completed_loops': completed_loops,
+        'elapsed_s': round(elapsed, 3),
+        'loops_per_sec': round(loops / elapsed, 3),
+        'loops_per_block': round(completed_loops / blocks, 3) if blocks else None,
+        'rpc_calls_per_loop': round(sum(calls.values()) / loops, 2),
+        'rpc_round_trips_per_loop': round(chain.round_trips / loops, 2),
+        'rpc_calls_by_method': {method: round(count / loops, 2) for method, count in sorted(calls.items())},
+        'stages': stage_latencies(trace_path),
+    }
+
+
+def compare(result, baseline, tolerance):
+    """与基准比较，返回退化项列表"""
+    regressions = []
+    if result['completed_loops'] < result['loops']:
+        regressions.append(f"只完成了 {result['completed_loops']}/{result['loops']} 次循环")
+    if result['loops_per_sec'] < baseline['loops_per_sec'] * (1 - tolerance):
+        regressions.append(f"每秒循环数 {result['loops_per_sec']} < 基准 {baseline['loops_per_sec']}")
+    if result['rpc_calls_per_loop'] > baseline['rpc_calls_per_loop'] * (1 + tolerance):
+        regressions.append(f"每次循环RPC调用 {result['rpc_calls_per_loop']} > 基准 {baseline['rpc_calls_per_loop']}")
+    for stage, base in baseline.get('stages', {}).items():
+        current = result['stages'].get(stage)
+        if current is None:
+            continue
+        # p99 波动更大，容差加倍
+        for key, limit in (('p50', tolerance), ('p99', tolerance * 2)):
+            if current[key] > base[key] * (1 + limit) and current[key] - base[key] > STAGE_NOISE_MS:
+                regressions.append(f"阶段 {stage} {key} {current[key]} ms > 基准 {base[key]} ms")
+    return regressions
+
+
+def print_report(result):
+    print(f"\n模式: {result['mode']} (每批 {result.get('batch_size', 1)} 轮) | 循环: {result['completed_loops']}/{result['loops']} | 耗时: {result['elapsed_s']} s")
+    print(f"每秒循环数: {result['loops_per_sec']} | 每区块循环数: {result.get('loops_per_block')}")
+    print(f"每次循环RPC调用: {result['rpc_calls_per_loop']}（HTTP往返 {result['rpc_round_trips_per_loop']}）")
+    for method, count in result['rpc_calls_by_method'].items():
+        print(f"  {method:<28}{count:>8}")
+    print(f"\n{'阶段':<16}{'p50 ms':>10}{'p99 ms':>10}{'次数':>8}")
+    for stage, values in result['stages'].items():
+        print(f"{stage:<16}{values['p50']:>10.3f}{values['p99']:>10.3f}{values['count']:>8}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='tas.py 本地链基准测试')
+    parser.add_argument('--loops', type=int, default=20)
+    parser.add_argument('--block-time', type=float, default=0.5, help='本地链出块间隔（秒），默认0.5')
+    parser.add_argument('--sequential', action='store_true', help='逐笔确认模式（PIPELINE=false）')
+    parser.add_argument('--batch-size', type=int, default=1, help='流水线模式每批轮数（BATCH_SIZE），默认1')
+    parser.add_argument('--baseline', help='与该基准结果比较，退化时退出码为1')
+    parser.add_argument('--save-baseline', help='把本次结果保存为基准')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='允许的退化比例，默认20%%')
+    args = parser.parse_args()
+
+    result = run(args.loops, pipeline=not args.sequential, block_time=args.block_time, batch_size=args.batch_size)
+    print_report(result)
+
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as file:
+            json.dump(result, file, indent=2, ensure_ascii=False)
+        print(f"\n基准已保存: {args.save_baseline}")
+
+    regressions = []
+    if result['completed_loops'] < result['loops']:
+        regressions.append(f"只完成了 {result['completed_loops']}/{result['loops']} 次循环")
+    if args.baseline:
+        with open(args.baseline, 'r') as file:
+            baseline = json.load(file)
+        if (baseline.get('mode'), baseline.get('batch_size', 1)) != (result['mode'], result['batch_size']):
+            print(f"警告: 基准模式为 {baseline.get('mode')} (每批 {baseline.get('batch_size', 1)} 轮)，本次为 {result['mode']} (每批 {result['batch_size']} 轮)")
+        regressions = compare(result, baseline, args.tolerance)
+    if regressions:
+        print("\n❌ 性能退化:")
+        for item in regressions:
+            print(f"  - {item}")
+        sys.exit(1)
+    print("\n✅ 未发现退化")
+
+
+if __name__ == "__main__":
+    main()
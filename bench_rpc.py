@@ -0,0 +1,123 @@
+"""RPC provider 吞吐/延迟对比（本地JSON-RPC桩服务器，不连接真实节点）
+
+用法: python bench_rpc.py [请求数] [线程数] [延迟毫秒]
+
+对比 web3 默认 HTTPProvider 与 PooledHTTPProvider 在单线程和多线程下的吞吐、
+p50/p99 延迟以及服务器端新建的TCP连接数，最后演示一个节点宕机时 FailoverProvider 的自动切换。
+"""
+import sys
+import json
+import time
+import socket
+import threading
+import statistics
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from web3 import Web3
+from provider import FailoverProvider, PooledHTTPProvider
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'   # 支持 keep-alive
+    disable_nagle_algorithm = True  # 否则响应头和响应体分两次发送会触发 Nagle+延迟ACK 的40ms等待
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.connections += 1
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        if isinstance(body, list):
+            payload = [self._result(item) for item in body]
+        else:
+            payload = self._result(body)
+        data = json.dumps(payload).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _result(self, request):
+        results = {
+            'eth_blockNumber': hex(self.server.block_number),
+            'eth_chainId': '0x38',
+            'eth_gasPrice': hex(10 ** 9),
+        }
+        return {'jsonrpc': '2.0', 'id': request['id'], 'result': results.get(request['method'], '0x0')}
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_stub_server(latency=0.0, block_number=1000):
+    server = ThreadingHTTPServer(('127.0.0.1', 0), _StubHandler)
+    server.daemon_threads = True
+    server.latency = latency
+    server.block_number = block_number
+    server.connections = 0
+    server.lock = threading.Lock()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def unused_url():
+    """一个没有服务监听的地址，模拟宕机节点"""
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return f"http://127.0.0.1:{sock.getsockname()[1]}"
+
+
+def run(w3, requests, threads):
+    latencies = []
+
+    def one(_):
+        start = time.perf_counter()
+        w3.eth.block_number
+        latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    if threads == 1:
+        for i in range(requests):
+            one(i)
+    else:
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            list(pool.map(one, range(requests)))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return requests / elapsed, statistics.median(latencies), latencies[int(len(latencies) * 0.99) - 1]
+
+
+def main():
+    requests = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    threads = int(sys.argv[2]) if len(sys.argv) > 2 else 16
+    latency_ms = float(sys.argv[3]) if len(sys.argv) > 3 else 0.0
+    server, url = start_stub_server(latency=latency_ms / 1000)
+
+    print(f"{'provider':<22}{'线程':>6}{'req/s':>10}{'p50 ms':>10}{'p99 ms':>10}{'新建连接':>10}")
+    for name, make_provider in (
+        ('HTTPProvider', lambda: Web3.HTTPProvider(url)),
+        ('PooledHTTPProvider', lambda: PooledHTTPProvider(url, pool_size=threads)),
+    ):
+        for thread_count in (1, threads):
+            w3 = Web3(make_provider())
+            connections_before = server.connections
+            rps, p50, p99 = run(w3, requests, thread_count)
+            print(f"{name:<22}{thread_count:>6}{rps:>10.0f}{p50 * 1000:>10.2f}{p99 * 1000:>10.2f}"
+                  f"{server.connections - connections_before:>10}")
+
+    # 故障切换：第一个节点宕机，第二个节点正常
+    provider = FailoverProvider([unused_url(), url], health_check_interval=0, cooldown=60)
+    w3 = Web3(provider)
+    rps, p50, p99 = run(w3, 200, 1)
+    print(f"\n故障切换（1个宕机节点 + 1个正常节点）: {rps:.0f} req/s, p99 {p99 * 1000:.2f} ms")
+    for endpoint in provider.stats():
+        print(f"  {endpoint['url']:<28} 健康={endpoint['healthy']} 延迟={endpoint['latency_ms']} ms")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
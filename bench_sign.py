@@ -0,0 +1,78 @@
+"""交易构建+签名耗时对比（离线，不连接节点）
+
+用法: python bench_sign.py [次数]
+
+对比 build_transaction + w3.eth.account.sign_transaction（原始路径）与
+TxFactory 预编码模板 + 缓存私钥签名（新路径）每笔交易的耗时，并校验两者签名结果一致。
+"""
+import sys
+import json
+import time
+from eth_account import Account
+from eth_keys.backends import get_backend
+from web3 import Web3
+from tx_factory import TxFactory
+
+CHAIN_ID = 56
+TOKEN = '0x0000000000000000000000000000000000001000'
+ROUTER = '0x10ED43C718714eb63d5aA57B78B54704E256024E'
+WBNB = '0xbb4CdB9CBd36B01bD1cBaEBF2De08d9173bc095c'
+WALLET_A = '0x0000000000000000000000000000000000002000'
+AMOUNT = 100 * 10 ** 18
+GAS_PRICE = 1_000_000_000
+
+
+def old_path(w3, token_contract, router_contract, private_key, wallet_b, nonce):
+    transfer = token_contract.functions.transferFrom(WALLET_A, wallet_b, AMOUNT).build_transaction({
+        'chainId': CHAIN_ID, 'gas': 100000, 'gasPrice': GAS_PRICE, 'nonce': nonce,
+    })
+    swap = router_contract.functions.swapExactTokensForETH(AMOUNT, 12345, [TOKEN, WBNB], WALLET_A, 1700000000).build_transaction({
+        'chainId': CHAIN_ID, 'gas': 390000, 'gasPrice': GAS_PRICE, 'nonce': nonce + 1,
+    })
+    return (w3.eth.account.sign_transaction(transfer, private_key),
+            w3.eth.account.sign_transaction(swap, private_key))
+
+
+def new_path(factory, nonce):
+    return (factory.build('transfer', nonce, GAS_PRICE),
+            factory.build('swap', nonce + 1, GAS_PRICE, amount_out_min=12345, deadline=1700000000))
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    private_key = Account.create().key.hex()
+    wallet_b = Account.from_key(private_key).address
+
+    w3 = Web3()
+    with open('./tokenabi.js', 'r') as file:
+        token_contract = w3.eth.contract(address=Web3.to_checksum_address(TOKEN), abi=json.loads(file.read()))
+    with open('./swapabi.js', 'r') as file:
+        router_contract = w3.eth.contract(address=ROUTER, abi=json.loads(file.read()))
+
+    factory = TxFactory(private_key, CHAIN_ID)
+    factory.register('transfer', TOKEN, 'transferFrom(address,address,uint256)', [WALLET_A, wallet_b, AMOUNT], 100000)
+    factory.register('swap', ROUTER, 'swapExactTokensForETH(uint256,uint256,address[],address,uint256)',
+                     [AMOUNT, 0, [TOKEN, WBNB], WALLET_A, 0], 390000, variables={'amount_out_min': 1, 'deadline': 4})
+
+    # 两条路径生成的签名交易必须完全一致
+    for old, new in zip(old_path(w3, token_contract, router_contract, private_key, wallet_b, 7), new_path(factory, 7)):
+        assert old.raw_transaction == new.raw_transaction, "签名结果不一致"
+
+    results = {}
+    for name, run in (
+        ('build_transaction + sign_transaction', lambda n: old_path(w3, token_contract, router_contract, private_key, wallet_b, n)),
+        ('TxFactory', lambda n: new_path(factory, n)),
+    ):
+        start = time.perf_counter()
+        for nonce in range(iterations):
+            run(nonce * 2)
+        per_tx = (time.perf_counter() - start) / (iterations * 2)
+        results[name] = per_tx
+        print(f"{name:<40} {per_tx * 1e6:10.1f} µs/笔")
+
+    old, new = results.values()
+    print(f"加速比: {old / new:.1f}x | 签名后端: {type(get_backend()).__name__}")
+
+
+if __name__ == "__main__":
+    main()
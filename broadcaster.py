@@ -0,0 +1,185 @@
+import time
+import logging
+import threading
+import statistics
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from web3 import Web3
+from provider import PooledHTTPProvider
+from rpc import tx_hash_key
+
+# 节点已经有这笔交易（来自其他节点的广播或之前的重试），视为发送成功
+_KNOWN_TX_ERRORS = ('already known', 'known transaction', 'already exists', 'already imported')
+
+
+def is_known_tx_error(message):
+    message = message.lower()
+    return any(pattern in message for pattern in _KNOWN_TX_ERRORS)
+
+
+class BroadcastError(Exception):
+    """所有节点都拒绝了交易；errors 为 {节点: 错误信息}"""
+
+    def __init__(self, errors):
+        self.errors = errors
+        # 优先给出 nonce/gas 相关的错误，调用方据此决定重试方式
+        messages = list(errors.values())
+        for message in messages:
+            if 'nonce' in message or 'underpriced' in message:
+                super().__init__(message)
+                return
+        super().__init__(messages[0] if messages else "没有可用的广播节点")
+
+
+class _EndpointStats:
+    def __init__(self):
+        self.sent = 0
+        self.accepted = 0
+        self.failed = 0
+        self.wins = 0                           # 第一个接受交易的次数
+        self.accept_latency = deque(maxlen=200)  # 节点接受交易的耗时（秒）
+        self.inclusion_latency = deque(maxlen=200)  # 该节点首先接受的交易从广播到上链的耗时（秒）
+
+
+class Broadcaster:
+    """把同一笔已签名交易并发发送到多个节点
+
+    第一个接受（返回哈希或 already known）的节点胜出，send() 立即返回本地签名得到的哈希，
+    其余节点的请求在后台继续完成，只用于统计每个节点的接受延迟。
+    上链后调用 mark_included() 记录从广播到打包的耗时，归到首先接受的节点上。
+    传入 metrics 时同时记录 first_seen / inclusion 阶段耗时和被拒绝次数。
+    """
+
+    def __init__(self, endpoint_uris, timeout=5, pool_size=4, metrics=None):
+        self.endpoints = {
+            uri: PooledHTTPProvider(uri, pool_size=pool_size, timeout=timeout)
+            for uri in endpoint_uris
+        }
+        self._stats = {uri: _EndpointStats() for uri in endpoint_uris}
+        self._executor = ThreadPoolExecutor(max_workers=max(4, len(endpoint_uris) * 2), thread_name_prefix='broadcast')
+        self._lock = threading.Lock()
+        self._pending = {}  # 交易哈希 -> (广播时间, 首先接受的节点)
+        self.metrics = metrics
+
+    def send(self, signed_tx, timeout=None):
+        """并发广播，返回 (交易哈希, 首先接受的节点)；全部节点拒绝时抛出 BroadcastError"""
+        raw = Web3.to_hex(signed_tx.raw_transaction)
+        tx_hash = signed_tx.hash
+        start = time.perf_counter()
+        cond = threading.Condition()
+        state = {'winner': None, 'errors': {}, 'done': 0}
+
+        def submit(uri):
+            accepted, error = self._send_one(uri, raw, start)
+            with cond:
+                state['done'] += 1
+                first = accepted and state['winner'] is None
+                if first:
+                    state['winner'] = uri
+                elif not accepted:
+                    state['errors'][uri] = error
+                cond.notify_all()
+            if first and self.metrics is not None:
+                self.metrics.observe('first_seen', time.perf_counter() - start, endpoint=uri)
+
+        for uri in self.endpoints:
+            self._executor.submit(submit, uri)
+
+        with cond:
+            cond.wait_for(lambda: state['winner'] is not None or state['done'] == len(self.endpoints), timeout)
+            winner = state['winner']
+            errors = dict(state['errors'])
+
+        if winner is None:
+            raise BroadcastError(errors)
+        with self._lock:
+            self._stats[winner].wins += 1
+            self._pending[tx_hash_key(tx_hash)] = (start, winner)
+        return tx_hash, winner
+
+    def _send_one(self, uri, raw, start):
+        stats = self._stats[uri]
+        with self._lock:
+            stats.sent += 1
+        try:
+            response = self.endpoints[uri].make_request('eth_sendRawTransaction', [raw])
+            error = response.get('error')
+            message = error.get('message', str(error)) if isinstance(error, dict) else (str(error) if error else None)
+        except Exception as e:
+            message = str(e)
+        accepted = message is None or is_known_tx_error(message)
+        with self._lock:
+            if accepted:
+                stats.accepted += 1
+                stats.accept_latency.append(time.perf_counter() - start)
+            else:
+                stats.failed += 1
+        if not accepted and self.metrics is not None:
+            self.metrics.inc('broadcast_rejected', endpoint=uri)
+        return accepted, message
+
+    def mark_included(self, tx_hash):
+        """交易已上链：记录从广播到打包的耗时"""
+        with self._lock:
+            entry = self._pending.pop(tx_hash_key(tx_hash), None)
+            if entry is None:
+                return
+            start, winner = entry
+            elapsed = time.perf_counter() - start
+            self._stats[winner].inclusion_latency.append(elapsed)
+        if self.metrics is not None:
+            self.metrics.observe('inclusion', elapsed, endpoint=winner)
+
+    def known(self, tx_hashes):
+        """广播节点中仍能查到的交易哈希
+
+        私有中继或与查询节点不同的广播节点，交易可能只在它们的交易池中；
+        节点无法回答（请求失败、不支持查询）时无法排除，这些交易都算作仍在交易池中。
+        """
+        found = set()
+        calls = [('eth_getTransactionByHash', [tx_hash]) for tx_hash in tx_hashes]
+        for provider in self.endpoints.values():
+            try:
+                responses = provider.make_batch_request(calls)
+            except Exception:
+                return set(tx_hashes)
+            if not isinstance(responses, list) or len(responses) != len(calls):
+                return set(tx_hashes)
+            for tx_hash, response in zip(tx_hashes, responses):
+                if not isinstance(response, dict) or 'error' in response or response.get('result') is not None:
+                    found.add(tx_hash)
+        return found
+
+    def forget(self, tx_hashes):
+        """被替换或丢弃的交易不再统计"""
+        with self._lock:
+            for tx_hash in tx_hashes:
+                self._pending.pop(tx_hash_key(tx_hash), None)
+
+    def stats(self):
+        """每个节点的发送次数、接受率、胜出次数和接受/打包延迟中位数（毫秒）"""
+        def median_ms(values):
+            return round(statistics.median(values) * 1000, 1) if values else None
+
+        with self._lock:
+            return [{
+                'url': uri,
+                'sent': s.sent,
+                'accepted': s.accepted,
+                'failed': s.failed,
+                'wins': s.wins,
+                'accept_p50_ms': median_ms(s.accept_latency),
+                'inclusion_p50_ms': median_ms(s.inclusion_latency),
+            } for uri, s in self._stats.items()]
+
+    def log_stats(self):
+        for s in self.stats():
+            logging.info(
+                f"广播节点 {s['url']} | 接受 {s['accepted']}/{s['sent']} | 首先接受 {s['wins']} 次 | "
+                f"接受延迟 {s['accept_p50_ms']} ms | 打包延迟 {s['inclusion_p50_ms']} ms"
+            )
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+        for provider in self.endpoints.values():
+            provider.close()
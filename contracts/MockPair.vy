@@ -0,0 +1,76 @@
+# pragma version ~=0.4.0
+"""
+@title 本地基准测试用 PancakeSwap V2 交易对
+@notice 只实现 getReserves / token0 / token1 / swap / sync 和 Swap / Sync 事件，
+        手续费与 PancakeSwap V2 相同（0.25%），swap 只做恒定乘积校验
+"""
+from ethereum.ercs import IERC20
+
+event Sync:
+    reserve0: uint112
+    reserve1: uint112
+
+event Swap:
+    sender: indexed(address)
+    amount0In: uint256
+    amount1In: uint256
+    amount0Out: uint256
+    amount1Out: uint256
+    to: indexed(address)
+
+token0: public(address)
+token1: public(address)
+reserve0: uint112
+reserve1: uint112
+blockTimestampLast: uint32
+
+
+@deploy
+def __init__(_token0: address, _token1: address):
+    self.token0 = _token0
+    self.token1 = _token1
+
+
+@view
+@external
+def getReserves() -> (uint112, uint112, uint32):
+    return self.reserve0, self.reserve1, self.blockTimestampLast
+
+
+@internal
+def _update():
+    self.reserve0 = convert(staticcall IERC20(self.token0).balanceOf(self), uint112)
+    self.reserve1 = convert(staticcall IERC20(self.token1).balanceOf(self), uint112)
+    self.blockTimestampLast = convert(block.timestamp % 2 ** 32, uint32)
+    log Sync(reserve0=self.reserve0, reserve1=self.reserve1)
+
+
+@external
+def sync():
+    self._update()
+
+
+@external
+def swap(amount0Out: uint256, amount1Out: uint256, to: address, data: Bytes[32]):
+    assert amount0Out > 0 or amount1Out > 0, "Pancake: INSUFFICIENT_OUTPUT_AMOUNT"
+    reserve0: uint256 = convert(self.reserve0, uint256)
+    reserve1: uint256 = convert(self.reserve1, uint256)
+    assert amount0Out < reserve0 and amount1Out < reserve1, "Pancake: INSUFFICIENT_LIQUIDITY"
+    if amount0Out > 0:
+        extcall IERC20(self.token0).transfer(to, amount0Out)
+    if amount1Out > 0:
+        extcall IERC20(self.token1).transfer(to, amount1Out)
+    balance0: uint256 = staticcall IERC20(self.token0).balanceOf(self)
+    balance1: uint256 = staticcall IERC20(self.token1).balanceOf(self)
+    amount0In: uint256 = 0
+    amount1In: uint256 = 0
+    if balance0 > reserve0 - amount0Out:
+        amount0In = balance0 - (reserve0 - amount0Out)
+    if balance1 > reserve1 - amount1Out:
+        amount1In = balance1 - (reserve1 - amount1Out)
+    assert amount0In > 0 or amount1In > 0, "Pancake: INSUFFICIENT_INPUT_AMOUNT"
+    adjusted0: uint256 = balance0 * 10000 - amount0In * 25
+    adjusted1: uint256 = balance1 * 10000 - amount1In * 25
+    assert adjusted0 * adjusted1 >= reserve0 * reserve1 * 10000 ** 2, "Pancake: K"
+    self._update()
+    log Swap(sender=msg.sender, amount0In=amount0In, amount1In=amount1In, amount0Out=amount0Out, amount1Out=amount1Out, to=to)
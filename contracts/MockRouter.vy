@@ -0,0 +1,120 @@
+# pragma version ~=0.4.0
+"""
+@title 本地基准测试用 PancakeSwap V2 路由
+@notice swapabi.js 中 tas.py 用到的接口：factory / WETH / getAmountOut / getAmountsOut /
+        swapExactTokensForETH。路由同时充当 factory（getPair），交易对由部署脚本登记
+"""
+from ethereum.ercs import IERC20
+
+interface IPair:
+    def getReserves() -> (uint112, uint112, uint32): view
+    def token0() -> address: view
+    def swap(amount0Out: uint256, amount1Out: uint256, to: address, data: Bytes[32]): nonpayable
+
+interface IWETH:
+    def withdraw(amount: uint256): nonpayable
+
+MAX_PATH: constant(uint256) = 4
+
+WETH: public(address)
+getPair: public(HashMap[address, HashMap[address, address]])
+
+
+@deploy
+def __init__(_weth: address):
+    self.WETH = _weth
+
+
+@payable
+@external
+def __default__():
+    pass
+
+
+@view
+@external
+def factory() -> address:
+    return self
+
+
+@external
+def setPair(tokenA: address, tokenB: address, pair: address):
+    self.getPair[tokenA][tokenB] = pair
+    self.getPair[tokenB][tokenA] = pair
+
+
+@pure
+@internal
+def _get_amount_out(amount_in: uint256, reserve_in: uint256, reserve_out: uint256) -> uint256:
+    assert amount_in > 0, "PancakeLibrary: INSUFFICIENT_INPUT_AMOUNT"
+    assert reserve_in > 0 and reserve_out > 0, "PancakeLibrary: INSUFFICIENT_LIQUIDITY"
+    amount_in_with_fee: uint256 = amount_in * 9975
+    return amount_in_with_fee * reserve_out // (reserve_in * 10000 + amount_in_with_fee)
+
+
+@view
+@internal
+def _reserves(token_in: address, token_out: address) -> (address, uint256, uint256):
+    pair: address = self.getPair[token_in][token_out]
+    assert pair != empty(address), "PancakeLibrary: PAIR_NOT_FOUND"
+    reserve0: uint112 = 0
+    reserve1: uint112 = 0
+    timestamp: uint32 = 0
+    reserve0, reserve1, timestamp = staticcall IPair(pair).getReserves()
+    if staticcall IPair(pair).token0() == token_in:
+        return pair, convert(reserve0, uint256), convert(reserve1, uint256)
+    return pair, convert(reserve1, uint256), convert(reserve0, uint256)
+
+
+@view
+@internal
+def _get_amounts_out(amount_in: uint256, path: DynArray[address, MAX_PATH]) -> DynArray[uint256, MAX_PATH]:
+    assert len(path) >= 2, "PancakeLibrary: INVALID_PATH"
+    amounts: DynArray[uint256, MAX_PATH] = [amount_in]
+    for i: uint256 in range(MAX_PATH - 1):
+        if i + 1 >= len(path):
+            break
+        pair: address = empty(address)
+        reserve_in: uint256 = 0
+        reserve_out: uint256 = 0
+        pair, reserve_in, reserve_out = self._reserves(path[i], path[i + 1])
+        amounts.append(self._get_amount_out(amounts[i], reserve_in, reserve_out))
+    return amounts
+
+
+@pure
+@external
+def getAmountOut(amountIn: uint256, reserveIn: uint256, reserveOut: uint256) -> uint256:
+    return self._get_amount_out(amountIn, reserveIn, reserveOut)
+
+
+@view
+@external
+def getAmountsOut(amountIn: uint256, path: DynArray[address, MAX_PATH]) -> DynArray[uint256, MAX_PATH]:
+    return self._get_amounts_out(amountIn, path)
+
+
+@external
+def swapExactTokensForETH(amountIn: uint256, amountOutMin: uint256, path: DynArray[address, MAX_PATH],
+                          to: address, deadline: uint256) -> DynArray[uint256, MAX_PATH]:
+    assert deadline >= block.timestamp, "PancakeRouter: EXPIRED"
+    assert path[len(path) - 1] == self.WETH, "PancakeRouter: INVALID_PATH"
+    amounts: DynArray[uint256, MAX_PATH] = self._get_amounts_out(amountIn, path)
+    assert amounts[len(amounts) - 1] >= amountOutMin, "PancakeRouter: INSUFFICIENT_OUTPUT_AMOUNT"
+    extcall IERC20(path[0]).transferFrom(msg.sender, self.getPair[path[0]][path[1]], amountIn)
+    for i: uint256 in range(MAX_PATH - 1):
+        if i + 1 >= len(path):
+            break
+        pair: address = self.getPair[path[i]][path[i + 1]]
+        receiver: address = self
+        if i + 2 < len(path):
+            receiver = self.getPair[path[i + 1]][path[i + 2]]
+        amount_out: uint256 = amounts[i + 1]
+        if staticcall IPair(pair).token0() == path[i]:
+            extcall IPair(pair).swap(0, amount_out, receiver, b"")
+        else:
+            extcall IPair(pair).swap(amount_out, 0, receiver, b"")
+    amount_eth: uint256 = amounts[len(amounts) - 1]
+    extcall IWETH(self.WETH).withdraw(amount_eth)
+    send(to, amount_eth)
+    return amounts
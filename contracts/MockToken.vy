@@ -0,0 +1,82 @@
+# pragma version ~=0.4.0
+"""
+@title 本地基准测试用ERC20
+@notice tokenabi.js 中 tas.py 用到的接口（approve / allowance / balanceOf / transfer / transferFrom / mint），
+        同时带 WETH 式的 deposit / withdraw，用作 WBNB
+"""
+
+event Transfer:
+    sender: indexed(address)
+    receiver: indexed(address)
+    value: uint256
+
+event Approval:
+    owner: indexed(address)
+    spender: indexed(address)
+    value: uint256
+
+name: public(String[32])
+symbol: public(String[8])
+decimals: public(uint8)
+totalSupply: public(uint256)
+balanceOf: public(HashMap[address, uint256])
+allowance: public(HashMap[address, HashMap[address, uint256]])
+
+
+@deploy
+def __init__(_name: String[32], _symbol: String[8]):
+    self.name = _name
+    self.symbol = _symbol
+    self.decimals = 18
+
+
+@internal
+def _transfer(sender: address, receiver: address, amount: uint256):
+    self.balanceOf[sender] -= amount
+    self.balanceOf[receiver] += amount
+    log Transfer(sender=sender, receiver=receiver, value=amount)
+
+
+@external
+def transfer(receiver: address, amount: uint256) -> bool:
+    self._transfer(msg.sender, receiver, amount)
+    return True
+
+
+@external
+def transferFrom(sender: address, receiver: address, amount: uint256) -> bool:
+    allowed: uint256 = self.allowance[sender][msg.sender]
+    if allowed != max_value(uint256):
+        self.allowance[sender][msg.sender] = allowed - amount
+    self._transfer(sender, receiver, amount)
+    return True
+
+
+@external
+def approve(spender: address, amount: uint256) -> bool:
+    self.allowance[msg.sender][spender] = amount
+    log Approval(owner=msg.sender, spender=spender, value=amount)
+    return True
+
+
+@external
+def mint(receiver: address, amount: uint256):
+    self.totalSupply += amount
+    self.balanceOf[receiver] += amount
+    log Transfer(sender=empty(address), receiver=receiver, value=amount)
+
+
+@external
+@payable
+def deposit():
+    self.totalSupply += msg.value
+    self.balanceOf[msg.sender] += msg.value
+    log Transfer(sender=empty(address), receiver=msg.sender, value=msg.value)
+
+
+@external
+def withdraw(amount: uint256):
+    self.balanceOf[msg.sender] -= amount
+    self.totalSupply -= amount
+    log Transfer(sender=msg.sender, receiver=empty(address), value=amount)
+    send(msg.sender, amount)
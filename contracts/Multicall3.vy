@@ -0,0 +1,41 @@
+# pragma version ~=0.4.0
+"""
+@title 本地基准测试用 Multicall3
+@notice 只实现 snapshot.py 用到的 aggregate3 / getEthBalance / getBlockNumber
+"""
+
+struct Call3:
+    target: address
+    allowFailure: bool
+    callData: Bytes[1024]
+
+struct Result:
+    success: bool
+    returnData: Bytes[1024]
+
+MAX_CALLS: constant(uint256) = 64
+
+
+@payable
+@external
+def aggregate3(calls: DynArray[Call3, MAX_CALLS]) -> DynArray[Result, MAX_CALLS]:
+    results: DynArray[Result, MAX_CALLS] = []
+    for call: Call3 in calls:
+        success: bool = False
+        data: Bytes[1024] = b""
+        success, data = raw_call(call.target, call.callData, max_outsize=1024, revert_on_failure=False)
+        assert success or call.allowFailure, "Multicall3: call failed"
+        results.append(Result(success=success, returnData=data))
+    return results
+
+
+@view
+@external
+def getEthBalance(addr: address) -> uint256:
+    return addr.balance
+
+
+@view
+@external
+def getBlockNumber() -> uint256:
+    return block.number
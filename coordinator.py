@@ -0,0 +1,92 @@
+import logging
+import threading
+from multiprocessing.managers import BaseManager
+from web3 import Web3
+from nonce_manager import NonceManager
+
+# nonce分配器通过代理对外暴露的方法
+NONCE_METHODS = ('peek', 'in_flight', 'allocate', 'confirm', 'release', 'resync', 'refill_gaps')
+COORDINATOR_METHODS = ('nonce_manager', 'fees', 'latest_block', 'block_time')
+
+
+class Coordinator:
+    """多进程/多机共享的状态：每个钱包一个nonce分配器、gas费用缓存和区块高度
+
+    所有工作进程通过本地socket（multiprocessing.managers）调用同一个对象，
+    nonce只在这里分配（进程重启后接着使用同一个分配器）；gas费用和区块高度也只由这里查询节点。
+    这里只共享nonce：授权额度、余额账本和交易日志在各进程本地，每个钱包只应由一个进程使用。
+    """
+
+    def __init__(self, w3, notifier, gas_oracle):
+        self.w3 = w3
+        self.notifier = notifier
+        self.gas_oracle = gas_oracle
+        self._lock = threading.Lock()
+        self._nonce_managers = {}  # 钱包地址 -> NonceManager
+        # 每个新区块预取一次gas费用，同时让通知器保持按出块间隔轮询
+        notifier.add_listener(lambda block_number: self._prefetch_fees())
+
+    def nonce_manager(self, address):
+        """钱包的nonce分配器（工作进程拿到的是代理）"""
+        address = Web3.to_checksum_address(address)
+        with self._lock:
+            manager = self._nonce_managers.get(address)
+            if manager is None:
+                manager = self._nonce_managers[address] = NonceManager(self.w3, address)
+            return manager
+
+    def fees(self):
+        return self.gas_oracle.fees()
+
+    def latest_block(self):
+        return self.notifier.current_block()
+
+    def block_time(self):
+        return self.notifier.block_time
+
+    def _prefetch_fees(self):
+        try:
+            self.gas_oracle.fees()
+        except Exception as e:
+            logging.warning(f"预取gas费用失败: {str(e)[:50]}")
+
+
+class CoordinatorManager(BaseManager):
+    pass
+
+
+CoordinatorManager.register('NonceManager', exposed=NONCE_METHODS, create_method=False)
+
+
+class CoordinatorStrategy:
+    """gas策略：从协调器取当前区块的费用，替代每个进程各自查询节点"""
+
+    def __init__(self, coordinator):
+        self.coordinator = coordinator
+
+    def fetch(self, w3):
+        return self.coordinator.fees()
+
+
+def parse_address(address):
+    """'host:port' -> (host, port)"""
+    host, _, port = address.rpartition(':')
+    return host or '127.0.0.1', int(port)
+
+
+def serve(coordinator, address, authkey):
+    """在后台线程中启动协调器服务，返回实际监听地址 (host, port)（端口为0时自动分配）"""
+    manager = CoordinatorManager(address=address, authkey=authkey.encode())
+    manager.register('coordinator', callable=lambda: coordinator, exposed=COORDINATOR_METHODS,
+                     method_to_typeid={'nonce_manager': 'NonceManager'})
+    server = manager.get_server()
+    threading.Thread(target=server.serve_forever, name='coordinator', daemon=True).start()
+    return server.address
+
+
+def connect(address, authkey):
+    """连接协调器，返回代理对象；nonce_manager(address) 返回的分配器也是代理"""
+    manager = CoordinatorManager(address=parse_address(address), authkey=authkey.encode())
+    manager.register('coordinator', exposed=COORDINATOR_METHODS, method_to_typeid={'nonce_manager': 'NonceManager'})
+    manager.connect()
+    return manager.coordinator()
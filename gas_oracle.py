@@ -0,0 +1,186 @@
+import time
+import logging
+import threading
+from rpc import to_int
+from notifier import DEFAULT_BLOCK_TIME
+
+GWEI = 10 ** 9
+
+# 节点接受替换交易要求的最低加价比例（geth 默认10%），留一点余量
+MIN_REPLACEMENT_BUMP = 1.125
+
+
+class FeeCeilingReached(Exception):
+    """提价替换需要的费用超过了配置的上限"""
+
+
+def scale_fees(fees, factor):
+    """按比例调整费用（legacy 与 EIP-1559 通用）"""
+    return {key: int(value * factor) for key, value in fees.items()}
+
+
+def fee_cap(fees):
+    """单位gas最多支付的费用，用于估算交易成本"""
+    return fees.get('maxFeePerGas', fees.get('gasPrice', 0))
+
+
+class LegacyStrategy:
+    """eth_gasPrice 乘以系数"""
+
+    def __init__(self, multiplier=1.0):
+        self.multiplier = multiplier
+
+    def fetch(self, w3):
+        return {'gasPrice': int(w3.eth.gas_price * self.multiplier)}
+
+
+class FeeHistoryStrategy:
+    """EIP-1559：按最近若干区块 eth_feeHistory 的小费百分位计算 maxPriorityFeePerGas，
+    maxFeePerGas = 2 × 下一区块baseFee + 小费"""
+
+    def __init__(self, percentile=50, block_count=10, min_priority_fee=0):
+        self.percentile = percentile
+        self.block_count = block_count
+        self.min_priority_fee = min_priority_fee
+
+    def fetch(self, w3):
+        history = w3.eth.fee_history(self.block_count, 'latest', [self.percentile])
+        rewards = sorted(to_int(r[0]) for r in history.get('reward', []) if r)
+        priority_fee = rewards[len(rewards) // 2] if rewards else 0
+        priority_fee = max(priority_fee, self.min_priority_fee)
+        next_base_fee = to_int(history['baseFeePerGas'][-1])
+        return {
+            'maxPriorityFeePerGas': priority_fee,
+            'maxFeePerGas': 2 * next_base_fee + priority_fee,
+        }
+
+
+class FixedStrategy:
+    """固定gas价格"""
+
+    def __init__(self, gas_price):
+        self.gas_price = gas_price
+
+    def fetch(self, w3):
+        return {'gasPrice': self.gas_price}
+
+
+class ClampStrategy:
+    """给其他策略的结果加上下限和上限"""
+
+    def __init__(self, inner, floor=None, ceiling=None):
+        self.inner = inner
+        self.floor = floor
+        self.ceiling = ceiling
+
+    def _clamp(self, value):
+        if self.floor is not None:
+            value = max(value, self.floor)
+        if self.ceiling is not None:
+            value = min(value, self.ceiling)
+        return value
+
+    def fetch(self, w3):
+        fees = self.inner.fetch(w3)
+        # 上下限作用于 gasPrice / maxFeePerGas，小费不超过 maxFeePerGas
+        clamped = {key: self._clamp(value) if key != 'maxPriorityFeePerGas' else value
+                   for key, value in fees.items()}
+        if 'maxPriorityFeePerGas' in clamped:
+            clamped['maxPriorityFeePerGas'] = min(clamped['maxPriorityFeePerGas'], clamped['maxFeePerGas'])
+        return clamped
+
+
+def strategy_from_config(name, multiplier=1.0, percentile=50, fixed_gwei=None, floor_gwei=None, ceiling_gwei=None):
+    """根据配置名称创建策略：legacy / eip1559 / fixed，可选上下限（单位gwei）"""
+    if name == 'eip1559':
+        strategy = FeeHistoryStrategy(percentile=percentile)
+    elif name == 'fixed':
+        if fixed_gwei is None:
+            raise ValueError("fixed 策略需要设置固定gas价格")
+        strategy = FixedStrategy(int(fixed_gwei * GWEI))
+    elif name == 'legacy':
+        strategy = LegacyStrategy(multiplier)
+    else:
+        raise ValueError(f"未知的gas策略: {name}")
+    if floor_gwei is not None or ceiling_gwei is not None:
+        strategy = ClampStrategy(
+            strategy,
+            floor=int(floor_gwei * GWEI) if floor_gwei is not None else None,
+            ceiling=int(ceiling_gwei * GWEI) if ceiling_gwei is not None else None,
+        )
+    return strategy
+
+
+class GasOracle:
+    """gas费用预言机
+
+    每个区块只向节点查询一次费用，之后同一区块内的交易直接使用缓存。
+    区块号取自 BlockNotifier；通知器未运行时按出块间隔判断缓存是否过期。
+    ceiling 为 gasPrice / maxFeePerGas 的上限（wei），提价替换也不会超过；未给出时沿用 ClampStrategy 的上限。
+    """
+
+    def __init__(self, w3, strategy=None, notifier=None, max_age=DEFAULT_BLOCK_TIME, ceiling=None):
+        self.w3 = w3
+        self.strategy = strategy or LegacyStrategy()
+        self.notifier = notifier
+        self.max_age = max_age
+        self.ceiling = ceiling if ceiling is not None else getattr(self.strategy, 'ceiling', None)
+        self._lock = threading.Lock()
+        self._fees = None
+        self._fees_block = None
+        self._fetched_at = 0
+
+    def _current_block(self):
+        return self.notifier.latest_block if self.notifier is not None else None
+
+    def fees(self):
+        """当前区块的交易费用字段：{'gasPrice'} 或 {'maxFeePerGas', 'maxPriorityFeePerGas'}"""
+        with self._lock:
+            block = self._current_block()
+            fresh = (self._fees is not None
+                     and block == self._fees_block
+                     and time.time() - self._fetched_at < self.max_age)
+            if not fresh:
+                self._fees = self.strategy.fetch(self.w3)
+                self._fees_block = block
+                self._fetched_at = time.time()
+            return dict(self._fees)
+
+    def invalidate(self):
+        with self._lock:
+            self._fees = None
+
+    def bump(self, old_fees, factor=MIN_REPLACEMENT_BUMP):
+        """替换交易（相同nonce）使用的费用：不低于旧费用×factor，也不低于当前市场费用，但不超过上限
+
+        上限使费用达不到节点接受替换要求的 旧费用×factor 时抛出 FeeCeilingReached。
+        """
+        self.invalidate()
+        current = self.fees()
+        required = {key: int(value * factor) + 1 for key, value in old_fees.items()}
+        bumped = dict(required)
+        if set(current) == set(bumped):
+            bumped = {key: max(bumped[key], current[key]) for key in bumped}
+        if self.ceiling is not None:
+            bumped = {key: min(value, self.ceiling) if key != 'maxPriorityFeePerGas' else value
+                      for key, value in bumped.items()}
+            if 'maxPriorityFeePerGas' in bumped:
+                bumped['maxPriorityFeePerGas'] = min(bumped['maxPriorityFeePerGas'], bumped['maxFeePerGas'])
+            if any(bumped[key] < required[key] for key in bumped):
+                raise FeeCeilingReached(f"gas费用已达上限 {self.ceiling / GWEI:.2f} gwei，无法再提价替换 | 当前 {self.describe(old_fees)}")
+        logging.info(f"提高gas费用 | {self.describe(old_fees)} → {self.describe(bumped)}")
+        return bumped
+
+    def replace(self, resign, old_fees, factor=MIN_REPLACEMENT_BUMP):
+        """Replace-by-fee：用提高后的费用重新签名同一nonce的交易
+
+        resign(fees) 返回新的签名交易。返回 (签名交易, 新费用)；费用已达上限时抛出 FeeCeilingReached。
+        """
+        new_fees = self.bump(old_fees, factor)
+        return resign(new_fees), new_fees
+
+    @staticmethod
+    def describe(fees):
+        if 'maxFeePerGas' in fees:
+            return f"max {fees['maxFeePerGas'] / GWEI:.2f} / tip {fees['maxPriorityFeePerGas'] / GWEI:.2f} gwei"
+        return f"{fees['gasPrice'] / GWEI:.2f} gwei"
@@ -0,0 +1,353 @@
+"""事件日志索引器：增量抓取机器人相关的 Transfer / Swap / Sync 事件，存入本地SQLite并统计每次循环的盈亏
+
+用法: python indexer.py [--db 文件] [--from-block N] [--to-block N] [--report]
+
+从 .env 读取 TOKEN_ADDRESS、WALLET_A_ADDRESS、PRIVATE_KEY（钱包B）、PANCAKESWAP_ROUTER_ADDRESS 和 WBNB_ADDRESS。
+每个区间用一次批量请求发三个 eth_getLogs（按topic过滤）：钱包A→钱包B 的代币转账、钱包B→交易对 的代币转账
+（即swap卖出），以及交易对的 Swap/Sync 事件；区间大小按节点报错和返回的日志数量自适应调整。
+索引进度保存在数据库中，下次运行从上次结束的区块继续，不会从头扫描。
+"""
+import os
+import sys
+import time
+import sqlite3
+import logging
+import argparse
+import threading
+from dotenv import load_dotenv
+from eth_account import Account
+from web3 import Web3
+from ledger import TRANSFER_TOPIC
+from quoter import SYNC_TOPIC, PairQuoter, get_amount_out
+from rpc import TRANSPORT_ERROR, batch_request, batch_responses, to_int
+from snapshot import MULTICALL3_ADDRESS, StateReader
+
+# Swap(address indexed sender, uint amount0In, uint amount1In, uint amount0Out, uint amount1Out, address indexed to)
+SWAP_TOPIC = Web3.keccak(text='Swap(address,uint256,uint256,uint256,uint256,address)')
+
+_TRANSFER_TOPIC_HEX = Web3.to_hex(TRANSFER_TOPIC)
+_SWAP_TOPIC_HEX = Web3.to_hex(SWAP_TOPIC)
+_SYNC_TOPIC_HEX = Web3.to_hex(SYNC_TOPIC)
+
+# 代币数量和储备量超出SQLite整数范围，以十进制文本保存
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS transfers (
+    block     INTEGER NOT NULL,
+    log_index INTEGER NOT NULL,
+    tx_hash   TEXT NOT NULL,
+    kind      TEXT NOT NULL,
+    value     TEXT NOT NULL,
+    PRIMARY KEY (block, log_index)
+);
+CREATE TABLE IF NOT EXISTS swaps (
+    block      INTEGER NOT NULL,
+    log_index  INTEGER NOT NULL,
+    tx_hash    TEXT NOT NULL,
+    amount_in  TEXT NOT NULL,
+    amount_out TEXT NOT NULL,
+    PRIMARY KEY (block, log_index)
+);
+CREATE TABLE IF NOT EXISTS reserves (
+    block       INTEGER PRIMARY KEY,
+    reserve_in  TEXT NOT NULL,
+    reserve_out TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS fees (
+    tx_hash TEXT PRIMARY KEY,
+    block   INTEGER NOT NULL,
+    fee     TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS state (
+    key   TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+# 转账类型
+FUNDING = 'funding'  # 钱包A → 钱包B（transferFrom）
+SELL = 'sell'        # 钱包B → 交易对（swap卖出的代币）
+
+
+def _topic_address(address):
+    return '0x' + '0' * 24 + Web3.to_checksum_address(address)[2:].lower()
+
+
+def _words(data):
+    """日志data按32字节切分为整数（只有静态类型参数时比ABI解码快得多）"""
+    data = data[2:] if data.startswith('0x') else data
+    return [int(data[i:i + 64], 16) for i in range(0, len(data), 64)]
+
+
+class LogStore:
+    """索引结果（SQLite WAL）
+
+    转账和swap按 (区块, 日志序号) 去重，重复索引同一区间不会产生重复记录；
+    储备量只保留每个区块最后一个 Sync（区块结束时的储备量），用于计算下一个区块里swap的预期输出。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.executescript(_SCHEMA)
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            row = self._conn.execute('SELECT value FROM state WHERE key = ?', (key,)).fetchone()
+        return row[0] if row else default
+
+    def bind(self, owner):
+        """绑定代币/钱包/交易对；与上次不一致时清空旧数据"""
+        previous = self.get('owner')
+        with self._lock, self._conn:
+            if previous is not None and previous != owner:
+                logging.warning("索引数据属于其他代币或钱包，已清空")
+                for table in ('transfers', 'swaps', 'reserves', 'fees', 'state'):
+                    self._conn.execute(f'DELETE FROM {table}')
+            self._conn.execute('INSERT OR REPLACE INTO state (key, value) VALUES (?, ?)', ('owner', owner))
+
+    @property
+    def last_block(self):
+        value = self.get('last_block')
+        return int(value) if value is not None else None
+
+    def save(self, to_block, transfers, swaps, reserves, fees):
+        """一个区间的结果和索引进度在同一事务中写入"""
+        with self._lock, self._conn:
+            self._conn.executemany('INSERT OR IGNORE INTO transfers VALUES (?, ?, ?, ?, ?)', transfers)
+            self._conn.executemany('INSERT OR IGNORE INTO swaps VALUES (?, ?, ?, ?, ?)', swaps)
+            self._conn.executemany('INSERT OR REPLACE INTO reserves VALUES (?, ?, ?)', reserves)
+            self._conn.executemany('INSERT OR IGNORE INTO fees VALUES (?, ?, ?)', fees)
+            self._conn.execute('INSERT OR REPLACE INTO state (key, value) VALUES (?, ?)', ('last_block', str(to_block)))
+
+    def events(self):
+        """按链上顺序返回所有转账和swap: (区块, 日志序号, 类型, 交易哈希, 数值...)"""
+        with self._lock:
+            transfers = self._conn.execute('SELECT block, log_index, kind, tx_hash, value FROM transfers').fetchall()
+            swaps = self._conn.execute("SELECT block, log_index, 'swap', tx_hash, amount_in, amount_out FROM swaps").fetchall()
+        return sorted(transfers + swaps)
+
+    def reserves_before(self, block):
+        """block 之前最近一个区块结束时的 (reserve_in, reserve_out)"""
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT reserve_in, reserve_out FROM reserves WHERE block < ? ORDER BY block DESC LIMIT 1', (block,),
+            ).fetchone()
+        return (int(row[0]), int(row[1])) if row else None
+
+    def fees(self):
+        """{交易哈希: gas费用}"""
+        with self._lock:
+            rows = self._conn.execute('SELECT tx_hash, fee FROM fees').fetchall()
+        return {tx_hash: int(fee) for tx_hash, fee in rows}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class LogIndexer:
+    """分段抓取 eth_getLogs
+
+    每段的三个查询合并为一次批量请求；节点报错（结果过多、区间过大、超时）时区间减半重试，
+    返回的日志少于 target_logs 时下一段区间加倍，最大 max_range 个区块。
+    只索引到最新区块之前 confirmations 个区块，避免链重组造成的脏数据。
+    """
+
+    def __init__(self, w3, store, token, pair, token_is_token0, wallet_a, wallet_b,
+                 initial_range=2000, max_range=50000, target_logs=5000, confirmations=3):
+        self.w3 = w3
+        self.store = store
+        self.token = Web3.to_checksum_address(token)
+        self.pair = Web3.to_checksum_address(pair)
+        self.token_is_token0 = token_is_token0
+        self.wallet_a = _topic_address(wallet_a)
+        self.wallet_b = _topic_address(wallet_b)
+        self.pair_topic = _topic_address(pair)
+        self.range = initial_range
+        self.max_range = max_range
+        self.target_logs = target_logs
+        self.confirmations = confirmations
+
+    def _filters(self, from_block, to_block):
+        blocks = {'fromBlock': hex(from_block), 'toBlock': hex(to_block)}
+        return [
+            ('eth_getLogs', [{**blocks, 'address': self.token, 'topics': [_TRANSFER_TOPIC_HEX, self.wallet_a, self.wallet_b]}]),
+            ('eth_getLogs', [{**blocks, 'address': self.token, 'topics': [_TRANSFER_TOPIC_HEX, self.wallet_b, self.pair_topic]}]),
+            ('eth_getLogs', [{**blocks, 'address': self.pair, 'topics': [[_SWAP_TOPIC_HEX, _SYNC_TOPIC_HEX]]}]),
+        ]
+
+    def run(self, from_block=None, to_block=None):
+        """从上次进度（或 from_block）索引到 to_block（默认最新区块 - confirmations），返回索引的区块数"""
+        if to_block is None:
+            to_block = self.w3.eth.block_number - self.confirmations
+        last_block = self.store.last_block
+        start = last_block + 1 if last_block is not None else from_block
+        if start is None:
+            raise ValueError("首次索引需要指定起始区块")
+        first = start
+        started_at = time.perf_counter()
+        while start <= to_block:
+            end = min(start + self.range - 1, to_block)
+            responses = batch_responses(self.w3, self._filters(start, end))
+            error = next((resp['error'] for resp in responses if resp.get('error')), None)
+            if error is not None or any(resp.get('result') is None for resp in responses):
+                if self.range == 1:
+                    transport = next((resp[TRANSPORT_ERROR] for resp in responses if TRANSPORT_ERROR in resp), None)
+                    message = error.get('message') if error else transport or '无结果'
+                    raise RuntimeError(f"eth_getLogs 失败 (区块 {start}): {message}")
+                self.range = max(1, self.range // 2)
+                logging.debug(f"eth_getLogs 区间过大，缩小为 {self.range} 个区块")
+                continue
+            count = self._save(end, *[resp['result'] for resp in responses])
+            if count < self.target_logs // 2:
+                self.range = min(self.max_range, self.range * 2)
+            logging.info(f"已索引区块 {start}-{end} | 日志: {count} | 下一段区间: {self.range}")
+            start = end + 1
+        indexed = max(0, to_block - first + 1)
+        if indexed:
+            elapsed = time.perf_counter() - started_at
+            logging.info(f"索引完成 {indexed} 个区块，耗时 {elapsed:.2f} 秒")
+        return indexed
+
+    def _save(self, to_block, funding_logs, sell_logs, pair_logs):
+        transfers = []
+        for kind, logs in ((FUNDING, funding_logs), (SELL, sell_logs)):
+            for log in logs:
+                if log.get('removed'):
+                    continue
+                transfers.append((to_int(log['blockNumber']), to_int(log['logIndex']), log['transactionHash'].lower(),
+                                  kind, str(int(log['data'], 16))))
+        # 只保留自己交易里的 Swap（同一交易中有钱包B→交易对的转账）
+        sell_txs = {row[2] for row in transfers if row[3] == SELL}
+        swaps = []
+        reserves = {}
+        for log in pair_logs:
+            if log.get('removed'):
+                continue
+            topic = log['topics'][0].lower()
+            block = to_int(log['blockNumber'])
+            if topic == _SYNC_TOPIC_HEX:
+                reserve0, reserve1 = _words(log['data'])
+                log_index = to_int(log['logIndex'])
+                if block not in reserves or reserves[block][0] < log_index:
+                    in_out = (reserve0, reserve1) if self.token_is_token0 else (reserve1, reserve0)
+                    reserves[block] = (log_index, in_out)
+            elif topic == _SWAP_TOPIC_HEX and log['transactionHash'].lower() in sell_txs:
+                amount0_in, amount1_in, amount0_out, amount1_out = _words(log['data'])
+                amount_in, amount_out = (amount0_in, amount1_out) if self.token_is_token0 else (amount1_in, amount0_out)
+                swaps.append((block, to_int(log['logIndex']), log['transactionHash'].lower(), str(amount_in), str(amount_out)))
+        # 自己交易的gas费用：一次批量查询回执
+        tx_hashes = sorted({row[2] for row in transfers})
+        receipts = batch_request(self.w3, [('eth_getTransactionReceipt', [h]) for h in tx_hashes])
+        fees = []
+        for tx_hash, receipt in zip(tx_hashes, receipts):
+            if receipt is not None:
+                fee = to_int(receipt['gasUsed']) * to_int(receipt.get('effectiveGasPrice') or '0x0')
+                fees.append((tx_hash, to_int(receipt['blockNumber']), str(fee)))
+        self.store.save(
+            to_block, transfers, swaps,
+            [(block, str(in_out[0]), str(in_out[1])) for block, (_, in_out) in reserves.items()],
+            fees,
+        )
+        return len(funding_logs) + len(sell_logs) + len(pair_logs)
+
+
+def loop_report(store, slippage=None):
+    """按链上顺序把每笔swap与它之前最近一笔未配对的 钱包A→钱包B 转账配成一次循环（swap失败时转账没有配对）
+
+    返回每次循环的 dict: 区块、转入代币、卖出代币、换得BNB、按上一区块储备量的预期BNB、实际滑点（%）、
+    两笔交易的gas费用和净收入（换得BNB - gas费用）。slippage 为设置的滑点（%），实际滑点超过时 over_slippage 为True。
+    """
+    funding = []
+    loops = []
+    fees = store.fees()
+    for event in store.events():
+        block, _, kind, tx_hash = event[:4]
+        if kind == FUNDING:
+            funding.append((tx_hash, int(event[4])))
+            continue
+        if kind != 'swap':
+            continue
+        amount_in, amount_out = int(event[4]), int(event[5])
+        funding_tx, funded = funding.pop() if funding else (None, 0)
+        reserves = store.reserves_before(block)
+        expected = get_amount_out(amount_in, *reserves) if reserves else None
+        realized = (expected - amount_out) / expected * 100 if expected else None
+        fee = fees.get(tx_hash, 0) + fees.get(funding_tx, 0)
+        loops.append({
+            'block': block,
+            'funding_tx': funding_tx,
+            'swap_tx': tx_hash,
+            'funded': funded,
+            'sold': amount_in,
+            'bnb_out': amount_out,
+            'expected': expected,
+            'slippage': realized,
+            'over_slippage': realized is not None and slippage is not None and realized > slippage,
+            'fee': fee,
+            'net': amount_out - fee,
+        })
+    return loops
+
+
+def _format_units(value, decimals=18):
+    return f"{value / 10 ** decimals:.6f}" if value is not None else '-'
+
+
+def main():
+    parser = argparse.ArgumentParser(description='增量索引 Transfer/Swap/Sync 事件并统计每次循环的盈亏')
+    parser.add_argument('--db', default=os.getenv('INDEX_FILE', 'tas_index.db'), help='索引数据库文件')
+    parser.add_argument('--from-block', type=int, help='首次索引的起始区块（默认最新区块往前 28800 个，约一天）')
+    parser.add_argument('--to-block', type=int, help='索引到的区块（默认最新区块 - 确认数）')
+    parser.add_argument('--report', action='store_true', help='输出每次循环的明细')
+    args = parser.parse_args()
+
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s | %(message)s', datefmt='%H:%M:%S')
+
+    w3 = Web3(Web3.HTTPProvider(os.getenv('RPC_URL', 'https://bsc-dataseed.binance.org/')))
+    token = Web3.to_checksum_address(os.environ['TOKEN_ADDRESS'])
+    wbnb = Web3.to_checksum_address(os.getenv('WBNB_ADDRESS', '0xbb4CdB9CBd36B01bD1cBaEBF2De08d9173bc095c'))
+    router = os.getenv('PANCAKESWAP_ROUTER_ADDRESS', '0x10ED43C718714eb63d5aA57B78B54704E256024E')
+    wallet_a = os.environ['WALLET_A_ADDRESS']
+    wallet_b = Account.from_key(os.environ['PRIVATE_KEY']).address
+    decimals = int(os.getenv('TOKEN_DECIMALS', '18'))
+    slippage = float(os.getenv('SLIPPAGE', '0.1'))
+
+    quoter = PairQuoter(w3, router, StateReader(w3, os.getenv('MULTICALL3_ADDRESS', MULTICALL3_ADDRESS)))
+    pair = quoter.pair_for(token, wbnb)
+    store = LogStore(args.db)
+    store.bind(','.join([token, pair, Web3.to_checksum_address(wallet_a), wallet_b]))
+    indexer = LogIndexer(w3, store, token, pair, PairQuoter.sort_tokens(token, wbnb)[0] == token, wallet_a, wallet_b)
+    from_block = args.from_block
+    if from_block is None and store.last_block is None:
+        from_block = max(0, w3.eth.block_number - 28800)
+    indexer.run(from_block, args.to_block)
+
+    loops = loop_report(store, slippage)
+    if args.report:
+        for number, loop in enumerate(loops, 1):
+            slip = f"{loop['slippage']:.4f}%" if loop['slippage'] is not None else '-'
+            logging.info(f"循环 {number} | 区块: {loop['block']} | 卖出: {_format_units(loop['sold'], decimals)} | "
+                         f"BNB: {_format_units(loop['bnb_out'])} | 滑点: {slip}{' ⚠️' if loop['over_slippage'] else ''} | "
+                         f"gas: {_format_units(loop['fee'])} | 净收入: {_format_units(loop['net'])}")
+    if not loops:
+        logging.info("没有找到已完成的循环")
+        return 0
+    slippages = [loop['slippage'] for loop in loops if loop['slippage'] is not None]
+    logging.info(f"循环数: {len(loops)} | 转入代币: {_format_units(sum(loop['funded'] for loop in loops), decimals)} | "
+                 f"卖出代币: {_format_units(sum(loop['sold'] for loop in loops), decimals)}")
+    logging.info(f"返还钱包A的BNB: {_format_units(sum(loop['bnb_out'] for loop in loops))} | "
+                 f"gas费用: {_format_units(sum(loop['fee'] for loop in loops))} | "
+                 f"净收入: {_format_units(sum(loop['net'] for loop in loops))}")
+    if slippages:
+        logging.info(f"实际滑点 | 平均: {sum(slippages) / len(slippages):.4f}% | 最大: {max(slippages):.4f}% | "
+                     f"设置: {slippage}% | 超出设置: {sum(loop['over_slippage'] for loop in loops)} 次")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,221 @@
+import json
+import time
+import sqlite3
+import logging
+import threading
+import rlp
+from hexbytes import HexBytes
+from web3 import Web3
+from web3.datastructures import AttributeDict
+from rpc import batch_request, to_int, tx_hash_key
+
+# 交易状态
+PENDING = 'pending'      # 已签名、准备/已经广播，尚未确认
+CONFIRMED = 'confirmed'  # 已上链且执行成功
+FAILED = 'failed'        # 已上链但执行失败（nonce已消耗）
+REPLACED = 'replaced'    # 同一nonce的另一个版本已上链
+DROPPED = 'dropped'      # nonce已被消耗但查不到这笔交易的回执
+REJECTED = 'rejected'    # 所有节点都拒绝广播，从未进入交易池
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS transactions (
+    tx_hash    TEXT PRIMARY KEY,
+    loop       INTEGER NOT NULL,
+    stage      TEXT NOT NULL,
+    nonce      INTEGER NOT NULL,
+    raw_tx     TEXT NOT NULL,
+    status     TEXT NOT NULL,
+    block      INTEGER,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS transactions_status ON transactions (status);
+CREATE INDEX IF NOT EXISTS transactions_loop ON transactions (loop, stage);
+CREATE TABLE IF NOT EXISTS state (
+    key   TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+
+def tx_nonce(raw_transaction):
+    """从已签名交易的原始字节中取出nonce（legacy 与 EIP-2718 类型交易）"""
+    raw = bytes(HexBytes(raw_transaction))
+    if raw[0] >= 0xc0:
+        return int.from_bytes(rlp.decode(raw)[0], 'big')
+    # 类型交易：类型字节 + rlp([chainId, nonce, ...])
+    return int.from_bytes(rlp.decode(raw[1:])[1], 'big')
+
+
+class TxJournal:
+    """交易日志（SQLite WAL）
+
+    每笔交易在广播前写入：循环序号、阶段、nonce、哈希和已签名的原始交易。
+    重启时 reconcile() 用一次批量请求核对所有未完成交易的回执，
+    仍在途的交易可以原样重发（同一nonce、同一签名），不会用过期nonce重新签名。
+    日志按钱包地址和链ID区分，换钱包或换链时自动清空。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        # WAL + synchronous=NORMAL：进程崩溃不丢已提交的记录，写入不阻塞读取
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.executescript(_SCHEMA)
+        self._conn.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        self.loop = 0  # 当前循环序号，record() 时写入
+
+    # ---------- 状态 ----------
+
+    def get(self, key, default=None):
+        with self._lock:
+            row = self._conn.execute('SELECT value FROM state WHERE key = ?', (key,)).fetchone()
+        return json.loads(row['value']) if row else default
+
+    def set(self, key, value):
+        with self._lock:
+            self._conn.execute('INSERT OR REPLACE INTO state (key, value) VALUES (?, ?)', (key, json.dumps(value)))
+
+    def bind(self, wallet, chain_id):
+        """绑定钱包和链；与上次运行不一致时清空旧日志"""
+        owner = [Web3.to_checksum_address(wallet), chain_id]
+        previous = self.get('owner')
+        if previous is not None and previous != owner:
+            logging.warning(f"交易日志属于其他钱包或链 {previous}，已清空")
+            with self._lock:
+                self._conn.execute('DELETE FROM transactions')
+                self._conn.execute('DELETE FROM state')
+        self.set('owner', owner)
+
+    def completed_loop(self):
+        """最后一个处理完的循环序号"""
+        return self.get('completed_loop', 0)
+
+    def complete_loop(self, loop):
+        self.set('completed_loop', loop)
+
+    def finish_run(self):
+        """全部循环和撤销批准完成，清空本次运行的交易记录，下次运行从头开始
+
+        confirmed_stages() 按循环序号查询，不清空的话下次运行会把每个循环都当成已完成。
+        """
+        with self._lock:
+            with self._conn:
+                self._conn.execute('DELETE FROM transactions')
+                self._conn.execute('INSERT OR REPLACE INTO state (key, value) VALUES (?, ?)', ('completed_loop', json.dumps(0)))
+
+    # ---------- 交易记录 ----------
+
+    def record(self, signed_tx, stage):
+        """广播前写入一笔已签名交易（同一哈希重复写入不会覆盖已有状态）"""
+        now = time.time()
+        with self._lock:
+            # 之前被所有节点拒绝或被标记为丢弃的交易再次发送时恢复为 pending
+            self._conn.execute(
+                'INSERT INTO transactions '
+                '(tx_hash, loop, stage, nonce, raw_tx, status, created_at, updated_at) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?) '
+                'ON CONFLICT (tx_hash) DO UPDATE SET status = excluded.status, updated_at = excluded.updated_at '
+                'WHERE status IN (?, ?)',
+                (tx_hash_key(signed_tx.hash), self.loop, stage, tx_nonce(signed_tx.raw_transaction),
+                 Web3.to_hex(signed_tx.raw_transaction), PENDING, now, now, REJECTED, DROPPED),
+            )
+
+    def mark(self, tx_hash, status, block=None):
+        with self._lock:
+            self._conn.execute(
+                'UPDATE transactions SET status = ?, block = COALESCE(?, block), updated_at = ? WHERE tx_hash = ?',
+                (status, block, time.time(), tx_hash_key(tx_hash)),
+            )
+
+    def mark_receipt(self, tx_hash, receipt):
+        """交易上链：按回执状态标记成功/失败，同一nonce的其他版本标记为已替换"""
+        status = CONFIRMED if receipt['status'] == 1 else FAILED
+        key = tx_hash_key(tx_hash)
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute('SELECT nonce FROM transactions WHERE tx_hash = ?', (key,)).fetchone()
+            with self._conn:
+                self._conn.execute(
+                    'UPDATE transactions SET status = ?, block = ?, updated_at = ? WHERE tx_hash = ?',
+                    (status, receipt['blockNumber'], now, key),
+                )
+                if row is not None:
+                    self._conn.execute(
+                        'UPDATE transactions SET status = ?, updated_at = ? WHERE nonce = ? AND tx_hash != ? AND status IN (?, ?)',
+                        (REPLACED, now, row['nonce'], key, PENDING, DROPPED),
+                    )
+
+    def confirmed_stages(self, loop):
+        """该循环中已经成功上链的阶段"""
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT DISTINCT stage FROM transactions WHERE loop = ? AND status = ?', (loop, CONFIRMED),
+            ).fetchall()
+        return {row['stage'] for row in rows}
+
+    def pending(self, with_dropped=False):
+        """未完成的交易；with_dropped=True 时还包括已标记为丢弃的交易（交易池中查不到后仍可能上链）"""
+        statuses = (PENDING, DROPPED) if with_dropped else (PENDING,)
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT * FROM transactions WHERE status IN ({', '.join('?' * len(statuses))}) ORDER BY nonce, created_at",
+                statuses,
+            ).fetchall()
+        return [self._row(row) for row in rows]
+
+    @staticmethod
+    def _row(row):
+        return AttributeDict({
+            **dict(row),
+            'hash': HexBytes(row['tx_hash']),
+            'raw_transaction': HexBytes(row['raw_tx']),
+        })
+
+    # ---------- 启动核对 ----------
+
+    def reconcile(self, w3, address):
+        """一次批量请求核对所有未完成交易
+
+        查询每笔 pending 和已丢弃交易的回执和钱包已上链的nonce，更新状态后返回
+        AttributeDict(confirmed, failed, dropped, in_flight)，in_flight 是仍可原样重发的交易。
+        已丢弃的交易可能在那之后上链，同样按回执更新；nonce仍未被消耗时与 pending 交易一起作为重发候选。
+        """
+        rows = self.pending(with_dropped=True)
+        result = AttributeDict({'confirmed': [], 'failed': [], 'dropped': [], 'in_flight': []})
+        if not rows:
+            return result
+
+        calls = [('eth_getTransactionReceipt', [row.tx_hash]) for row in rows]
+        calls.append(('eth_getTransactionCount', [Web3.to_checksum_address(address), 'latest']))
+        responses = batch_request(w3, calls)
+        chain_nonce = to_int(responses[-1])
+
+        mined_nonces = set()
+        latest = {}  # nonce -> 最后签名的版本（替换交易费用最高）
+        for row, receipt in zip(rows, responses[:-1]):
+            if receipt is None:
+                continue
+            receipt = {'status': to_int(receipt['status']), 'blockNumber': to_int(receipt['blockNumber'])}
+            self.mark_receipt(row.tx_hash, receipt)
+            mined_nonces.add(row.nonce)
+            (result.confirmed if receipt['status'] == 1 else result.failed).append(row)
+
+        for row in rows:
+            if row.nonce in mined_nonces:
+                continue
+            if chain_nonce is not None and row.nonce < chain_nonce:
+                # nonce已被其他交易消耗（之前已标记为丢弃的不再重复计入）
+                if row.status != DROPPED:
+                    self.mark(row.tx_hash, DROPPED)
+                    result.dropped.append(row)
+            else:
+                latest[row.nonce] = row
+        result.in_flight.extend(latest[nonce] for nonce in sorted(latest))
+        return result
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,100 @@
+import logging
+import threading
+from eth_abi import decode
+from web3 import Web3
+from web3.datastructures import AttributeDict
+
+# Transfer(address indexed from, address indexed to, uint256 value)
+TRANSFER_TOPIC = Web3.keccak(text='Transfer(address,address,uint256)')
+# Approval(address indexed owner, address indexed spender, uint256 value)
+APPROVAL_TOPIC = Web3.keccak(text='Approval(address,address,uint256)')
+
+
+def topic_address(topic):
+    """indexed address 参数：32字节topic的后20字节"""
+    return Web3.to_checksum_address(bytes(topic)[-20:])
+
+
+class BalanceLedger:
+    """钱包余额的本地账本
+
+    从状态快照取得一次链上余额后，按自己交易回执中的代币 Transfer 日志增量更新钱包A/钱包B的代币余额，
+    钱包B发出的每笔交易扣除 gasUsed × effectiveGasPrice 的BNB，交易确认后不再重新读取余额。
+    日志给出的是实际转账数量，转账收税的代币也不会算错。
+    之后每次读取状态快照都是一次核对：与账本不一致（其他程序或外部转账）时记录偏差并以链上为准；
+    连续应用 checkpoint_interval 个回执仍没有快照时 checkpoint_due() 返回True，由调用方读取一次。
+    """
+
+    FIELDS = ('a_token_balance', 'token_balance', 'bnb_balance')
+
+    def __init__(self, token, wallet_a, wallet_b, spender, checkpoint_interval=10):
+        self.token = Web3.to_checksum_address(token)
+        self.wallet_a = Web3.to_checksum_address(wallet_a)
+        self.wallet_b = Web3.to_checksum_address(wallet_b)
+        self.spender = Web3.to_checksum_address(spender)
+        self.checkpoint_interval = checkpoint_interval
+        self._lock = threading.Lock()
+        self._balances = None     # 字段 -> 余额；None 表示还没有链上快照
+        self._since_checkpoint = 0
+
+    def checkpoint_due(self):
+        with self._lock:
+            return (self._balances is None
+                    or any(self._balances[field] is None for field in self.FIELDS)
+                    or self._since_checkpoint >= self.checkpoint_interval)
+
+    def snapshot(self):
+        """账本中的余额，字段与状态快照相同"""
+        with self._lock:
+            return AttributeDict(dict(self._balances or {}))
+
+    def checkpoint(self, state):
+        """以状态快照为准校准账本，返回偏差 {字段: 链上 - 账本}（没有偏差时为空）"""
+        drift = {}
+        with self._lock:
+            if self._balances is not None:
+                for field in self.FIELDS:
+                    expected, actual = self._balances.get(field), state.get(field)
+                    if expected is not None and actual is not None and expected != actual:
+                        drift[field] = actual - expected
+            self._balances = {field: state.get(field) for field in self.FIELDS}
+            self._since_checkpoint = 0
+        if drift:
+            logging.warning(f"余额与本地账本不一致，以链上为准 | {', '.join(f'{k}: {v:+d}' for k, v in drift.items())}")
+        return drift
+
+    def apply_receipt(self, receipt):
+        """按回执更新余额；回执中有钱包B对 spender 的 Approval 事件时返回其中的授权额度，否则返回None"""
+        allowance = None
+        with self._lock:
+            if self._balances is None:
+                return None
+            balances = self._balances
+            for log in receipt.get('logs', []):
+                if Web3.to_checksum_address(log['address']) != self.token or len(log['topics']) < 3:
+                    continue
+                topic = bytes(log['topics'][0])
+                if topic not in (TRANSFER_TOPIC, APPROVAL_TOPIC):
+                    continue
+                try:
+                    value = decode(['uint256'], bytes(log['data']))[0]
+                    sender, recipient = topic_address(log['topics'][1]), topic_address(log['topics'][2])
+                except Exception:
+                    # 数据格式不标准的事件（如数量也作为indexed参数），无法解析时跳过，下次核对时以链上为准
+                    continue
+                if topic == TRANSFER_TOPIC:
+                    for field, address in (('a_token_balance', self.wallet_a), ('token_balance', self.wallet_b)):
+                        if balances[field] is None:
+                            continue
+                        if sender == address:
+                            balances[field] -= value
+                        if recipient == address:
+                            balances[field] += value
+                elif topic == APPROVAL_TOPIC and sender == self.wallet_b and recipient == self.spender:
+                    allowance = value
+            if receipt.get('from') == self.wallet_b and balances['bnb_balance'] is not None:
+                gas_price = receipt.get('effectiveGasPrice')
+                # 没有 effectiveGasPrice 的节点无法算出gas费用，下次改为读取链上余额
+                balances['bnb_balance'] = balances['bnb_balance'] - receipt['gasUsed'] * gas_price if gas_price is not None else None
+            self._since_checkpoint += 1
+        return allowance
@@ -0,0 +1,231 @@
+import json
+import time
+import logging
+import threading
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from web3.providers.base import JSONBaseProvider
+
+# 耗时直方图的桶（秒）
+SECONDS_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+# 打包区块数直方图的桶（广播后第几个区块打包）
+BLOCK_BUCKETS = (0, 1, 2, 3, 5, 10, 20)
+
+_PREFIX = 'alphabot_'
+
+
+def _label_key(labels):
+    return tuple(sorted((k, str(v)) for k, v in labels.items() if v is not None))
+
+
+def _format_labels(key, extra=None):
+    pairs = list(key) + ([extra] if extra else [])
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in pairs) + '}'
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class _Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.sum += value
+        self.count += 1
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+
+
+class Metrics:
+    """进程内指标：计数器、耗时直方图和JSON lines追踪文件
+
+    span()/observe() 记录热路径各阶段耗时（报价、构建、签名、广播、首次被节点接受、打包、确认），
+    inc() 记录重试、nonce错误等计数。serve() 在本地端口以Prometheus文本格式导出，
+    trace_path 不为空时每个事件同时追加一行JSON，便于离线分析。
+    """
+
+    def __init__(self, trace_path=None):
+        self._lock = threading.Lock()
+        self._counters = {}     # (名称, 标签) -> 值
+        self._histograms = {}   # (名称, 标签) -> _Histogram
+        self._trace = open(trace_path, 'a', buffering=1, encoding='utf-8') if trace_path else None
+        self._server = None
+
+    # ---------- 记录 ----------
+
+    def inc(self, name, value=1, **labels):
+        key = (name, _label_key(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, stage, seconds, **labels):
+        """记录一个阶段的耗时（秒）"""
+        self._observe('stage_seconds', seconds, SECONDS_BUCKETS, stage=stage, **labels)
+        self.trace(stage, ms=round(seconds * 1000, 3), **labels)
+
+    def observe_blocks(self, blocks, **labels):
+        """记录交易从广播到打包经过的区块数"""
+        self._observe('inclusion_blocks', blocks, BLOCK_BUCKETS, **labels)
+        self.trace('inclusion_block', blocks=blocks, **labels)
+
+    def observe_rpc(self, method, seconds, error=False):
+        self.inc('rpc_requests', method=method)
+        if error:
+            self.inc('rpc_errors', method=method)
+        self._observe('rpc_request_seconds', seconds, SECONDS_BUCKETS, method=method)
+
+    @contextmanager
+    def span(self, stage, **labels):
+        """with metrics.span('sign', tx='Swap'): ... 记录代码块耗时，出错时额外计数"""
+        start = time.perf_counter()
+        try:
+            yield
+        except Exception:
+            self.inc('stage_errors', stage=stage, **labels)
+            raise
+        finally:
+            self.observe(stage, time.perf_counter() - start, **labels)
+
+    def _observe(self, name, value, buckets, **labels):
+        key = (name, _label_key(labels))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = _Histogram(buckets)
+            histogram.observe(value)
+
+    def trace(self, event, **fields):
+        """追加一行追踪记录"""
+        if self._trace is None:
+            return
+        line = json.dumps({'ts': round(time.time(), 6), 'event': event, **fields}, ensure_ascii=False, default=str)
+        with self._lock:
+            self._trace.write(line + '\n')
+
+    # ---------- 导出 ----------
+
+    def render(self):
+        """Prometheus 文本格式（text/plain; version=0.0.4）"""
+        lines = []
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted(self._histograms.items(), key=lambda item: item[0])
+            seen = set()
+            for (name, key), value in counters:
+                metric = f'{_PREFIX}{name}_total'
+                if metric not in seen:
+                    seen.add(metric)
+                    lines.append(f'# TYPE {metric} counter')
+                lines.append(f'{metric}{_format_labels(key)} {value}')
+            for (name, key), histogram in histograms:
+                metric = f'{_PREFIX}{name}'
+                if metric not in seen:
+                    seen.add(metric)
+                    lines.append(f'# TYPE {metric} histogram')
+                cumulative = 0
+                for bound, count in zip(histogram.buckets, histogram.counts):
+                    cumulative += count
+                    lines.append(f'{metric}_bucket{_format_labels(key, ("le", str(bound)))} {cumulative}')
+                lines.append(f'{metric}_bucket{_format_labels(key, ("le", "+Inf"))} {histogram.count}')
+                lines.append(f'{metric}_sum{_format_labels(key)} {histogram.sum}')
+                lines.append(f'{metric}_count{_format_labels(key)} {histogram.count}')
+        return '\n'.join(lines) + '\n'
+
+    def summary(self):
+        """各阶段平均耗时（毫秒）和调用次数，用于日志输出"""
+        with self._lock:
+            result = {}
+            for (name, key), histogram in self._histograms.items():
+                if name != 'stage_seconds' or not histogram.count:
+                    continue
+                stage = dict(key)['stage']
+                total, count = result.get(stage, (0.0, 0))
+                result[stage] = (total + histogram.sum, count + histogram.count)
+        return {stage: (round(total / count * 1000, 2), count) for stage, (total, count) in result.items()}
+
+    def serve(self, port, host='127.0.0.1'):
+        """在本地端口导出 /metrics"""
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] != '/metrics':
+                    self.send_error(404)
+                    return
+                body = metrics.render().encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, name='metrics', daemon=True).start()
+        logging.info(f"指标导出: http://{host}:{self._server.server_address[1]}/metrics")
+        return self._server
+
+    def close(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server = None
+        if self._trace is not None:
+            self._trace.close()
+            self._trace = None
+
+
+class InstrumentedProvider(JSONBaseProvider):
+    """provider中间层：按RPC方法统计请求数、错误数和耗时直方图
+
+    包在真正的provider外面，w3.eth.* 调用和 rpc.batch_request 的批量请求都会经过这里。
+    批量请求整体记为 method="batch"，其中每个方法另计请求数。
+    """
+
+    def __init__(self, provider, metrics):
+        super().__init__()
+        self.provider = provider
+        self.metrics = metrics
+
+    def __getattr__(self, name):
+        # endpoint_uri、stats() 等属性交给被包装的provider
+        if name == 'provider':
+            raise AttributeError(name)
+        return getattr(self.provider, name)
+
+    def __str__(self):
+        return f"Instrumented {self.provider}"
+
+    def make_request(self, method, params):
+        start = time.perf_counter()
+        error = True
+        try:
+            response = self.provider.make_request(method, params)
+            error = isinstance(response, dict) and 'error' in response
+            return response
+        finally:
+            self.metrics.observe_rpc(method, time.perf_counter() - start, error)
+
+    def make_batch_request(self, batch_requests):
+        start = time.perf_counter()
+        error = True
+        try:
+            responses = self.provider.make_batch_request(batch_requests)
+            error = not isinstance(responses, list)
+            return responses
+        finally:
+            self.metrics.observe_rpc('batch', time.perf_counter() - start, error)
+            for method, _ in batch_requests:
+                self.metrics.inc('rpc_batched_requests', method=method)
@@ -0,0 +1,107 @@
+import heapq
+import logging
+import threading
+
+
+class NonceManager:
+    """本地nonce分配器
+
+    启动时从链上读取一次pending nonce，之后在本地递增分配，不再每笔交易查询节点。
+    未能发出的交易归还nonce，下次分配优先复用，避免留下nonce空洞卡住后续交易。
+    """
+
+    def __init__(self, w3, address):
+        self.w3 = w3
+        self.address = address
+        self._lock = threading.Lock()
+        self._next = None
+        self._released = []     # 归还的nonce（最小堆），优先复用以填补空洞
+        self._in_flight = set()  # 已分配、尚未确认的nonce
+        self._done = set()       # 已确认但链上计数可能尚未跟上的nonce
+
+    def _chain_nonce(self, block_identifier='pending'):
+        return self.w3.eth.get_transaction_count(self.address, block_identifier)
+
+    def peek(self):
+        """下一个将要分配的nonce（不占用）"""
+        with self._lock:
+            if self._released:
+                return self._released[0]
+            return self._next
+
+    def in_flight(self):
+        """已分配、尚未确认的nonce数量"""
+        with self._lock:
+            return len(self._in_flight)
+
+    def allocate(self):
+        """分配一个nonce"""
+        if self._next is None:
+            chain_nonce = self._chain_nonce()
+            with self._lock:
+                if self._next is None:
+                    self._next = chain_nonce
+        with self._lock:
+            if self._released:
+                nonce = heapq.heappop(self._released)
+            else:
+                nonce = self._next
+                self._next += 1
+                # resync 回退到链上计数后，跳过仍在途的nonce（如其他进程已分配、尚未进入交易池）
+                while nonce in self._in_flight:
+                    nonce = self._next
+                    self._next += 1
+            self._in_flight.add(nonce)
+            return nonce
+
+    def confirm(self, nonce):
+        """交易已上链（无论成功或失败，nonce都已消耗）"""
+        with self._lock:
+            self._in_flight.discard(nonce)
+            self._done.add(nonce)
+
+    def release(self, nonce):
+        """交易未能发出，归还nonce供下一笔交易复用"""
+        with self._lock:
+            if nonce in self._in_flight:
+                self._in_flight.discard(nonce)
+                heapq.heappush(self._released, nonce)
+
+    def resync(self):
+        """nonce与链上不一致（如 nonce too low）时，以链上pending计数为准重新开始分配
+
+        仍在途和已归还、链上尚未用到的nonce保留：协调器中同一个分配器由多个进程共用，
+        一个进程重新同步不应让其他进程已分配或归还的nonce被重复分配或遗漏。
+        """
+        chain_nonce = self._chain_nonce()
+        with self._lock:
+            self._next = chain_nonce
+            self._released = [n for n in self._released if n >= chain_nonce]
+            heapq.heapify(self._released)
+            self._in_flight = {n for n in self._in_flight if n >= chain_nonce}
+            self._done = {n for n in self._done if n >= chain_nonce}
+        logging.info(f"nonce已重新同步 | 链上: {chain_nonce}")
+        return chain_nonce
+
+    def refill_gaps(self):
+        """检测nonce空洞：链上pending计数到本地分配位置之间，既不在途也未确认的nonce
+
+        pending计数以下的nonce要么已上链，要么还在交易池中（如批量超时后仍未打包的交易），
+        不能算作空洞，否则复用时会替换交易池中的交易或报 replacement underpriced。
+        空洞会被放入复用队列，由下一次 allocate 填补。返回发现的空洞列表。
+        """
+        chain_nonce = self._chain_nonce()
+        with self._lock:
+            if self._next is None:
+                return []
+            self._done = {n for n in self._done if n >= chain_nonce}
+            self._in_flight = {n for n in self._in_flight if n >= chain_nonce}
+            released = {n for n in self._released if n >= chain_nonce}
+            gaps = set(range(chain_nonce, self._next)) - self._in_flight - self._done - released
+            self._released = sorted(released | gaps)
+            if chain_nonce > self._next:
+                # 其他程序使用了同一钱包，直接跳到链上位置
+                self._next = chain_nonce
+        if gaps:
+            logging.warning(f"检测到nonce空洞: {sorted(gaps)}，将优先填补")
+        return sorted(gaps)
@@ -0,0 +1,298 @@
+import json
+import time
+import socket
+import logging
+import threading
+import statistics
+from collections import deque
+from web3.exceptions import TimeExhausted
+from rpc import batch_request, format_receipt, tx_hash_key
+
+# 默认出块间隔（秒），在观测到真实出块间隔前使用
+DEFAULT_BLOCK_TIME = 3.0
+
+
+class BlockNotifier:
+    """区块/回执通知器
+
+    WebSocket或IPC节点使用 newHeads 订阅推送新区块，普通HTTP节点退化为按出块间隔自适应轮询。
+    所有等待中的交易共用同一个区块流：每个新区块只发一次批量回执查询。
+    """
+
+    def __init__(self, w3, stream_url=None, min_poll_interval=0.2, max_poll_interval=3.0,
+                 idle_poll_interval=5.0, reconnect_delay=5.0, block_source=None):
+        self.w3 = w3
+        self.stream_url = stream_url
+        self.block_source = block_source  # 可选: 返回最新区块号的函数（如协调器），替代轮询节点
+        self.min_poll_interval = min_poll_interval
+        self.max_poll_interval = max_poll_interval
+        self.idle_poll_interval = idle_poll_interval
+        self.reconnect_delay = reconnect_delay
+
+        self.latest_block = None
+        self._last_block_time = None
+        self._block_intervals = deque(maxlen=20)
+
+        self._cond = threading.Condition()
+        self._waiting = set()       # 等待回执的交易哈希
+        self._receipts = {}         # 已查到的回执
+        self._block_waiters = 0
+        self._listeners = []
+
+        self._thread = None
+        self._stop = threading.Event()
+        self._wake = threading.Event()  # 空闲轮询期间有新的等待者时提前唤醒
+
+    # ---------- 对外接口 ----------
+
+    def start(self):
+        with self._cond:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='block-notifier', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def add_listener(self, callback):
+        """注册新区块回调 callback(block_number)，在通知线程中执行"""
+        self._listeners.append(callback)
+        self.start()
+        self._wake.set()
+
+    def remove_listener(self, callback):
+        if callback in self._listeners:
+            self._listeners.remove(callback)
+
+    @property
+    def block_time(self):
+        """观测到的平均出块间隔（秒）"""
+        if self._block_intervals:
+            return statistics.median(self._block_intervals)
+        return DEFAULT_BLOCK_TIME
+
+    def current_block(self):
+        """最新区块号，通知器尚未收到区块时直接查询节点"""
+        if self.latest_block is None:
+            self._on_new_head(self._fetch_block_number())
+        return self.latest_block
+
+    def wait_for_block(self, current_block, timeout=None):
+        """阻塞直到出现高于 current_block 的区块，返回最新区块号"""
+        self.start()
+        deadline = None if timeout is None else time.time() + timeout
+        with self._cond:
+            self._block_waiters += 1
+            self._wake.set()
+            try:
+                while self.latest_block is None or self.latest_block <= current_block:
+                    remaining = None if deadline is None else deadline - time.time()
+                    if remaining is not None and remaining <= 0:
+                        raise TimeExhausted(f"等待区块 {current_block + 1} 超时")
+                    self._cond.wait(remaining)
+                return self.latest_block
+            finally:
+                self._block_waiters -= 1
+
+    def wait_for_receipt(self, tx_hash, timeout=120, check_now=False):
+        """阻塞直到交易被打包，返回回执；超时抛出 TimeExhausted
+
+        check_now=True 时先立即查询一次（用于可能已经上链的交易）。
+        """
+        key = tx_hash_key(tx_hash)
+        self.start()
+        with self._cond:
+            self._waiting.add(key)
+        self._wake.set()
+        if check_now:
+            self._check_receipts([key])
+
+        deadline = time.time() + timeout
+        with self._cond:
+            try:
+                while key not in self._receipts:
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        raise TimeExhausted(f"交易 {key} 在 {timeout} 秒内未被打包")
+                    self._cond.wait(remaining)
+                return self._receipts.pop(key)
+            finally:
+                self._waiting.discard(key)
+
+    def find_receipt(self, tx_hashes):
+        """一次批量请求查询多笔交易（如同一nonce的多个版本），返回第一个已上链的 (哈希, 回执)"""
+        keys = [tx_hash_key(h) for h in tx_hashes]
+        results = batch_request(self.w3, [('eth_getTransactionReceipt', [k]) for k in keys])
+        for tx_hash, raw_receipt in zip(tx_hashes, results):
+            if raw_receipt is not None:
+                return tx_hash, format_receipt(raw_receipt)
+        return None, None
+
+    # ---------- 区块处理 ----------
+
+    def _on_new_head(self, block_number):
+        with self._cond:
+            if self.latest_block is not None and block_number <= self.latest_block:
+                return
+            now = time.time()
+            if self.latest_block is not None and self._last_block_time is not None:
+                self._block_intervals.append((now - self._last_block_time) / (block_number - self.latest_block))
+            self.latest_block = block_number
+            self._last_block_time = now
+            pending = list(self._waiting)
+
+        if pending:
+            self._check_receipts(pending)
+
+        with self._cond:
+            self._cond.notify_all()
+
+        for callback in list(self._listeners):
+            try:
+                callback(block_number)
+            except Exception as e:
+                logging.warning(f"新区块回调出错: {str(e)[:50]}")
+
+    def _check_receipts(self, tx_hashes):
+        """一次批量请求查询所有等待中交易的回执"""
+        try:
+            results = batch_request(self.w3, [('eth_getTransactionReceipt', [h]) for h in tx_hashes])
+        except Exception as e:
+            logging.warning(f"批量查询回执失败: {str(e)[:50]}")
+            return
+        with self._cond:
+            for tx_hash, raw_receipt in zip(tx_hashes, results):
+                if raw_receipt is not None and tx_hash in self._waiting:
+                    self._receipts[tx_hash] = format_receipt(raw_receipt)
+            self._cond.notify_all()
+
+    # ---------- 后台线程 ----------
+
+    def _run(self):
+        while not self._stop.is_set():
+            if self.stream_url:
+                try:
+                    self._run_subscription()
+                except Exception as e:
+                    logging.warning(f"newHeads订阅断开，临时改用轮询: {str(e)[:50]}")
+                # 断线期间用轮询兜底，稍后重连
+                self._run_polling(until=time.time() + self.reconnect_delay)
+            else:
+                self._run_polling()
+
+    def _has_waiters(self):
+        return bool(self._waiting or self._block_waiters or self._listeners)
+
+    def _next_poll_delay(self):
+        """根据出块间隔计算下次轮询时间：预计出块前少查，临近出块时密集查"""
+        if not self._has_waiters():
+            return self.idle_poll_interval
+        if self._last_block_time is None:
+            return self.min_poll_interval
+        remaining = self.block_time - (time.time() - self._last_block_time)
+        if remaining > self.min_poll_interval:
+            return min(remaining, self.max_poll_interval)
+        return self.min_poll_interval
+
+    def _fetch_block_number(self):
+        if self.block_source is not None:
+            return self.block_source()
+        return self.w3.eth.block_number
+
+    def _run_polling(self, until=None):
+        while not self._stop.is_set():
+            if until is not None and time.time() >= until:
+                return
+            try:
+                self._on_new_head(self._fetch_block_number())
+            except Exception as e:
+                logging.warning(f"查询区块高度失败: {str(e)[:50]}")
+            self._wake.wait(self._next_poll_delay())
+            self._wake.clear()
+
+    def _run_subscription(self):
+        stream = _open_stream(self.stream_url)
+        try:
+            stream.send({'jsonrpc': '2.0', 'id': 1, 'method': 'eth_subscribe', 'params': ['newHeads']})
+            subscription_id = None
+            logging.info(f"已连接区块推送: {self.stream_url}")
+            while not self._stop.is_set():
+                message = stream.recv(timeout=1.0)
+                if message is None:
+                    continue
+                if message.get('id') == 1:
+                    if 'error' in message:
+                        raise RuntimeError(f"eth_subscribe失败: {message['error']}")
+                    subscription_id = message.get('result')
+                    continue
+                params = message.get('params') or {}
+                if message.get('method') != 'eth_subscription' or params.get('subscription') != subscription_id:
+                    continue
+                head = params.get('result') or {}
+                if head.get('number') is not None:
+                    self._on_new_head(int(head['number'], 16))
+        finally:
+            stream.close()
+
+
+def _open_stream(url):
+    if url.startswith('ws://') or url.startswith('wss://'):
+        return _WebSocketStream(url)
+    return _IPCStream(url[len('ipc://'):] if url.startswith('ipc://') else url)
+
+
+class _WebSocketStream:
+    def __init__(self, url):
+        from websockets.sync.client import connect
+        self._conn = connect(url, max_size=None)
+
+    def send(self, payload):
+        self._conn.send(json.dumps(payload))
+
+    def recv(self, timeout=None):
+        try:
+            return json.loads(self._conn.recv(timeout=timeout))
+        except TimeoutError:
+            return None
+
+    def close(self):
+        self._conn.close()
+
+
+class _IPCStream:
+    def __init__(self, path):
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._sock.connect(path)
+        self._buffer = ''
+        self._decoder = json.JSONDecoder()
+
+    def send(self, payload):
+        self._sock.sendall(json.dumps(payload).encode())
+
+    def recv(self, timeout=None):
+        while True:
+            self._buffer = self._buffer.lstrip()
+            if self._buffer:
+                try:
+                    message, end = self._decoder.raw_decode(self._buffer)
+                    self._buffer = self._buffer[end:]
+                    return message
+                except ValueError:
+                    pass  # 消息不完整，继续读取
+            self._sock.settimeout(timeout)
+            try:
+                chunk = self._sock.recv(65536)
+            except socket.timeout:
+                return None
+            if not chunk:
+                raise ConnectionError("IPC连接已关闭")
+            self._buffer += chunk.decode()
+
+    def close(self):
+        self._sock.close()
@@ -0,0 +1,76 @@
+import math
+import threading
+from collections import deque
+
+
+def max_trade_for_impact(reserve_in, impact_bps):
+    """价格影响（不含手续费）不超过 impact_bps 的最大输入数量
+
+    恒定乘积下输入 a 的成交均价相对中间价的折价为 a / (reserve_in + a)，
+    令其等于 f 解得 a = reserve_in * f / (1 - f)。
+    """
+    f = impact_bps / 10000
+    return int(reserve_in * f / (1 - f))
+
+
+def price_impact_bps(amount_in, reserve_in):
+    """输入 amount_in 的价格影响（万分之一，不含手续费）"""
+    if reserve_in <= 0:
+        return 10000
+    return amount_in / (reserve_in + amount_in) * 10000
+
+
+class TradeOptimizer:
+    """根据实时储备量和近期波动选择滑点与每笔swap数量
+
+    observe() 记录每个区块的中间价（reserve_out / reserve_in），波动率取最近 window 个观测的
+    每区块对数收益标准差。滑点 = z × 波动率 × sqrt(预计打包前经过的区块数)，限制在
+    [min_slippage, max_slippage]（%）之间：行情平稳时收紧 amountOutMin，少被夹；波动大时放宽，少回滚。
+    单笔价格影响超过 max_impact_bps 时把数量拆成几笔，分在不同区块成交，让套利者在中间把价格拉回。
+    """
+
+    def __init__(self, min_slippage=0.05, max_slippage=1.0, max_impact_bps=30, z=3.0, window=50, max_parts=5):
+        self.min_slippage = min_slippage
+        self.max_slippage = max_slippage
+        self.max_impact_bps = max_impact_bps
+        self.z = z
+        self.max_parts = max_parts
+        self._lock = threading.Lock()
+        self._prices = deque(maxlen=window + 1)  # (区块号, 对数中间价)
+
+    def observe(self, reserve_in, reserve_out, block_number):
+        """记录一次储备量；同一区块只记一次"""
+        if not reserve_in or not reserve_out or block_number is None:
+            return
+        with self._lock:
+            if self._prices and block_number <= self._prices[-1][0]:
+                return
+            self._prices.append((block_number, math.log(reserve_out / reserve_in)))
+
+    def volatility(self):
+        """每区块对数收益的标准差；观测不足时返回None"""
+        with self._lock:
+            prices = list(self._prices)
+        if len(prices) < 3:
+            return None
+        # 相邻观测可能间隔多个区块，按 sqrt(间隔) 归一化到每区块
+        returns = [(p1 - p0) / math.sqrt(b1 - b0) for (b0, p0), (b1, p1) in zip(prices, prices[1:])]
+        mean = sum(returns) / len(returns)
+        return math.sqrt(sum((r - mean) ** 2 for r in returns) / (len(returns) - 1))
+
+    def slippage(self, default, blocks_ahead=1):
+        """本轮使用的滑点（%）；观测不足时返回 default"""
+        sigma = self.volatility()
+        if sigma is None:
+            return default
+        slippage = self.z * sigma * math.sqrt(max(1, blocks_ahead)) * 100
+        return min(self.max_slippage, max(self.min_slippage, slippage))
+
+    def split(self, amount, reserve_in):
+        """把 amount 拆成价格影响都不超过 max_impact_bps 的几笔（最多 max_parts 笔），返回各笔数量"""
+        limit = max_trade_for_impact(reserve_in, self.max_impact_bps)
+        if limit <= 0 or amount <= limit:
+            return [amount]
+        parts = min(self.max_parts, math.ceil(amount / limit))
+        size = amount // parts
+        return [size] * (parts - 1) + [amount - size * (parts - 1)]
@@ -0,0 +1,270 @@
+import time
+import random
+import logging
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from web3._utils.batching import sort_batch_response_by_response_ids
+from web3.providers.base import JSONBaseProvider
+
+# 这些HTTP状态码说明节点暂时不可用，换一个节点重试
+_RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+# EWMA 延迟平滑系数
+_LATENCY_ALPHA = 0.2
+
+
+class EndpointUnavailable(Exception):
+    """节点连接失败、超时或返回可重试的HTTP错误"""
+
+
+def make_session(pool_size=20):
+    """保持长连接的HTTP会话，连接池大小可配置"""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    session.headers.update({'Content-Type': 'application/json', 'Connection': 'keep-alive'})
+    return session
+
+
+class _RequestsTransport:
+    """requests + urllib3 连接池（HTTP/1.1 keep-alive）"""
+
+    def __init__(self, pool_size):
+        self.session = make_session(pool_size)
+
+    def post(self, url, data, timeout):
+        response = self.session.post(url, data=data, timeout=timeout)
+        if response.status_code in _RETRYABLE_STATUS:
+            raise EndpointUnavailable(f"HTTP {response.status_code}")
+        response.raise_for_status()
+        return response.content
+
+    def close(self):
+        self.session.close()
+
+
+class _HttpxTransport:
+    """httpx 连接池，节点支持时使用HTTP/2多路复用（需要安装 httpx[http2]）"""
+
+    def __init__(self, pool_size):
+        import httpx
+        self._httpx = httpx
+        self.client = httpx.Client(
+            http2=True,
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+            headers={'Content-Type': 'application/json'},
+        )
+
+    def post(self, url, data, timeout):
+        connect_timeout, read_timeout = timeout
+        response = self.client.post(url, content=data, timeout=self._httpx.Timeout(read_timeout, connect=connect_timeout))
+        if response.status_code in _RETRYABLE_STATUS:
+            raise EndpointUnavailable(f"HTTP {response.status_code}")
+        response.raise_for_status()
+        return response.content
+
+    def close(self):
+        self.client.close()
+
+
+def _make_transport(pool_size, http2):
+    if http2:
+        try:
+            return _HttpxTransport(pool_size)
+        except ImportError:
+            logging.warning("未安装 httpx[http2]，改用HTTP/1.1长连接")
+    return _RequestsTransport(pool_size)
+
+
+class PooledHTTPProvider(JSONBaseProvider):
+    """使用显式长连接池的HTTP provider
+
+    所有线程共用同一个连接池（web3 默认按线程缓存会话，通知线程会另建连接），
+    每个请求有独立的连接/读取超时。
+    """
+
+    def __init__(self, endpoint_uri, pool_size=20, timeout=10, connect_timeout=3, http2=False, **kwargs):
+        super().__init__(**kwargs)
+        self.endpoint_uri = endpoint_uri
+        self.timeout = (connect_timeout, timeout)
+        self._transport = _make_transport(pool_size, http2)
+
+    def __str__(self):
+        return f"Pooled RPC connection {self.endpoint_uri}"
+
+    def _post(self, data):
+        try:
+            return self._transport.post(self.endpoint_uri, data, self.timeout)
+        except EndpointUnavailable:
+            raise
+        except (requests.ConnectionError, requests.Timeout, OSError) as e:
+            raise EndpointUnavailable(str(e)) from e
+        except Exception as e:
+            # httpx 的连接/超时异常
+            if type(e).__module__.startswith('httpx'):
+                raise EndpointUnavailable(str(e)) from e
+            raise
+
+    def make_request(self, method, params):
+        return self.decode_rpc_response(self._post(self.encode_rpc_request(method, params)))
+
+    def make_batch_request(self, batch_requests):
+        response = self.decode_rpc_response(self._post(self.encode_batch_rpc_request(batch_requests)))
+        if not isinstance(response, list):
+            # 节点拒绝整个批量请求时只返回一个错误对象
+            return response
+        return sort_batch_response_by_response_ids(response)
+
+    def close(self):
+        self._transport.close()
+
+
+class _Endpoint:
+    def __init__(self, provider):
+        self.provider = provider
+        self.latency = None         # EWMA 延迟（秒）
+        self.block_number = None
+        self.failures = 0
+        self.down_until = 0
+
+    @property
+    def url(self):
+        return self.provider.endpoint_uri
+
+    def healthy(self, now):
+        return now >= self.down_until
+
+    def record_success(self, elapsed):
+        self.latency = elapsed if self.latency is None else (1 - _LATENCY_ALPHA) * self.latency + _LATENCY_ALPHA * elapsed
+        self.failures = 0
+        self.down_until = 0
+
+    def record_failure(self, cooldown):
+        self.failures += 1
+        # 连续失败时冷却时间指数增长，最长5分钟
+        self.down_until = time.time() + min(cooldown * (2 ** (self.failures - 1)), 300)
+
+
+class FailoverProvider(JSONBaseProvider):
+    """多节点provider：按延迟加权路由，失败自动切换，后台健康检查
+
+    每个请求按 1/延迟 的权重随机选择健康节点，节点连接失败或返回429/5xx时
+    换下一个节点重试并让失败节点冷却；健康检查同时剔除区块高度落后太多的节点。
+    """
+
+    def __init__(self, endpoint_uris, pool_size=20, timeout=10, connect_timeout=3, http2=False,
+                 health_check_interval=10, max_block_lag=3, cooldown=5, **kwargs):
+        super().__init__(**kwargs)
+        if not endpoint_uris:
+            raise ValueError("至少需要一个RPC节点")
+        self.endpoints = [
+            _Endpoint(PooledHTTPProvider(uri, pool_size=pool_size, timeout=timeout,
+                                         connect_timeout=connect_timeout, http2=http2))
+            for uri in endpoint_uris
+        ]
+        self.endpoint_uri = self.endpoints[0].url
+        self.health_check_interval = health_check_interval
+        self.max_block_lag = max_block_lag
+        self.cooldown = cooldown
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._health_thread = None
+        if health_check_interval and len(self.endpoints) > 1:
+            self._health_thread = threading.Thread(target=self._health_loop, name='rpc-health', daemon=True)
+            self._health_thread.start()
+
+    def __str__(self):
+        return f"Failover RPC connection {[e.url for e in self.endpoints]}"
+
+    def _ordered_endpoints(self):
+        """健康节点按延迟加权随机排序，不健康的节点放在最后兜底"""
+        now = time.time()
+        with self._lock:
+            healthy = [e for e in self.endpoints if e.healthy(now)]
+            unhealthy = sorted((e for e in self.endpoints if not e.healthy(now)), key=lambda e: e.down_until)
+        known = [e.latency for e in healthy if e.latency]
+        default_latency = min(known) if known else 1.0
+        ordered = []
+        while healthy:
+            weights = [1.0 / (e.latency or default_latency) for e in healthy]
+            chosen = random.choices(healthy, weights=weights)[0]
+            healthy.remove(chosen)
+            ordered.append(chosen)
+        return ordered + unhealthy
+
+    def _call(self, fn):
+        last_error = None
+        for endpoint in self._ordered_endpoints():
+            start = time.perf_counter()
+            try:
+                response = fn(endpoint.provider)
+            except EndpointUnavailable as e:
+                last_error = e
+                with self._lock:
+                    endpoint.record_failure(self.cooldown)
+                logging.warning(f"RPC节点不可用，切换节点: {endpoint.url} ({str(e)[:50]})")
+                continue
+            with self._lock:
+                endpoint.record_success(time.perf_counter() - start)
+            return response
+        raise EndpointUnavailable(f"所有RPC节点均不可用: {last_error}")
+
+    def make_request(self, method, params):
+        return self._call(lambda provider: provider.make_request(method, params))
+
+    def make_batch_request(self, batch_requests):
+        return self._call(lambda provider: provider.make_batch_request(batch_requests))
+
+    def stats(self):
+        """各节点状态：延迟、区块高度、是否健康"""
+        now = time.time()
+        with self._lock:
+            return [{
+                'url': e.url,
+                'latency_ms': round(e.latency * 1000, 1) if e.latency is not None else None,
+                'block_number': e.block_number,
+                'healthy': e.healthy(now),
+            } for e in self.endpoints]
+
+    def _health_loop(self):
+        while not self._stop.wait(self.health_check_interval):
+            self.check_health()
+
+    def check_health(self):
+        """对每个节点请求一次 eth_blockNumber，更新延迟和区块高度，剔除落后节点"""
+        for endpoint in self.endpoints:
+            start = time.perf_counter()
+            try:
+                response = endpoint.provider.make_request('eth_blockNumber', [])
+                block_number = int(response['result'], 16)
+            except Exception:
+                with self._lock:
+                    endpoint.record_failure(self.cooldown)
+                continue
+            with self._lock:
+                endpoint.record_success(time.perf_counter() - start)
+                endpoint.block_number = block_number
+        with self._lock:
+            heights = [e.block_number for e in self.endpoints if e.block_number is not None]
+            if not heights:
+                return
+            best = max(heights)
+            for endpoint in self.endpoints:
+                if endpoint.block_number is not None and best - endpoint.block_number > self.max_block_lag:
+                    endpoint.down_until = time.time() + self.health_check_interval
+                    logging.warning(f"RPC节点区块落后 {best - endpoint.block_number} 个，暂停使用: {endpoint.url}")
+
+    def close(self):
+        self._stop.set()
+        for endpoint in self.endpoints:
+            endpoint.provider.close()
+
+
+def build_provider(endpoint_uris, pool_size=20, timeout=10, http2=False, health_check_interval=10):
+    """单个节点返回 PooledHTTPProvider，多个节点返回 FailoverProvider"""
+    if len(endpoint_uris) == 1:
+        return PooledHTTPProvider(endpoint_uris[0], pool_size=pool_size, timeout=timeout, http2=http2)
+    return FailoverProvider(endpoint_uris, pool_size=pool_size, timeout=timeout, http2=http2,
+                            health_check_interval=health_check_interval)
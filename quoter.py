@@ -0,0 +1,173 @@
+import logging
+import threading
+from eth_abi import decode
+from web3 import Web3
+from snapshot import ContractRead
+
+# PancakeSwap V2 手续费 0.25%（以万分之一为单位）
+PANCAKE_V2_FEE_BPS = 25
+
+# Sync(uint112 reserve0, uint112 reserve1)
+SYNC_TOPIC = Web3.keccak(text='Sync(uint112,uint112)')
+
+
+def get_amount_out(amount_in, reserve_in, reserve_out, fee_bps=PANCAKE_V2_FEE_BPS):
+    """恒定乘积输出，与 PancakeLibrary.getAmountOut 的整数运算完全一致"""
+    if amount_in <= 0 or reserve_in <= 0 or reserve_out <= 0:
+        return 0
+    amount_in_with_fee = amount_in * (10000 - fee_bps)
+    return amount_in_with_fee * reserve_out // (reserve_in * 10000 + amount_in_with_fee)
+
+
+def get_amount_in(amount_out, reserve_in, reserve_out, fee_bps=PANCAKE_V2_FEE_BPS):
+    """恒定乘积所需输入，与 PancakeLibrary.getAmountIn 一致；流动性不足时返回None"""
+    if amount_out <= 0 or reserve_in <= 0 or amount_out >= reserve_out:
+        return None
+    return reserve_in * amount_out * 10000 // ((reserve_out - amount_out) * (10000 - fee_bps)) + 1
+
+
+class PairQuoter:
+    """本地恒定乘积报价器
+
+    交易对地址只解析一次，储备量缓存在本地：随状态快照一起读取 getReserves，
+    或从自己交易回执里的 Sync 事件直接更新。报价在本地完成，不再调用 router.getAmountsOut。
+    """
+
+    def __init__(self, w3, router_address, state_reader, fee_bps=PANCAKE_V2_FEE_BPS):
+        self.w3 = w3
+        self.router_address = Web3.to_checksum_address(router_address)
+        self.state_reader = state_reader
+        self.fee_bps = fee_bps
+        self._factory = None
+        self._lock = threading.Lock()
+        self._pairs = {}      # (token0, token1) -> 交易对地址
+        self._reserves = {}   # 交易对地址 -> (reserve0, reserve1, 区块号, 日志序号)
+
+    # ---------- 交易对 ----------
+
+    @staticmethod
+    def sort_tokens(token_a, token_b):
+        token_a, token_b = Web3.to_checksum_address(token_a), Web3.to_checksum_address(token_b)
+        return (token_a, token_b) if int(token_a, 16) < int(token_b, 16) else (token_b, token_a)
+
+    def pair_for(self, token_a, token_b):
+        """交易对地址（factory.getPair 只查询一次）"""
+        key = self.sort_tokens(token_a, token_b)
+        if key not in self._pairs:
+            if self._factory is None:
+                state = self.state_reader.read([ContractRead('factory', self.router_address, 'factory()', (), ['address'])])
+                self._factory = Web3.to_checksum_address(state.factory)
+            state = self.state_reader.read([ContractRead('pair', self._factory, 'getPair(address,address)', key, ['address'])])
+            pair = Web3.to_checksum_address(state.pair)
+            if int(pair, 16) == 0:
+                raise ValueError(f"交易对不存在: {key[0]} / {key[1]}")
+            self._pairs[key] = pair
+            logging.info(f"交易对地址: {pair}")
+        return self._pairs[key]
+
+    def pairs_for_path(self, path):
+        return [self.pair_for(path[i], path[i + 1]) for i in range(len(path) - 1)]
+
+    # ---------- 储备量 ----------
+
+    def reserve_reads(self, path):
+        """路径上所有交易对的 getReserves 读取，可以并入同一次状态快照"""
+        return [ContractRead(f'reserves:{pair}', pair, 'getReserves()', (), ['uint112', 'uint112', 'uint32'])
+                for pair in self.pairs_for_path(path)]
+
+    def update_from_state(self, state):
+        """从状态快照中取出储备量"""
+        with self._lock:
+            for key, value in state.items():
+                if key.startswith('reserves:') and value is not None:
+                    # 快照反映整个区块执行完之后的状态，排在该区块所有日志之后
+                    self._reserves[key[len('reserves:'):]] = (value[0], value[1], state.get('block_number'), None)
+
+    def refresh(self, path, block_identifier='latest'):
+        """单独读取一次路径上的储备量"""
+        state = self.state_reader.read(self.reserve_reads(path), block_identifier=block_identifier)
+        self.update_from_state(state)
+        return state.get('block_number')
+
+    @staticmethod
+    def _position(block_number, log_index):
+        """储备量在链上的先后位置；没有日志序号（状态快照）的排在该区块末尾"""
+        return block_number, float('inf') if log_index is None else log_index
+
+    def apply_logs(self, logs):
+        """用回执中的 Sync 事件更新储备量，无需额外RPC
+
+        按 (区块号, 日志序号) 比较先后，同一区块中较早的日志不会覆盖较新的储备量。
+        """
+        with self._lock:
+            for log in logs:
+                address = Web3.to_checksum_address(log['address'])
+                if address not in self._reserves or not log['topics'] or bytes(log['topics'][0]) != SYNC_TOPIC:
+                    continue
+                reserve0, reserve1 = decode(['uint112', 'uint112'], bytes(log['data']))
+                block_number, log_index = log.get('blockNumber'), log.get('logIndex')
+                _, _, cached_block, cached_index = self._reserves[address]
+                if (block_number is None or cached_block is None
+                        or self._position(block_number, log_index) > self._position(cached_block, cached_index)):
+                    self._reserves[address] = (reserve0, reserve1, block_number, log_index)
+
+    def reserves(self, token_in, token_out):
+        """(reserve_in, reserve_out, 区块号)，本地没有缓存时返回None"""
+        pair = self.pair_for(token_in, token_out)
+        cached = self._reserves.get(pair)
+        if cached is None:
+            return None
+        reserve0, reserve1, block_number, _ = cached
+        token0, _ = self.sort_tokens(token_in, token_out)
+        if Web3.to_checksum_address(token_in) == token0:
+            return reserve0, reserve1, block_number
+        return reserve1, reserve0, block_number
+
+    def _path_reserves(self, path):
+        if any(self._reserves.get(pair) is None for pair in self.pairs_for_path(path)):
+            self.refresh(path)
+        return [self.reserves(path[i], path[i + 1]) for i in range(len(path) - 1)]
+
+    # ---------- 报价 ----------
+
+    def get_amounts_out(self, amount_in, path):
+        """与 router.getAmountsOut 相同的多跳输出，本地计算"""
+        amounts = [amount_in]
+        for reserve_in, reserve_out, _ in self._path_reserves(path):
+            amounts.append(get_amount_out(amounts[-1], reserve_in, reserve_out, self.fee_bps))
+        return amounts
+
+    def get_amounts_in(self, amount_out, path):
+        """与 router.getAmountsIn 相同的多跳输入，本地计算；流动性不足返回None"""
+        amounts = [amount_out]
+        for reserve_in, reserve_out, _ in reversed(self._path_reserves(path)):
+            amount_in = get_amount_in(amounts[0], reserve_in, reserve_out, self.fee_bps)
+            if amount_in is None:
+                return None
+            amounts.insert(0, amount_in)
+        return amounts
+
+    def quote_repeated(self, amount_in, path, count):
+        """同一数量连续兑换 count 次的各次输出：每次兑换后按恒定乘积更新本地储备量副本，
+        用于同一区块内依次打包的多笔swap分别计算最小输出（不修改缓存）"""
+        hops = [[reserve_in, reserve_out] for reserve_in, reserve_out, _ in self._path_reserves(path)]
+        results = []
+        for _ in range(count):
+            amount = amount_in
+            for hop in hops:
+                amount_out = get_amount_out(amount, hop[0], hop[1], self.fee_bps)
+                hop[0] += amount
+                hop[1] -= amount_out
+                amount = amount_out
+            results.append(amount)
+        return results
+
+    def quote_many(self, amounts_in, path):
+        """同一组储备量下批量报价多个输入数量，用于仓位大小选择"""
+        hops = self._path_reserves(path)
+        results = []
+        for amount in amounts_in:
+            for reserve_in, reserve_out, _ in hops:
+                amount = get_amount_out(amount, reserve_in, reserve_out, self.fee_bps)
+            results.append(amount)
+        return results
@@ -0,0 +1,247 @@
+"""JSON-RPC 录制与回放
+
+RecordingProvider 包在真正的provider外面，把每个请求/批量请求和响应连同耗时追加到录制文件（JSON lines，
+文件名以 .gz 结尾时gzip压缩）；ReplayProvider 从录制文件返回响应，按原始耗时 × latency_scale 等待
+（0 为不等待）。这样可以离线用 cProfile/py-spy 分析一次真实运行，或在相同的节点响应下比较引擎改动。
+
+用法: python recorder.py session.jsonl.gz   # 按方法汇总录制文件中的请求数和耗时
+"""
+import sys
+import gzip
+import json
+import time
+import threading
+from collections import defaultdict
+from web3._utils.encoding import Web3JsonEncoder
+from web3.providers.base import JSONBaseProvider
+from provider import EndpointUnavailable
+
+
+def _open(path, mode):
+    if path.endswith('.gz'):
+        return gzip.open(path, mode + 't', encoding='utf-8')
+    return open(path, mode, encoding='utf-8')
+
+
+def _params_key(method, params):
+    """请求的规范化键：参数按JSON排序序列化，录制和回放时一致"""
+    return method, json.dumps(params, cls=Web3JsonEncoder, sort_keys=True, separators=(',', ':'))
+
+
+class RpcRecorder:
+    """录制文件写入器，多个 RecordingProvider（查询节点、广播节点）共用一个文件
+
+    每行一个请求：{"t": 相对开始的秒数, "ms": 耗时, "m": 方法, "p": 参数, "r": 响应}；
+    批量请求为 {"t", "ms", "b": [[方法, 参数], ...], "r": [响应, ...]}；
+    请求抛出异常（连接失败、超时）时以 "e" 记录异常信息代替 "r"。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = _open(path, 'a')
+        self._started = time.perf_counter()
+
+    def write(self, start, seconds, record):
+        record = dict(record, t=round(start - self._started, 6), ms=round(seconds * 1000, 3))
+        line = json.dumps(record, cls=Web3JsonEncoder, separators=(',', ':'))
+        with self._lock:
+            if self._file is not None:
+                self._file.write(line + '\n')
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+class RecordingProvider(JSONBaseProvider):
+    """provider中间层：把请求和响应写入 RpcRecorder，行为与被包装的provider完全相同"""
+
+    def __init__(self, provider, recorder):
+        super().__init__()
+        self.provider = provider
+        self.recorder = recorder
+
+    def __getattr__(self, name):
+        if name == 'provider':
+            raise AttributeError(name)
+        return getattr(self.provider, name)
+
+    def __str__(self):
+        return f"Recording {self.provider}"
+
+    def make_request(self, method, params):
+        start = time.perf_counter()
+        try:
+            response = self.provider.make_request(method, params)
+        except Exception as e:
+            self.recorder.write(start, time.perf_counter() - start, {'m': method, 'p': params, 'e': str(e)})
+            raise
+        self.recorder.write(start, time.perf_counter() - start, {'m': method, 'p': params, 'r': response})
+        return response
+
+    def make_batch_request(self, batch_requests):
+        start = time.perf_counter()
+        batch = [[method, params] for method, params in batch_requests]
+        try:
+            responses = self.provider.make_batch_request(batch_requests)
+        except Exception as e:
+            self.recorder.write(start, time.perf_counter() - start, {'b': batch, 'e': str(e)})
+            raise
+        self.recorder.write(start, time.perf_counter() - start, {'b': batch, 'r': responses})
+        return responses
+
+
+class RpcLog:
+    """已加载的录制文件，供一个或多个 ReplayProvider 共用
+
+    批量请求拆成单个调用，每个调用带上整批的耗时。每条记录只回放一次：
+    优先取方法和参数都相同的最早一条，参数不同（如签名交易中的deadline变化）时按录制顺序取
+    同一方法的下一条；同一方法的记录用完后重复返回最后一条（如轮询区块高度的次数多于录制时）。
+    """
+
+    def __init__(self, path):
+        self._lock = threading.Lock()
+        self._entries = []                  # (键, 响应或None, 异常信息或None, 耗时毫秒)
+        self._by_key = defaultdict(list)    # (方法, 参数) -> 条目序号
+        self._by_method = defaultdict(list)  # 方法 -> 条目序号
+        self._used = set()
+        self._cursor = defaultdict(int)     # 方法 -> _by_method 中下一个可能未使用的位置
+        with _open(path, 'r') as file:
+            for line in file:
+                if line.strip():
+                    self._add(json.loads(line))
+
+    def _add(self, record):
+        if 'b' in record:
+            calls = record['b']
+            responses = record.get('r') if isinstance(record.get('r'), list) else [None] * len(calls)
+            if len(responses) != len(calls):
+                # 节点拒绝了整个批量请求，回放时同样拒绝
+                responses = [None] * len(calls)
+            error = record.get('e') or (None if isinstance(record.get('r'), list) else '批量请求被拒绝')
+            for (method, params), response in zip(calls, responses):
+                self._append(method, params, response, error if response is None else None, record['ms'])
+        else:
+            self._append(record['m'], record['p'], record.get('r'), record.get('e'), record['ms'])
+
+    def _append(self, method, params, response, error, ms):
+        key = _params_key(method, params)
+        index = len(self._entries)
+        self._entries.append((key, response, error, ms))
+        self._by_key[key].append(index)
+        self._by_method[method].append(index)
+
+    def take(self, method, params):
+        """取一条用于回放的记录：(响应, 异常信息, 耗时毫秒)；该方法没有任何记录时返回None"""
+        key = _params_key(method, params)
+        with self._lock:
+            index = next((i for i in self._by_key.get(key, ()) if i not in self._used), None)
+            if index is None:
+                indexes = self._by_method.get(method)
+                if not indexes:
+                    return None
+                cursor = self._cursor[method]
+                while cursor < len(indexes) and indexes[cursor] in self._used:
+                    cursor += 1
+                self._cursor[method] = cursor
+                index = indexes[cursor] if cursor < len(indexes) else indexes[-1]
+            self._used.add(index)
+            _, response, error, ms = self._entries[index]
+            return response, error, ms
+
+    def remaining(self):
+        """尚未回放的记录数"""
+        with self._lock:
+            return len(self._entries) - len(self._used)
+
+
+class ReplayProvider(JSONBaseProvider):
+    """从录制文件回放响应的provider，不连接任何节点
+
+    latency_scale 为回放耗时相对录制时的比例：1 按原始耗时等待，0 不等待（用于profiling）。
+    响应的 id 改写为本次请求的 id；没有录制的方法返回 JSON-RPC 错误。
+    """
+
+    def __init__(self, log, latency_scale=1.0, endpoint_uri='replay'):
+        super().__init__()
+        self.log = log
+        self.latency_scale = latency_scale
+        self.endpoint_uri = endpoint_uri
+
+    def __str__(self):
+        return f"Replay RPC {self.endpoint_uri}"
+
+    def _wait(self, start, ms):
+        remaining = ms / 1000 * self.latency_scale - (time.perf_counter() - start)
+        if remaining > 0:
+            time.sleep(remaining)
+
+    def _replay(self, method, params, request_id):
+        entry = self.log.take(method, params)
+        if entry is None:
+            return {'jsonrpc': '2.0', 'id': request_id, 'error': {'code': -32601, 'message': f"回放文件中没有 {method} 的记录"}}, None, 0
+        response, error, ms = entry
+        if response is not None:
+            response = dict(response, id=request_id)
+        return response, error, ms
+
+    def make_request(self, method, params):
+        start = time.perf_counter()
+        response, error, ms = self._replay(method, params, next(self.request_counter))
+        self._wait(start, ms)
+        if response is None:
+            raise EndpointUnavailable(error)
+        return response
+
+    def make_batch_request(self, batch_requests):
+        start = time.perf_counter()
+        responses, errors, batch_ms = [], [], 0
+        for method, params in batch_requests:
+            response, error, ms = self._replay(method, params, next(self.request_counter))
+            responses.append(response)
+            errors.append(error)
+            batch_ms = max(batch_ms, ms)
+        self._wait(start, batch_ms)
+        if any(response is None for response in responses):
+            raise EndpointUnavailable(next(error for error in errors if error))
+        return responses
+
+    def close(self):
+        pass
+
+
+def summarize(path):
+    """按方法统计录制文件：{方法: (请求数, 总耗时毫秒)}，批量请求另计为 batch"""
+    stats = defaultdict(lambda: [0, 0.0])
+    with _open(path, 'r') as file:
+        for line in file:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            methods = [method for method, _ in record['b']] if 'b' in record else [record['m']]
+            if 'b' in record:
+                stats['batch'][0] += 1
+                stats['batch'][1] += record['ms']
+            for method in methods:
+                stats[method][0] += 1
+                if 'b' not in record:
+                    stats[method][1] += record['ms']
+    return {method: tuple(values) for method, values in stats.items()}
+
+
+def main():
+    if len(sys.argv) < 2:
+        print("用法: python recorder.py 录制文件")
+        return 1
+    stats = summarize(sys.argv[1])
+    print(f"{'方法':<32}{'请求数':>8}{'总耗时ms':>12}{'平均ms':>10}")
+    for method, (count, ms) in sorted(stats.items(), key=lambda item: -item[1][1]):
+        print(f"{method:<32}{count:>8}{ms:>12.1f}{ms / count if ms else 0:>10.2f}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
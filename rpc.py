@@ -0,0 +1,156 @@
+import logging
+from hexbytes import HexBytes
+from web3 import Web3
+from web3.datastructures import AttributeDict
+
+# 不支持批量请求的provider（按id记录，避免每次都先失败一次）
+_NO_BATCH_PROVIDERS = set()
+# 批量请求整体被拒绝时表示不支持批量的错误码：invalid request / method not found
+_NO_BATCH_ERROR_CODES = (-32600, -32601)
+# 逐个请求时连接失败、超时等传输错误的响应字段：与节点返回的 error（如执行回滚）区分，值为异常信息
+TRANSPORT_ERROR = 'transport_error'
+
+# 回执/日志中需要转换为整数的字段
+_RECEIPT_INT_FIELDS = (
+    'blockNumber', 'status', 'gasUsed', 'cumulativeGasUsed',
+    'effectiveGasPrice', 'transactionIndex', 'type',
+)
+_RECEIPT_HASH_FIELDS = ('transactionHash', 'blockHash')
+_RECEIPT_ADDRESS_FIELDS = ('from', 'to', 'contractAddress')
+_LOG_INT_FIELDS = ('blockNumber', 'logIndex', 'transactionIndex')
+_LOG_HASH_FIELDS = ('transactionHash', 'blockHash')
+
+
+def to_int(value):
+    """JSON-RPC返回的十六进制数量转为int（已是int则原样返回）"""
+    if value is None or isinstance(value, int):
+        return value
+    return int(value, 16)
+
+
+def tx_hash_key(tx_hash):
+    """统一交易哈希格式：0x开头的小写十六进制字符串"""
+    return Web3.to_hex(HexBytes(tx_hash)).lower()
+
+
+def batch_request(w3, calls):
+    """把多个 (method, params) 合并为一次JSON-RPC批量请求
+
+    返回与calls顺序一致的result列表；单个请求出错或结果为空时对应位置为None。
+    批量请求失败时本次退化为逐个请求；节点明确不支持批量请求时之后都逐个请求。
+    """
+    return [resp.get('result') if isinstance(resp, dict) else None for resp in batch_responses(w3, calls)]
+
+
+def _batch_unsupported(response, calls):
+    """节点明确表示不支持批量请求：返回单个错误对象而不是响应列表，或列表中只有一个 invalid request / method not found 错误"""
+    if isinstance(response, dict):
+        return 'error' in response
+    if isinstance(response, list) and len(response) == 1 < len(calls) and isinstance(response[0], dict):
+        error = response[0].get('error')
+        return isinstance(error, dict) and error.get('code') in _NO_BATCH_ERROR_CODES
+    return False
+
+
+def _accept_batch(provider, calls, response):
+    """检查批量响应：完整时原样返回；否则返回None由调用方本次逐个请求，只有明确不支持批量时才记住该provider"""
+    if isinstance(response, list) and len(response) == len(calls):
+        return response
+    if _batch_unsupported(response, calls):
+        logging.debug("节点不支持批量请求，之后改为逐个请求")
+        _NO_BATCH_PROVIDERS.add(id(provider))
+    else:
+        logging.debug("批量响应不完整，本次退化为逐个请求")
+    return None
+
+
+def batch_responses(w3, calls):
+    """与 batch_request 相同，但返回完整的响应字典（含 error），用于需要错误详情的调用如 eth_call 回滚原因
+
+    请求没有到达节点或没有响应（连接失败、超时）时，对应位置为 {TRANSPORT_ERROR: 异常信息}，没有 error 字段。
+    """
+    if not calls:
+        return []
+
+    provider = w3.provider
+    responses = None
+    if id(provider) not in _NO_BATCH_PROVIDERS and hasattr(provider, 'make_batch_request'):
+        try:
+            responses = _accept_batch(provider, calls, provider.make_batch_request(list(calls)))
+        except NotImplementedError:
+            _NO_BATCH_PROVIDERS.add(id(provider))
+        except Exception as e:
+            # 超时、限流等临时错误：只有这一次退化为逐个请求
+            logging.debug(f"批量请求失败，本次退化为逐个请求: {str(e)[:50]}")
+
+    if responses is None:
+        responses = []
+        for method, params in calls:
+            try:
+                responses.append(provider.make_request(method, params))
+            except Exception as e:
+                logging.debug(f"{method} 请求失败: {str(e)[:50]}")
+                responses.append({TRANSPORT_ERROR: str(e)})
+
+    return [resp if isinstance(resp, dict) else {} for resp in responses]
+
+
+async def async_batch_request(w3, calls):
+    """batch_request 的异步版本，用于 AsyncWeb3"""
+    if not calls:
+        return []
+
+    provider = w3.provider
+    responses = None
+    if id(provider) not in _NO_BATCH_PROVIDERS and hasattr(provider, 'make_batch_request'):
+        try:
+            responses = _accept_batch(provider, calls, await provider.make_batch_request(list(calls)))
+        except NotImplementedError:
+            _NO_BATCH_PROVIDERS.add(id(provider))
+        except Exception as e:
+            logging.debug(f"批量请求失败，本次退化为逐个请求: {str(e)[:50]}")
+
+    if responses is None:
+        responses = []
+        for method, params in calls:
+            try:
+                responses.append(await provider.make_request(method, params))
+            except Exception as e:
+                logging.debug(f"{method} 请求失败: {str(e)[:50]}")
+                responses.append({TRANSPORT_ERROR: str(e)})
+
+    return [resp.get('result') if isinstance(resp, dict) else None for resp in responses]
+
+
+def format_log(raw_log):
+    """原始日志转为与web3格式一致的AttributeDict"""
+    log = dict(raw_log)
+    for field in _LOG_INT_FIELDS:
+        if field in log:
+            log[field] = to_int(log[field])
+    for field in _LOG_HASH_FIELDS:
+        if log.get(field) is not None:
+            log[field] = HexBytes(log[field])
+    if log.get('address'):
+        log['address'] = Web3.to_checksum_address(log['address'])
+    log['topics'] = [HexBytes(topic) for topic in log.get('topics', [])]
+    log['data'] = HexBytes(log.get('data') or '0x')
+    return AttributeDict(log)
+
+
+def format_receipt(raw_receipt):
+    """原始交易回执转为与 w3.eth.get_transaction_receipt 一致的格式"""
+    if raw_receipt is None:
+        return None
+    receipt = dict(raw_receipt)
+    for field in _RECEIPT_INT_FIELDS:
+        if field in receipt:
+            receipt[field] = to_int(receipt[field])
+    for field in _RECEIPT_HASH_FIELDS:
+        if receipt.get(field) is not None:
+            receipt[field] = HexBytes(receipt[field])
+    for field in _RECEIPT_ADDRESS_FIELDS:
+        if receipt.get(field):
+            receipt[field] = Web3.to_checksum_address(receipt[field])
+    receipt['logs'] = [format_log(log) for log in receipt.get('logs', [])]
+    return AttributeDict(receipt)
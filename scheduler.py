@@ -0,0 +1,40 @@
+import logging
+from web3.datastructures import AttributeDict
+
+
+class BatchPlanner:
+    """批量轮次规划器
+
+    根据本地状态（钱包A代币余额、钱包B的BNB余额、在途交易数）一次规划 K 轮 transferFrom+swap，
+    这些交易按nonce顺序连续发送，争取打包进同一个或相邻的几个区块。
+    K 同时受以下限制：每批最多轮数、每批gas预算（gas上限之和）、最大在途交易数、
+    剩余循环数、钱包A余额可转出的轮数、钱包B的BNB可支付的最高费用。
+    """
+
+    def __init__(self, max_rounds=1, gas_budget=None, max_in_flight=16):
+        self.max_rounds = max(1, max_rounds)
+        self.gas_budget = gas_budget
+        self.max_in_flight = max_in_flight
+
+    def plan(self, loops_left, round_gas, round_cost, txs_per_round=2,
+             extra_gas=0, extra_cost=0, extra_txs=0,
+             source_balance=None, amount=None, bnb_balance=None, in_flight=0):
+        """返回 AttributeDict(rounds, limit)，limit 为决定轮数的限制条件
+
+        extra_* 为本批额外发送的交易（如批准）占用的gas、费用和笔数；
+        余额为None时不检查对应限制。至少返回1轮，余额不足等错误交给交易本身暴露。
+        """
+        limits = {'batch_size': self.max_rounds, 'loops': loops_left}
+        if self.gas_budget:
+            limits['gas_budget'] = (self.gas_budget - extra_gas) // round_gas
+        if self.max_in_flight:
+            limits['in_flight'] = (self.max_in_flight - in_flight - extra_txs) // txs_per_round
+        if source_balance is not None and amount:
+            limits['source_balance'] = source_balance // amount
+        if bnb_balance is not None and round_cost:
+            limits['bnb_balance'] = (bnb_balance - extra_cost) // round_cost
+        limit = min(limits, key=limits.get)
+        rounds = max(1, min(limits.values()))
+        if rounds < self.max_rounds and limit not in ('batch_size', 'loops'):
+            logging.info(f"本批轮数受 {limit} 限制: {rounds}/{self.max_rounds}")
+        return AttributeDict({'rounds': rounds, 'limit': limit})
@@ -0,0 +1,138 @@
+import threading
+from collections import defaultdict, deque
+from eth_abi import decode
+from hexbytes import HexBytes
+from web3 import Web3
+from web3.datastructures import AttributeDict
+from rpc import TRANSPORT_ERROR, batch_responses, to_int
+
+# 回滚数据的选择器：Error(string) 和 Panic(uint256)
+ERROR_SELECTOR = '0x08c379a0'
+PANIC_SELECTOR = '0x4e487b71'
+
+# Panic 错误码（Solidity 0.8）
+PANIC_CODES = {
+    0x01: 'assert失败',
+    0x11: '算术溢出',
+    0x12: '除以零',
+    0x21: '枚举转换越界',
+    0x32: '数组越界',
+    0x41: '内存分配过大',
+}
+
+
+def decode_revert(data=None, message=None):
+    """解析回滚原因：Error(string) 返回字符串，Panic(uint256) 返回错误码说明，
+    自定义错误返回选择器；没有回滚数据时从节点错误信息中截取 "execution reverted: " 之后的部分"""
+    if isinstance(data, dict):
+        # 部分节点把回滚数据再包一层 {'data': ...}
+        data = data.get('data')
+    if isinstance(data, str) and data.startswith('0x') and len(data) >= 10:
+        raw = bytes(HexBytes(data))
+        selector = '0x' + raw[:4].hex()
+        try:
+            if selector == ERROR_SELECTOR:
+                return decode(['string'], raw[4:])[0]
+            if selector == PANIC_SELECTOR:
+                code = decode(['uint256'], raw[4:])[0]
+                return f"Panic({PANIC_CODES.get(code, hex(code))})"
+        except Exception:
+            pass
+        return f"自定义错误 {selector}"
+    if message:
+        prefix = 'execution reverted'
+        if message.startswith(prefix):
+            return message[len(prefix):].lstrip(': ') or '无回滚原因'
+        return message
+    return '无回滚原因'
+
+
+class GasMeter:
+    """按交易名称记录节点的gas估算值，只保留最近 samples 个
+
+    gas上限取估算值中的最大值乘以 margin，替代固定的gas上限；还没有估算值时使用默认上限。
+    回执中的实际gasUsed已扣除存储清零等退款，比执行所需的gas少，不能用来设置上限。
+    """
+
+    def __init__(self, margin=1.2, samples=20):
+        self.margin = margin
+        self._lock = threading.Lock()
+        self._gas = defaultdict(lambda: deque(maxlen=samples))  # 交易名称 -> 最近的gas测量值
+
+    def observe(self, name, gas):
+        with self._lock:
+            self._gas[name].append(gas)
+
+    def gas_limit(self, name, default):
+        """测量得到的gas上限，没有测量值时返回 default"""
+        with self._lock:
+            samples = self._gas.get(name)
+            if not samples:
+                return default
+            return int(max(samples) * self.margin)
+
+
+class Simulator:
+    """广播前的预执行
+
+    每笔交易同时发 pending 区块上的 eth_call 和 eth_estimateGas（一次批量请求），
+    回滚时解析原因（如 TRANSFER_FROM_FAILED、INSUFFICIENT_OUTPUT_AMOUNT），交易不发出、不花gas。
+    成功的gas估算记入 gas_meter。
+    """
+
+    def __init__(self, w3, sender, gas_meter=None):
+        self.w3 = w3
+        self.sender = Web3.to_checksum_address(sender)
+        self.gas_meter = gas_meter or GasMeter()
+
+    def simulate(self, name, to, data, value=0, block_identifier='pending'):
+        """预执行一笔交易，返回 AttributeDict(ok, reason, gas)
+
+        reason 为解析出的回滚原因（成功时为None），gas 为节点估算的gas（失败时为None）。
+        请求没有得到节点响应（超时、连接失败）时 ok 为None、reason 为传输错误信息：无法判断是否会回滚。
+        """
+        return self.simulate_many([(name, to, data, value)], block_identifier)[0]
+
+    def simulate_many(self, txs, block_identifier='pending'):
+        """一次批量请求预执行多笔互不依赖的交易 [(name, to, data, value)]，按顺序返回结果"""
+        calls = []
+        for name, to, data, value in txs:
+            tx = self._call_params(to, data, value)
+            calls.append(('eth_call', [tx, block_identifier]))
+            # 不带区块参数，部分节点的 eth_estimateGas 不支持 pending
+            calls.append(('eth_estimateGas', [tx]))
+        responses = batch_responses(self.w3, calls)
+        results = []
+        for i, (name, to, data, value) in enumerate(txs):
+            call, estimate = responses[2 * i], responses[2 * i + 1]
+            if TRANSPORT_ERROR in call:
+                results.append(AttributeDict({'ok': None, 'reason': call[TRANSPORT_ERROR], 'gas': None}))
+                continue
+            error = call.get('error')
+            if error:
+                reason = decode_revert(error.get('data'), error.get('message'))
+                results.append(AttributeDict({'ok': False, 'reason': reason, 'gas': None}))
+                continue
+            # eth_call 成功时以它为准；估算失败（如节点不支持）只是没有gas测量值
+            gas = to_int(estimate.get('result'))
+            if gas:
+                self.gas_meter.observe(name, gas)
+            results.append(AttributeDict({'ok': True, 'reason': None, 'gas': gas}))
+        return results
+
+    def revert_reason(self, to, data, block_identifier):
+        """重放一笔已失败的交易，返回回滚原因（重放成功时返回None）"""
+        tx = self._call_params(to, data)
+        response = batch_responses(self.w3, [('eth_call', [tx, block_identifier])])[0]
+        if TRANSPORT_ERROR in response:
+            raise ConnectionError(response[TRANSPORT_ERROR])
+        error = response.get('error')
+        if not error:
+            return None
+        return decode_revert(error.get('data'), error.get('message'))
+
+    def _call_params(self, to, data, value=0):
+        tx = {'from': self.sender, 'to': Web3.to_checksum_address(HexBytes(to)), 'data': Web3.to_hex(HexBytes(data))}
+        if value:
+            tx['value'] = hex(value)
+        return tx
@@ -0,0 +1,185 @@
+import logging
+from eth_abi import decode, encode
+from hexbytes import HexBytes
+from web3 import Web3
+from web3.datastructures import AttributeDict
+from rpc import batch_request, to_int
+
+# Multicall3 在BSC等主流链上的统一部署地址
+MULTICALL3_ADDRESS = '0xcA11bde05977b3631167028862bE2a173976CA11'
+# 合约地址上有代码但连续失败这么多次后，不再尝试Multicall3
+MULTICALL_MAX_FAILURES = 3
+
+
+def function_selector(signature):
+    """函数签名的4字节选择器，如 'balanceOf(address)'"""
+    return bytes(Web3.keccak(text=signature)[:4])
+
+
+def _input_types(signature):
+    args = signature[signature.index('(') + 1:-1]
+    return [t for t in args.split(',') if t]
+
+
+def encode_call(signature, args):
+    """编码合约调用数据：选择器 + ABI编码参数"""
+    return function_selector(signature) + encode(_input_types(signature), list(args))
+
+
+_AGGREGATE3 = 'aggregate3((address,bool,bytes)[])'
+_GET_ETH_BALANCE = 'getEthBalance(address)'
+_GET_BLOCK_NUMBER = 'getBlockNumber()'
+
+
+class ContractRead:
+    """一次只读合约调用：key为快照中的字段名，output_types为返回值类型"""
+
+    def __init__(self, key, target, signature, args=(), output_types=('uint256',)):
+        self.key = key
+        self.target = Web3.to_checksum_address(target)
+        self.signature = signature
+        self.calldata = encode_call(signature, args)
+        self.output_types = list(output_types)
+
+    def decode(self, data):
+        values = decode(self.output_types, bytes(data))
+        return values[0] if len(values) == 1 else values
+
+
+def encode_aggregate3(multicall_address, calls, eth_balances=()):
+    """编码 aggregate3 调用：合约读取 + getEthBalance + 末尾的 getBlockNumber"""
+    multicall_address = Web3.to_checksum_address(multicall_address)
+    entries = [(call.target, True, call.calldata) for call in calls]
+    entries += [(multicall_address, True, encode_call(_GET_ETH_BALANCE, [address]))
+                for _, address in eth_balances]
+    entries.append((multicall_address, True, encode_call(_GET_BLOCK_NUMBER, [])))
+    return function_selector(_AGGREGATE3) + encode(['(address,bool,bytes)[]'], [entries])
+
+
+def _safe_decode(call, data):
+    if data is None:
+        return None
+    try:
+        return call.decode(HexBytes(data))
+    except Exception:
+        return None
+
+
+def decode_aggregate3(raw_result, calls, eth_balances=()):
+    """解码 aggregate3 返回值为 {key: value}，失败的调用为None"""
+    (results,) = decode(['(bool,bytes)[]'], bytes(HexBytes(raw_result)))
+    values = {}
+    for call, (success, data) in zip(calls, results):
+        values[call.key] = _safe_decode(call, data) if success else None
+    for (key, _), (success, data) in zip(eth_balances, results[len(calls):]):
+        values[key] = decode(['uint256'], data)[0] if success else None
+    success, data = results[-1]
+    values['block_number'] = decode(['uint256'], data)[0] if success else None
+    return values
+
+
+class StateReader:
+    """状态快照读取器
+
+    所有合约读取（含BNB余额与区块号）合并为一次 Multicall3 aggregate3，保证取自同一区块；
+    该调用与 nonce、gas价格一起放进一次JSON-RPC批量请求，一个往返拿到全部状态。
+    链上没有Multicall3（地址上没有合约代码）时退化为批量的独立 eth_call；
+    有代码时的调用失败视为临时错误，只有这一次改用独立 eth_call，连续失败 MULTICALL_MAX_FAILURES 次才不再使用。
+    """
+
+    def __init__(self, w3, multicall_address=MULTICALL3_ADDRESS):
+        self.w3 = w3
+        self.multicall_address = Web3.to_checksum_address(multicall_address)
+        self.multicall_supported = True
+        self._multicall_failures = 0
+        self._chain_id = None
+
+    @property
+    def chain_id(self):
+        """chain id不会变化，只查询一次"""
+        if self._chain_id is None:
+            self._chain_id = self.w3.eth.chain_id
+        return self._chain_id
+
+    def read(self, calls=(), eth_balances=(), nonce_of=None, gas_price=False, block_identifier='latest'):
+        """读取一次状态快照
+
+        calls: ContractRead 列表；eth_balances: [(key, address)]，读取BNB余额；
+        nonce_of: 读取该地址的pending nonce（字段 nonce）；gas_price: 是否读取 gas_price。
+        返回 AttributeDict，读取失败的字段为None，block_number 为快照所在区块。
+        """
+        return self._read(calls, eth_balances, nonce_of, gas_price, block_identifier, self.multicall_supported)
+
+    def _multicall_failed(self):
+        """Multicall3调用失败：地址上没有合约代码，或连续失败次数过多时不再使用"""
+        self._multicall_failures += 1
+        try:
+            missing = len(self.w3.eth.get_code(self.multicall_address)) == 0
+        except Exception as e:
+            logging.debug(f"查询Multicall3合约代码失败: {str(e)[:50]}")
+            missing = False
+        if missing or self._multicall_failures >= MULTICALL_MAX_FAILURES:
+            self.multicall_supported = False
+            reason = "链上没有Multicall3" if missing else f"Multicall3连续 {self._multicall_failures} 次调用失败"
+            logging.warning(f"{reason}，之后改用独立eth_call读取状态")
+        else:
+            logging.warning("Multicall3调用失败，本次改用独立eth_call读取状态")
+
+    def _read(self, calls, eth_balances, nonce_of, gas_price, block_identifier, multicall):
+        calls = list(calls)
+        eth_balances = [(key, Web3.to_checksum_address(address)) for key, address in eth_balances]
+        block_tag = hex(block_identifier) if isinstance(block_identifier, int) else block_identifier
+
+        rpc_calls = []
+        if multicall and (calls or eth_balances):
+            rpc_calls.append(('eth_call', [{
+                'to': self.multicall_address,
+                'data': Web3.to_hex(encode_aggregate3(self.multicall_address, calls, eth_balances)),
+            }, block_tag]))
+        elif calls or eth_balances:
+            for call in calls:
+                rpc_calls.append(('eth_call', [{'to': call.target, 'data': Web3.to_hex(call.calldata)}, block_tag]))
+            for _, address in eth_balances:
+                rpc_calls.append(('eth_getBalance', [address, block_tag]))
+            # 指定区块号时快照就在该区块；eth_blockNumber 只能给出 latest 的区块号
+            if block_identifier == 'latest':
+                rpc_calls.append(('eth_blockNumber', []))
+        if nonce_of is not None:
+            rpc_calls.append(('eth_getTransactionCount', [Web3.to_checksum_address(nonce_of), 'pending']))
+        if gas_price:
+            rpc_calls.append(('eth_gasPrice', []))
+        if self._chain_id is None:
+            rpc_calls.append(('eth_chainId', []))
+
+        results = batch_request(self.w3, rpc_calls)
+
+        if self._chain_id is None:
+            chain_id = results.pop()
+            if chain_id is not None:
+                self._chain_id = to_int(chain_id)
+        snapshot = {'block_number': None}
+        if gas_price:
+            snapshot['gas_price'] = to_int(results.pop())
+        if nonce_of is not None:
+            snapshot['nonce'] = to_int(results.pop())
+
+        if calls or eth_balances:
+            if multicall:
+                if results[0] is None:
+                    # Multicall3调用失败，改用独立eth_call重新读取
+                    self._multicall_failed()
+                    retry = self._read(calls, eth_balances, None, False, block_identifier, False)
+                    snapshot.update({k: v for k, v in retry.items() if k not in snapshot or snapshot[k] is None})
+                    return AttributeDict(snapshot)
+                self._multicall_failures = 0
+                snapshot.update(decode_aggregate3(results[0], calls, eth_balances))
+            else:
+                for call, result in zip(calls, results):
+                    snapshot[call.key] = _safe_decode(call, result)
+                for (key, _), result in zip(eth_balances, results[len(calls):]):
+                    snapshot[key] = to_int(result)
+                if isinstance(block_identifier, int):
+                    snapshot['block_number'] = block_identifier
+                elif block_identifier == 'latest':
+                    snapshot['block_number'] = to_int(results[len(calls) + len(eth_balances)])
+        return AttributeDict(snapshot)
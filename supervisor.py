@@ -0,0 +1,156 @@
+"""多进程运行多组 钱包A/钱包B 的 tas.py 循环，共用一个协调器
+
+用法: python supervisor.py pairs.json [--workers N] [--listen host:port]
+      python supervisor.py --serve --listen 0.0.0.0:7070   # 只运行协调器，供其他机器上的 tas.py 连接
+
+配置文件格式见 pairs.example.json。每组钱包在独立进程中运行 tas.py（签名和RPC各用一个CPU核），
+配置项按同名环境变量传入（如 token_amount → TOKEN_AMOUNT），未给出的沿用 .env 中的设置。
+协调器在本进程中运行，所有工作进程通过本地socket向它分配nonce、获取gas费用和区块高度，
+gas价格和区块高度只查询一次节点。每组必须使用不同的钱包B：授权额度、余额账本和交易日志都在各自进程中，
+多个进程共用一个钱包B时会互相覆盖授权额度，因此配置中重复的钱包B会被拒绝。
+其他机器上的 tas.py 设置 COORDINATOR=host:port 和相同的 COORDINATOR_AUTHKEY 即可加入（同样不能与其他进程共用钱包B）。
+"""
+import os
+import sys
+import json
+import time
+import secrets
+import logging
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dotenv import load_dotenv
+from web3 import Web3
+from eth_account import Account
+from notifier import BlockNotifier
+from gas_oracle import GasOracle, strategy_from_config
+from provider import build_provider
+from coordinator import Coordinator, parse_address, serve
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s | %(message)s',
+    datefmt='%H:%M:%S'
+)
+
+load_dotenv()
+
+# 配置项与 tas.py 环境变量名不一致的（与 async_engine.py 的配置文件兼容）
+ENV_ALIASES = {
+    'router': 'PANCAKESWAP_ROUTER_ADDRESS',
+    'wbnb': 'WBNB_ADDRESS',
+}
+# 只由 supervisor 使用、不传给工作进程的配置项
+SKIPPED_KEYS = {'name', 'pairs', 'pool_size', 'private_key_env'}
+
+
+def optional_float(name):
+    return float(os.getenv(name)) if os.getenv(name) else None
+
+
+def create_coordinator():
+    """按 .env 中与 tas.py 相同的设置创建协调器（节点、区块通知器和gas策略）"""
+    rpc_urls = [url.strip() for url in os.getenv('RPC_URLS', os.getenv('RPC_URL', 'https://bsc-dataseed.binance.org/')).split(',') if url.strip()]
+    w3 = Web3(build_provider(rpc_urls, pool_size=int(os.getenv('RPC_POOL_SIZE', '20')),
+                             timeout=float(os.getenv('RPC_TIMEOUT', '10'))))
+    notifier = BlockNotifier(w3, os.getenv('WS_URL'))
+    gas_oracle = GasOracle(w3, strategy_from_config(
+        os.getenv('GAS_STRATEGY', 'legacy'),
+        multiplier=float(os.getenv('GAS_PRICE_MULTIPLIER', '1.0')),
+        percentile=int(os.getenv('PRIORITY_FEE_PERCENTILE', '50')),
+        fixed_gwei=optional_float('GAS_PRICE_FIXED_GWEI'),
+        floor_gwei=optional_float('GAS_PRICE_FLOOR_GWEI'),
+        ceiling_gwei=optional_float('GAS_PRICE_CEILING_GWEI'),
+    ), notifier)
+    return Coordinator(w3, notifier, gas_oracle)
+
+
+def pair_env(config, pair, coordinator_address, authkey):
+    """一组钱包的工作进程环境变量"""
+    env = {}
+    for key, value in list(config.items()) + list(pair.items()):
+        if key in SKIPPED_KEYS or value is None:
+            continue
+        env[ENV_ALIASES.get(key, key.upper())] = str(value)
+    if pair.get('private_key_env'):
+        env['PRIVATE_KEY'] = os.getenv(pair['private_key_env'], '')
+    if not env.get('PRIVATE_KEY'):
+        raise ValueError(f"钱包组 {pair.get('name')} 缺少 private_key / private_key_env")
+    # 每组单独的交易日志；指标端口只有配置了才导出，避免多个进程抢同一端口
+    env.setdefault('JOURNAL_FILE', f"tas_journal_{pair['name']}.db")
+    env.setdefault('METRICS_PORT', '')
+    env['COORDINATOR'] = f"{coordinator_address[0]}:{coordinator_address[1]}"
+    env['COORDINATOR_AUTHKEY'] = authkey
+    return env
+
+
+def check_distinct_wallets(envs):
+    """每个钱包B只能由一组使用，重复时抛出 ValueError"""
+    owners = {}
+    for name, env in envs:
+        address = Account.from_key(env['PRIVATE_KEY']).address
+        if address in owners:
+            raise ValueError(f"钱包组 {owners[address]} 和 {name} 使用了同一个钱包B {address}")
+        owners[address] = name
+
+
+def run_pair(name, env):
+    """工作进程入口：设置环境变量后导入并运行 tas.py"""
+    os.environ.update(env)
+    # 先于 tas.py 配置日志格式，输出中带上钱包组名称
+    logging.basicConfig(level=logging.INFO, format=f'%(asctime)s | [{name}] %(message)s', datefmt='%H:%M:%S', force=True)
+    import tas
+    tas.main()
+    return name
+
+
+def main():
+    parser = argparse.ArgumentParser(description='多进程运行多组钱包，共用nonce/gas/区块协调器')
+    parser.add_argument('config', nargs='?', default=os.getenv('PAIRS_CONFIG', 'pairs.json'), help='钱包组配置文件')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='最多同时运行的工作进程数')
+    parser.add_argument('--listen', default=os.getenv('COORDINATOR', '127.0.0.1:0'), help='协调器监听地址 host:port（端口0为自动分配）')
+    parser.add_argument('--serve', action='store_true', help='只运行协调器，不启动工作进程')
+    args = parser.parse_args()
+
+    authkey = os.getenv('COORDINATOR_AUTHKEY') or secrets.token_hex(16)
+    address = serve(create_coordinator(), parse_address(args.listen), authkey)
+    logging.info(f"协调器已启动: {address[0]}:{address[1]}")
+
+    if args.serve:
+        if not os.getenv('COORDINATOR_AUTHKEY'):
+            logging.info(f"COORDINATOR_AUTHKEY={authkey}")
+        try:
+            while True:
+                time.sleep(60)
+        except KeyboardInterrupt:
+            return 0
+
+    with open(args.config, 'r') as file:
+        config = json.loads(file.read())
+    pairs = config.get('pairs', [])
+    if address[0] in ('0.0.0.0', ''):
+        address = ('127.0.0.1', address[1])
+    envs = [(pair['name'], pair_env(config, pair, address, authkey)) for pair in pairs]
+    check_distinct_wallets(envs)
+
+    # spawn：每个进程重新导入 tas.py，不继承本进程的连接和线程；每个进程只运行一组
+    failed = 0
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=max(1, min(args.workers, len(envs))), mp_context=context,
+                             max_tasks_per_child=1) as executor:
+        futures = {executor.submit(run_pair, name, env): name for name, env in envs}
+        for future in as_completed(futures):
+            try:
+                future.result()
+                logging.info(f"钱包组 {futures[future]} 已结束")
+            except BaseException as e:
+                failed += 1
+                error_msg = str(e)
+                short_error = error_msg[:50] + '...' if len(error_msg) > 50 else error_msg
+                logging.error(f"钱包组 {futures[future]} 异常退出: {short_error}")
+    logging.info(f"全部结束 | 钱包组: {len(envs)} | 异常: {failed}")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
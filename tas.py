@@ -1,10 +1,31 @@
-import os
-import json
 import time
-import web3
+# 启动计时起点（在导入web3等依赖之前），用于统计启动到首次广播的耗时
+STARTED_AT = time.perf_counter()
+import os
+import atexit
 import logging
 from web3 import Web3
 from dotenv import load_dotenv
+from notifier import BlockNotifier
+from nonce_manager import NonceManager
+from snapshot import MULTICALL3_ADDRESS as DEFAULT_MULTICALL3_ADDRESS, ContractRead, StateReader
+from quoter import PairQuoter
+from tx_factory import TxFactory, deadline_after
+from gas_oracle import GWEI, FeeCeilingReached, GasOracle, fee_cap, scale_fees, strategy_from_config
+from provider import build_provider
+from broadcaster import Broadcaster
+from metrics import InstrumentedProvider, Metrics
+from broadcaster import BroadcastError
+from rpc import tx_hash_key
+from journal import DROPPED as JOURNAL_DROPPED, REJECTED, REPLACED as JOURNAL_REPLACED, TxJournal, tx_nonce
+from tracker import INCLUDED, REPLACED, InclusionTracker
+from allowance import AllowanceTracker
+from scheduler import BatchPlanner
+from simulator import GasMeter, Simulator
+from optimizer import TradeOptimizer, price_impact_bps
+from ledger import BalanceLedger
+from coordinator import CoordinatorStrategy, connect as connect_coordinator
+from recorder import RecordingProvider, ReplayProvider, RpcLog, RpcRecorder
 
 logging.basicConfig(
     level=logging.INFO,
@@ -12,23 +33,26 @@ logging.basicConfig(
     datefmt='%H:%M:%S'
 )
 
+IMPORTED_AT = time.perf_counter()
+
 # Load environment variables
 load_dotenv()
 
-# Load ABIs from files
-with open('./tokenabi.js', 'r') as file:
-    TOKEN_ABI = json.loads(file.read())
-
-with open('./swapabi.js', 'r') as file:
-    PANCAKESWAP_ABI = json.loads(file.read())
-
 # Configuration from environment variables
 RPC_URL = os.getenv('RPC_URL', 'https://bsc-dataseed.binance.org/') # BSC mainnet RPC
+RPC_URLS = [url.strip() for url in os.getenv('RPC_URLS', RPC_URL).split(',') if url.strip()] # 多个RPC节点（逗号分隔），自动故障切换
+RPC_POOL_SIZE = int(os.getenv('RPC_POOL_SIZE', '20'))  # 每个节点的长连接池大小
+RPC_TIMEOUT = float(os.getenv('RPC_TIMEOUT', '10'))  # 单个RPC请求读取超时（秒）
+RPC_HTTP2 = os.getenv('RPC_HTTP2', 'false').lower() in ('1', 'true', 'yes')  # 使用HTTP/2（需要安装 httpx[http2]）
+RPC_HEALTH_INTERVAL = float(os.getenv('RPC_HEALTH_INTERVAL', '10'))  # 多节点健康检查间隔（秒）
+BROADCAST_URLS = [url.strip() for url in os.getenv('BROADCAST_URLS', ','.join(RPC_URLS)).split(',') if url.strip()] # 广播交易的节点（逗号分隔），并发发送
+WS_URL = os.getenv('WS_URL') # 可选: WebSocket/IPC 节点地址，用于 newHeads 区块推送
 PRIVATE_KEY = os.getenv('PRIVATE_KEY') # Wallet B private key
 TOKEN_ADDRESS = os.getenv('TOKEN_ADDRESS') # ERC20 token contract address
 PANCAKESWAP_ROUTER_ADDRESS = os.getenv('PANCAKESWAP_ROUTER_ADDRESS', '0x10ED43C718714eb63d5aA57B78B54704E256024E') # PancakeSwap Router V2
 WBNB_ADDRESS = os.getenv('WBNB_ADDRESS', '0xbb4CdB9CBd36B01bD1cBaEBF2De08d9173bc095c') # WBNB address
 WALLET_A_ADDRESS = os.getenv('WALLET_A_ADDRESS') # Wallet A address
+MULTICALL3_ADDRESS = os.getenv('MULTICALL3_ADDRESS', DEFAULT_MULTICALL3_ADDRESS) # Multicall3 合约地址（BSC等主流链上相同）
 TOKEN_AMOUNT = os.getenv('TOKEN_AMOUNT', '100') # Amount to transfer (e.g., 100 tokens)
 TOKEN_DECIMALS = int(os.getenv('TOKEN_DECIMALS', '18'))
 DEADLINE_MINUTES = int(os.getenv('DEADLINE_MINUTES', '20'))
@@ -36,15 +60,68 @@ GAS_LIMIT_TRANSFER = int(os.getenv('GAS_LIMIT_TRANSFER', '100000'))
 GAS_LIMIT_APPROVE = int(os.getenv('GAS_LIMIT_APPROVE', '100000'))
 GAS_LIMIT_SWAP = int(os.getenv('GAS_LIMIT_SWAP', '300000'))
 
+# 预执行：广播前用 eth_call/eth_estimateGas 在pending区块上模拟交易，回滚的交易不发出
+# gas上限取预执行估算值的 GAS_LIMIT_MARGIN 倍，没有估算值时使用上面的默认值
+SIMULATE = os.getenv('SIMULATE', 'true').lower() in ('1', 'true', 'yes')
+GAS_LIMIT_MARGIN = float(os.getenv('GAS_LIMIT_MARGIN', '1.2'))
+
 # 循环次数和间隔
 LOOP_COUNT = int(os.getenv('LOOP_COUNT', '10'))  # 默认运行10次
 LOOP_INTERVAL = int(os.getenv('LOOP_INTERVAL', '2'))  # 每次循环间隔秒数
 
+# 流水线模式：approve → transferFrom → swap 连续签名发送，不等待前一笔确认
+PIPELINE = os.getenv('PIPELINE', 'true').lower() in ('1', 'true', 'yes')
+
+# 批量模式（仅流水线模式）：每批最多连续发送 BATCH_SIZE 轮 transferFrom+swap，争取一个区块打包多轮
+# BATCH_GAS_BUDGET 为每批交易gas上限之和的预算，MAX_IN_FLIGHT 为最多同时在途的交易数
+BATCH_SIZE = int(os.getenv('BATCH_SIZE', '1'))
+BATCH_GAS_BUDGET = int(os.getenv('BATCH_GAS_BUDGET', '10000000'))
+MAX_IN_FLIGHT = int(os.getenv('MAX_IN_FLIGHT', '16'))
+
 # 批准设置
 MAX_UINT256 = 2**256 - 1  # 无限批准金额
+# 授权策略：exact（按剩余循环数批准精确额度）/ permanent（无限批准并保留）/ revoke（无限批准，退出时撤销）
+APPROVAL_POLICY = os.getenv('APPROVAL_POLICY', 'exact')
+
+# Gas设置：legacy（eth_gasPrice）/ eip1559（eth_feeHistory百分位）/ fixed（固定价格），可选上下限（gwei）
+GAS_STRATEGY = os.getenv('GAS_STRATEGY', 'legacy')
+GAS_PRICE_MULTIPLIER = float(os.getenv('GAS_PRICE_MULTIPLIER', '1.0'))
+PRIORITY_FEE_PERCENTILE = int(os.getenv('PRIORITY_FEE_PERCENTILE', '50'))
+GAS_PRICE_FIXED_GWEI = float(os.getenv('GAS_PRICE_FIXED_GWEI')) if os.getenv('GAS_PRICE_FIXED_GWEI') else None
+GAS_PRICE_FLOOR_GWEI = float(os.getenv('GAS_PRICE_FLOOR_GWEI')) if os.getenv('GAS_PRICE_FLOOR_GWEI') else None
+GAS_PRICE_CEILING_GWEI = float(os.getenv('GAS_PRICE_CEILING_GWEI')) if os.getenv('GAS_PRICE_CEILING_GWEI') else None
+SWAP_GAS_MULTIPLIER = float(os.getenv('SWAP_GAS_MULTIPLIER', '1.2'))  # swap在市场费用基础上提高20%
+STUCK_BLOCKS = int(os.getenv('STUCK_BLOCKS', '5'))  # 超过这么多个区块未打包，用相同nonce提高gas重发
+MAX_SEND_ATTEMPTS = int(os.getenv('MAX_SEND_ATTEMPTS', '20'))  # 单笔交易最多发送/替换次数
+
+# 指标：METRICS_PORT 设置时在本地端口导出Prometheus指标，TRACE_FILE 设置时写入JSON lines追踪文件
+METRICS_PORT = int(os.getenv('METRICS_PORT')) if os.getenv('METRICS_PORT') else None
+TRACE_FILE = os.getenv('TRACE_FILE')
+
+# RPC录制/回放：RPC_RECORD_FILE 设置时把所有请求和响应（含耗时）录制到该文件（.gz 结尾时压缩）；
+# RPC_REPLAY_FILE 设置时不连接节点，从录制文件回放，RPC_REPLAY_LATENCY 为回放耗时相对录制时的比例（0 为不等待）
+RPC_RECORD_FILE = os.getenv('RPC_RECORD_FILE')
+RPC_REPLAY_FILE = os.getenv('RPC_REPLAY_FILE')
+RPC_REPLAY_LATENCY = float(os.getenv('RPC_REPLAY_LATENCY', '1.0'))
+
+# 交易日志：广播前记录每笔已签名交易，重启后核对并从中断处继续；设为空则不落盘
+JOURNAL_FILE = os.getenv('JOURNAL_FILE', 'tas_journal.db')
+
+# 本地余额账本：按回执日志更新余额，连续这么多笔交易没有读取状态快照时读取一次链上余额核对
+LEDGER_CHECKPOINT_INTERVAL = int(os.getenv('LEDGER_CHECKPOINT_INTERVAL', '10'))
 
 # Swap settings
 SLIPPAGE = float(os.getenv('SLIPPAGE', '0.1')) # 滑点百分比，默认0.1%
+# 动态滑点：按近期储备量波动在 [SLIPPAGE_MIN, SLIPPAGE_MAX]（%）之间选择，观测不足时使用 SLIPPAGE
+DYNAMIC_SLIPPAGE = os.getenv('DYNAMIC_SLIPPAGE', 'false').lower() in ('1', 'true', 'yes')
+SLIPPAGE_MIN = float(os.getenv('SLIPPAGE_MIN', '0.05'))
+SLIPPAGE_MAX = float(os.getenv('SLIPPAGE_MAX', '1.0'))
+# 单笔swap价格影响上限（万分之一），超过时拆成几笔在不同区块成交（仅非流水线模式）；0 为不拆分
+MAX_PRICE_IMPACT_BPS = float(os.getenv('MAX_PRICE_IMPACT_BPS', '0'))
+
+# 协调器（supervisor.py 启动）：多个进程/机器使用同一钱包时，nonce、gas费用和区块高度统一由协调器提供
+COORDINATOR = os.getenv('COORDINATOR')  # host:port，为空时全部在本进程内处理
+COORDINATOR_AUTHKEY = os.getenv('COORDINATOR_AUTHKEY', '')
 
 # Validate required environment variables
 required_env_vars = ['PRIVATE_KEY', 'TOKEN_ADDRESS', 'WALLET_A_ADDRESS']
@@ -54,90 +131,425 @@ for env_var in required_env_vars:
         print('Please create a .env file with the required variables or set them in your environment.')
         exit(1)
 
-# Initialize Web3 and account
-w3 = Web3(Web3.HTTPProvider(RPC_URL))
+# 批量轮次规划器
+batch_planner = BatchPlanner(BATCH_SIZE, BATCH_GAS_BUDGET, MAX_IN_FLIGHT)
+
+# 授权额度跟踪器：启动时读取一次，之后随自己的 approve/swap 在本地更新
+allowance_tracker = AllowanceTracker(APPROVAL_POLICY)
+
+# 交易工厂：私钥只解析一次，钱包地址也从这里取；chain id 在首次签名时才查询
+tx_factory = TxFactory(PRIVATE_KEY, lambda: state_reader.chain_id)
 
 # Get wallet address from private key
-wallet_b_address = w3.eth.account.from_key(PRIVATE_KEY).address
+wallet_b_address = tx_factory.address
+
+# 预执行的gas估算值
+gas_meter = GasMeter(GAS_LIMIT_MARGIN)
+
+# 运行时对象：连接节点、启动线程、打开文件或端口，导入本模块时不创建，由 init_runtime() 在 main() 开始时创建
+metrics = None          # 热路径各阶段耗时、RPC请求统计和重试计数
+rpc_log = None          # 回放的录制文件
+rpc_recorder = None     # 录制文件写入器
+w3 = None
+broadcaster = None      # 已签名交易并发广播到所有 BROADCAST_URLS 节点
+journal = None          # 交易日志
+coordinator = None      # 共享状态协调器（未配置时为None）
+notifier = None         # 区块/回执通知器
+gas_oracle = None       # gas费用预言机
+nonce_manager = None    # 本地nonce分配器
+simulator = None        # 预执行
+tracker = None          # 在途交易跟踪器
+state_reader = None     # 状态快照读取器
+quoter = None           # 本地报价器
+
+def record_or_replay(provider, endpoint_uri='replay'):
+    """按录制/回放设置包装provider：回放时替换为 ReplayProvider，录制时包一层 RecordingProvider"""
+    if rpc_log is not None:
+        return ReplayProvider(rpc_log, RPC_REPLAY_LATENCY, endpoint_uri)
+    if rpc_recorder is not None:
+        return RecordingProvider(provider, rpc_recorder)
+    return provider
+
+def init_runtime():
+    """创建运行时对象（只创建一次）：指标端口、录制文件、节点连接和健康检查线程、广播器、交易日志、协调器连接等"""
+    global metrics, rpc_log, rpc_recorder, w3, broadcaster, journal, coordinator, notifier, gas_oracle
+    global nonce_manager, simulator, tracker, state_reader, quoter, INITIALIZED_AT
+    if w3 is not None:
+        return
+    metrics = Metrics(TRACE_FILE)
+    if METRICS_PORT:
+        metrics.serve(METRICS_PORT)
 
-# Initialize contracts
-token_contract = w3.eth.contract(address=Web3.to_checksum_address(TOKEN_ADDRESS), abi=TOKEN_ABI)
-router_contract = w3.eth.contract(address=Web3.to_checksum_address(PANCAKESWAP_ROUTER_ADDRESS), abi=PANCAKESWAP_ABI)
+    # RPC录制/回放（回放时不录制）
+    rpc_log = RpcLog(RPC_REPLAY_FILE) if RPC_REPLAY_FILE else None
+    rpc_recorder = RpcRecorder(RPC_RECORD_FILE) if RPC_RECORD_FILE and rpc_log is None else None
+    if rpc_recorder is not None:
+        atexit.register(rpc_recorder.close)
+
+    # Initialize Web3（回放时不创建真正的节点连接）
+    if rpc_log is not None:
+        rpc_provider = ReplayProvider(rpc_log, RPC_REPLAY_LATENCY)
+    else:
+        rpc_provider = record_or_replay(build_provider(RPC_URLS, pool_size=RPC_POOL_SIZE, timeout=RPC_TIMEOUT, http2=RPC_HTTP2,
+                                                       health_check_interval=RPC_HEALTH_INTERVAL))
+    w3 = Web3(InstrumentedProvider(rpc_provider, metrics))
+
+    # 录制/回放时广播请求同样经过录制文件
+    broadcaster = Broadcaster(BROADCAST_URLS, timeout=RPC_TIMEOUT, metrics=metrics)
+    broadcaster.endpoints = {uri: record_or_replay(provider, uri) for uri, provider in broadcaster.endpoints.items()}
+
+    # JOURNAL_FILE 为空时只保存在内存中
+    journal = TxJournal(JOURNAL_FILE or ':memory:')
+
+    coordinator = connect_coordinator(COORDINATOR, COORDINATOR_AUTHKEY) if COORDINATOR else None
+
+    # 所有等待共用一个区块流；有协调器时区块高度向协调器查询，回放时只能轮询
+    notifier = BlockNotifier(w3, None if rpc_log is not None else WS_URL, block_source=coordinator.latest_block if coordinator else None)
+
+    # 每个区块只查询一次（有协调器时所有进程共用协调器的缓存）
+    gas_oracle = GasOracle(w3, CoordinatorStrategy(coordinator) if coordinator else strategy_from_config(
+        GAS_STRATEGY,
+        multiplier=GAS_PRICE_MULTIPLIER,
+        percentile=PRIORITY_FEE_PERCENTILE,
+        fixed_gwei=GAS_PRICE_FIXED_GWEI,
+        floor_gwei=GAS_PRICE_FLOOR_GWEI,
+        ceiling_gwei=GAS_PRICE_CEILING_GWEI,
+    ), notifier, ceiling=int(GAS_PRICE_CEILING_GWEI * GWEI) if GAS_PRICE_CEILING_GWEI is not None else None)
+
+    # 所有交易统一从这里取nonce；有协调器时使用协调器中同一钱包共用的分配器
+    nonce_manager = coordinator.nonce_manager(wallet_b_address) if coordinator else NonceManager(w3, wallet_b_address)
+
+    simulator = Simulator(w3, wallet_b_address, gas_meter)
+
+    # 每个新区块一次批量查询所有在途交易，判定上链/替换/丢弃（查询节点查不到时再问广播节点）
+    tracker = InclusionTracker(w3, notifier, wallet_b_address, on_change=lambda entry: on_tx_status(entry),
+                               pool_check=lambda tx_hashes: broadcaster.known(tx_hashes))
+
+    # 余额、授权、报价等读取合并为一次RPC往返，取自同一区块
+    state_reader = StateReader(w3, MULTICALL3_ADDRESS)
+
+    # 储备量随状态快照读取或从Sync事件更新，报价在本地计算
+    quoter = PairQuoter(w3, PANCAKESWAP_ROUTER_ADDRESS, state_reader)
+
+    INITIALIZED_AT = time.perf_counter()
 
 # Calculate the amount to transfer with proper decimals
 AMOUNT_TO_TRANSFER = int(float(TOKEN_AMOUNT) * (10 ** TOKEN_DECIMALS))
 
-# Calculate deadline timestamp
-DEADLINE = int(time.time()) + (60 * DEADLINE_MINUTES)  # Default: 20 minutes from now
+# 状态快照读取的字段
+SWAP_PATH = [Web3.to_checksum_address(TOKEN_ADDRESS), Web3.to_checksum_address(WBNB_ADDRESS)]
+STATE_READS = [
+    ContractRead('a_token_balance', TOKEN_ADDRESS, 'balanceOf(address)', [WALLET_A_ADDRESS]),
+    ContractRead('token_balance', TOKEN_ADDRESS, 'balanceOf(address)', [wallet_b_address]),
+    ContractRead('allowance', TOKEN_ADDRESS, 'allowance(address,address)', [wallet_b_address, PANCAKESWAP_ROUTER_ADDRESS]),
+]
+
+# 本地余额账本：交易确认后按回执中的Transfer日志和gas费用更新余额，每次读取最新状态快照时核对
+ledger = BalanceLedger(TOKEN_ADDRESS, WALLET_A_ADDRESS, wallet_b_address, PANCAKESWAP_ROUTER_ADDRESS, LEDGER_CHECKPOINT_INTERVAL)
+
+# 滑点与拆单优化器：按状态快照中的储备量估计波动
+optimizer = TradeOptimizer(SLIPPAGE_MIN, SLIPPAGE_MAX, MAX_PRICE_IMPACT_BPS)
+
+# deadline在每次构建swap交易时计算，默认当前时间之后20分钟
+swap_deadline = deadline_after(60 * DEADLINE_MINUTES)
+
+# 交易模板：调用数据预先编码，每笔交易只替换nonce、gas价格、amountOutMin和deadline
+tx_factory.register(
+    'transfer', TOKEN_ADDRESS, 'transferFrom(address,address,uint256)',
+    [WALLET_A_ADDRESS, wallet_b_address, AMOUNT_TO_TRANSFER],  # 从钱包A转到钱包B
+    GAS_LIMIT_TRANSFER,
+)
+tx_factory.register(
+    'swap', PANCAKESWAP_ROUTER_ADDRESS, 'swapExactTokensForETH(uint256,uint256,address[],address,uint256)',
+    [AMOUNT_TO_TRANSFER, 0, SWAP_PATH, WALLET_A_ADDRESS, 0],  # 接收BNB的地址是钱包A
+    int(GAS_LIMIT_SWAP * 1.3),  # 增加30%（有预执行估算值后改用估算值）
+    variables={'amount_in': 0, 'amount_out_min': 1, 'deadline': 4},
+    providers={'deadline': swap_deadline},
+)
+tx_factory.register(
+    'approve', TOKEN_ADDRESS, 'approve(address,uint256)',
+    [PANCAKESWAP_ROUTER_ADDRESS, 0],
+    GAS_LIMIT_APPROVE,
+    variables={'amount': 1},
+)
+
+# 运行时对象创建完成的时刻（init_runtime() 中记录）；首次广播时刻在 report_startup() 中记录
+INITIALIZED_AT = None
+first_broadcast_at = None
 
 # 等待新区块函数
 def wait_for_new_block(current_block):
     logging.info(f"等待新区块 | 当前区块: {current_block}")
-    while True:
-        latest_block = w3.eth.block_number
-        if latest_block > current_block:
-            logging.info(f"新区块: {latest_block} (在当前+{latest_block-current_block})")
-            return latest_block
-        time.sleep(0.5)  # 每0.5秒检查一次新区块
+    latest_block = notifier.wait_for_block(current_block)
+    logging.info(f"新区块: {latest_block} (在当前+{latest_block-current_block})")
+    return latest_block
+
+# 读取状态快照：钱包A/B代币余额、授权额度、钱包B的BNB余额，可选交易对储备量
+def read_state(quote=False, block_identifier='latest'):
+    calls = STATE_READS + quoter.reserve_reads(SWAP_PATH) if quote else STATE_READS
+    state = state_reader.read(
+        calls,
+        eth_balances=[('bnb_balance', wallet_b_address)],
+        block_identifier=block_identifier,
+    )
+    if quote:
+        quoter.update_from_state(state)
+        # getReserves 读取失败时这次快照没有储备量，不计入波动
+        if state.get(f"reserves:{quoter.pair_for(SWAP_PATH[0], SWAP_PATH[1])}") is not None:
+            optimizer.observe(*quoter.reserves(SWAP_PATH[0], SWAP_PATH[1]))
+    if block_identifier == 'latest' and ledger.checkpoint(state):
+        metrics.inc('ledger_drift')
+    return state
+
+# 已上链交易的回执更新本地账本（无论成功失败都扣gas费用）；回执中有授权事件时以事件中的额度为准
+def apply_receipt(tx_receipt):
+    allowance = ledger.apply_receipt(tx_receipt)
+    if allowance is not None:
+        allowance_tracker.sync(allowance)
+
+# 只发送交易不等待确认，返回交易哈希；并发发送到所有广播节点，第一个接受的节点胜出（already known 也算接受）
+def broadcast_transaction(signed_tx, tx_type):
+    # 先写日志再广播，进程在广播后退出也能找回这笔交易
+    journal.record(signed_tx, tx_type)
+    try:
+        with metrics.span('broadcast', tx=tx_type):
+            tx_hash, endpoint = broadcaster.send(signed_tx)
+    except BroadcastError:
+        # 没有节点接受，这笔交易不会上链，重启时不再重发
+        journal.mark(signed_tx.hash, REJECTED)
+        raise
+    tx_hash_short = Web3.to_hex(tx_hash)[:10] + '...' # 只显示哈希前10位
+    logging.info(f"{tx_type} 发送成功 | Hash: {tx_hash_short} | 节点: {endpoint}")
+    if first_broadcast_at is None:
+        report_startup()
+    return tx_hash
+
+# 启动耗时：导入依赖、模块初始化、从开始导入到首次广播被节点接受
+def report_startup():
+    global first_broadcast_at
+    first_broadcast_at = time.perf_counter()
+    metrics.observe('startup_import', IMPORTED_AT - STARTED_AT)
+    metrics.observe('startup_init', INITIALIZED_AT - IMPORTED_AT)
+    metrics.observe('startup_first_broadcast', first_broadcast_at - STARTED_AT)
+    logging.info(f"启动耗时 | 导入依赖: {(IMPORTED_AT - STARTED_AT) * 1000:.0f} ms | "
+                 f"初始化: {(INITIALIZED_AT - IMPORTED_AT) * 1000:.0f} ms | "
+                 f"到首次广播: {(first_broadcast_at - STARTED_AT) * 1000:.0f} ms")
+
+# 交易已上链：记录打包耗时和从广播到打包经过的区块数
+def record_inclusion(tx_type, tx_hash, tx_receipt, sent_block):
+    journal.mark_receipt(tx_hash, tx_receipt)
+    broadcaster.mark_included(tx_hash)
+    if sent_block is not None:
+        metrics.observe_blocks(tx_receipt['blockNumber'] - sent_block, tx=tx_type)
+
+# 跟踪器回调（通知线程中执行）：上链时记录确认耗时和打包区块数，被替换/丢弃时更新交易日志
+def on_tx_status(entry):
+    metrics.inc('tx_status', status=entry.status, tx=entry.tx_type)
+    if entry.status == INCLUDED:
+        metrics.observe('confirmation', time.perf_counter() - entry.sent_at, tx=entry.tx_type)
+        record_inclusion(entry.tx_type, entry.hash, entry.receipt, entry.sent_block)
+        return
+    journal.mark(entry.hash, JOURNAL_REPLACED if entry.status == REPLACED else JOURNAL_DROPPED)
+    if entry.status == REPLACED:
+        # 被丢弃的交易在nonce被消耗前仍可能上链，继续保留广播统计
+        broadcaster.forget([entry.hash])
+    if entry.replaced_by is None:
+        status = "nonce已被其他交易使用" if entry.status == REPLACED else "已从交易池中丢弃"
+        logging.warning(f"{entry.tx_type} {status} | nonce: {entry.nonce} | Hash: {entry.hash[:10]}...")
 
 # 发送交易并重试直到成功
-def send_transaction_with_retry(signed_tx, tx_type, max_attempts=999):
+# 传入 resign(fees) 和首次签名使用的 fees 时，交易卡住、被丢弃或费用过低会用相同nonce提高gas替换
+def send_transaction_with_retry(signed_tx, tx_type, max_attempts=MAX_SEND_ATTEMPTS, resign=None, fees=None):
     attempt = 1
+    sent_hashes = []  # 同一nonce发出过的所有版本
+    sent_block = None  # 首次发送时的区块
+    nonce = tx_nonce(signed_tx.raw_transaction)
     while attempt <= max_attempts:
         try:
-            tx_hash = w3.eth.send_raw_transaction(signed_tx.raw_transaction)
-            tx_hash_short = tx_hash.hex()[:10] + '...' # 只显示哈希前10位
-            logging.info(f"{tx_type} 发送成功 | Hash: {tx_hash_short}")
-            
-            # 等待交易完成
-            tx_receipt = w3.eth.wait_for_transaction_receipt(tx_hash)
-            logging.info(f"{tx_type} 确认 | 区块: {tx_receipt['blockNumber']} | 状态: {'成功' if tx_receipt['status'] == 1 else '失败'}")
-            
-            return tx_hash, tx_receipt
+            if sent_block is None:
+                sent_block = notifier.latest_block
+            tx_hash = broadcast_transaction(signed_tx, tx_type)
+            if tx_hash not in sent_hashes:
+                sent_hashes.append(tx_hash)
+            tracker.track(tx_hash, nonce, tx_type, sent_block)
         except Exception as e:
+            # 所有节点都拒绝了广播
             error_msg = str(e)
-            # 提取简短错误信息
-            if "already known" in error_msg:
-                short_error = "交易已提交"
-            elif "nonce too low" in error_msg:
+            if "nonce too low" in error_msg:
                 short_error = "nonce过低"
+                reason = 'nonce_too_low'
+            elif "underpriced" in error_msg:
+                short_error = "gas价格过低"
+                reason = 'underpriced'
             else:
                 # 限制错误消息长度
                 short_error = error_msg[:50] + '...' if len(error_msg) > 50 else error_msg
-            
+                reason = 'other'
+            metrics.inc('retries', tx=tx_type, reason=reason)
+            metrics.trace('retry', tx=tx_type, attempt=attempt, reason=reason, error=error_msg[:200])
             logging.error(f"{tx_type} 失败 (尝试 {attempt}/{max_attempts}): {short_error}")
             
-            if "already known" in error_msg or "nonce too low" in error_msg:
+            if "nonce too low" in error_msg:
+                if not sent_hashes:
+                    # nonce已被消耗，这笔交易不可能再上链，交给调用方重新同步nonce
+                    raise
+                # 之前发出的某个版本可能刚刚上链，下面交给跟踪器判断
+            elif resign is not None and fees is not None and "underpriced" in error_msg:
+                # gas价格过低：用相同nonce提高gas替换，不再盲等新区块
                 try:
-                    if 'tx_hash' in locals():
-                        tx_receipt = w3.eth.get_transaction_receipt(tx_hash)
-                        if tx_receipt is not None:
-                            logging.info(f"{tx_type} 已确认 | 区块: {tx_receipt['blockNumber']}")
-                            return tx_hash, tx_receipt
-                except:
-                    pass
-            
-            # 等待新区块后重试
-            current_block = w3.eth.block_number
-            wait_for_new_block(current_block)
-            attempt += 1
+                    signed_tx, fees = gas_oracle.replace(resign, fees)
+                except FeeCeilingReached as e:
+                    # 不再提价，等待之前发出的版本；一个版本也没有发出时无法继续
+                    resign = None
+                    metrics.inc('fee_ceiling', tx=tx_type)
+                    logging.warning(f"{tx_type} {e}")
+                    if not sent_hashes:
+                        raise
+                else:
+                    metrics.inc('replacements', tx=tx_type)
+                    attempt += 1
+                    continue
+            else:
+                # 等待新区块后重试
+                current_block = notifier.current_block()
+                wait_for_new_block(current_block)
+                attempt += 1
+                continue
+        
+        # 等待任一版本状态确定，超过 STUCK_BLOCKS 个区块仍在交易池中视为卡住
+        entry = tracker.wait(sent_hashes, timeout=notifier.block_time * STUCK_BLOCKS)
+        if entry is not None and entry.status == INCLUDED:
+            # 其他版本不会再上链，不再跟踪
+            tracker.untrack(sent_hashes)
+            broadcaster.forget(sent_hashes)
+            logging.info(f"{tx_type} 确认 | 区块: {entry.receipt['blockNumber']} | 状态: {'成功' if entry.receipt['status'] == 1 else '失败'}")
+            return entry.hash, entry.receipt
+        if entry is not None and entry.status == REPLACED:
+            # 所有版本都在跟踪，nonce却被未跟踪的交易消耗，任何版本都不会再上链
+            tracker.untrack(sent_hashes)
+            raise Exception(f"{tx_type} nonce too low: nonce {nonce} 已被其他交易使用")
+        
+        reason = 'stuck' if entry is None else 'dropped'
+        metrics.inc('retries', tx=tx_type, reason=reason)
+        metrics.trace('retry', tx=tx_type, attempt=attempt, reason=reason)
+        short_error = f"{STUCK_BLOCKS}个区块内未打包" if entry is None else "已从交易池中丢弃"
+        logging.error(f"{tx_type} 失败 (尝试 {attempt}/{max_attempts}): {short_error}")
+        if resign is not None and fees is not None:
+            # 卡住或被丢弃：用相同nonce提高gas替换
+            try:
+                signed_tx, fees = gas_oracle.replace(resign, fees)
+                metrics.inc('replacements', tx=tx_type)
+            except FeeCeilingReached as e:
+                resign = None
+                metrics.inc('fee_ceiling', tx=tx_type)
+                logging.warning(f"{tx_type} {e}，之后原样重发")
+        # 无法重新签名（或费用已达上限）时原样重发
+        attempt += 1
     
+    tracker.untrack(sent_hashes)
     raise Exception(f"{tx_type} 在 {max_attempts} 次尝试后失败")
 
+# swap使用的费用：在市场费用基础上提高 SWAP_GAS_MULTIPLIER 倍
+def swap_fees():
+    return scale_fees(gas_oracle.fees(), SWAP_GAS_MULTIPLIER)
+
+# 交易的gas上限：有估算值时按估算值，否则使用注册时的默认值
+def gas_limit(name):
+    return gas_meter.gas_limit(name, tx_factory.gas_limit(name))
+
+# 用交易模板构建并签名，分别记录构建和签名耗时
+def build_and_sign(name, nonce, fees, **values):
+    with metrics.span('build', tx=name):
+        to, data, _ = tx_factory.render(name, **values)
+    with metrics.span('sign', tx=name):
+        return tx_factory.sign(to, data, gas_limit(name), fees, nonce)
+
+# 预执行交易模板，返回回滚原因（未开启预执行或模拟成功时返回None）
+def preflight(name, **values):
+    return preflight_many([(name, values)])[0]
+
+# 一次批量请求预执行多笔互不依赖的交易 [(模板名, 参数)]，返回各自的回滚原因
+# 节点没有响应（超时、连接失败）时无法判断，照常发送，由上链结果决定
+def preflight_many(txs):
+    if not SIMULATE:
+        return [None] * len(txs)
+    rendered = []
+    for name, values in txs:
+        to, data, _ = tx_factory.render(name, **values)
+        rendered.append((name, to, data, 0))
+    with metrics.span('simulate', tx='+'.join(name for name, _ in txs)):
+        results = simulator.simulate_many(rendered)
+    reasons = []
+    for (name, _), result in zip(txs, results):
+        if result.ok is None:
+            metrics.inc('simulation_errors', tx=name)
+            logging.warning(f"{name} 无法预执行，照常发送: {result.reason[:50]}")
+            reasons.append(None)
+            continue
+        if not result.ok:
+            metrics.inc('simulation_reverts', tx=name)
+            logging.warning(f"{name} 预执行回滚: {result.reason}")
+        reasons.append(result.reason)
+    return reasons
+
+# 重放已上链但失败的交易，返回回滚原因
+def failure_reason(name, block_number, **values):
+    to, data, _ = tx_factory.render(name, **values)
+    try:
+        return simulator.revert_reason(to, data, hex(block_number - 1)) or '未知'
+    except Exception as e:
+        return f"无法获取 ({str(e)[:30]})"
+
+# 构建并签名transferFrom交易 - 从钱包A转到钱包B
+def sign_transfer_tx(nonce, fees=None):
+    return build_and_sign('transfer', nonce, fees or gas_oracle.fees())
+
+# 构建并签名swap交易 - 代币换BNB，BNB发送到钱包A；amount_in 默认为每次循环的转账数量
+def sign_swap_tx(nonce, amount_out_min, fees=None, amount_in=None):
+    return build_and_sign('swap', nonce, fees or swap_fees(),
+                          amount_in=amount_in or AMOUNT_TO_TRANSFER, amount_out_min=amount_out_min)
+
+# 构建并签名approve交易，amount为0即撤销授权
+def sign_approve_tx(nonce, amount, fees=None):
+    return build_and_sign('approve', nonce, fees or gas_oracle.fees(), amount=amount)
+
+# 本轮使用的滑点（%）：开启动态滑点时按近期波动选择，否则为 SLIPPAGE
+def current_slippage():
+    return optimizer.slippage(SLIPPAGE) if DYNAMIC_SLIPPAGE else SLIPPAGE
+
+# 根据本地缓存的储备量和滑点计算最小输出
+def quote_amount_out_min(amount_in=None):
+    return quote_amounts_out_min(1, amount_in)[0]
+
+# 同一批 rounds 笔swap依次打包时各自的最小输出（前一笔会推动价格）
+def quote_amounts_out_min(rounds, amount_in=None):
+    try:
+        with metrics.span('quote'):
+            expected_amounts = quoter.quote_repeated(amount_in or AMOUNT_TO_TRANSFER, SWAP_PATH, rounds)
+        
+        # 设置较大的滑点容忍度，增加成功率
+        slippage = current_slippage()
+        amounts_out_min = [int(expected * (1 - slippage/100)) for expected in expected_amounts]
+        logging.info(f"兑换估算 | 预期: {w3.from_wei(expected_amounts[0], 'ether')} BNB | 最小: {w3.from_wei(amounts_out_min[0], 'ether')} BNB | 滑点: {slippage:.3f}%"
+                     + (f" | 第{rounds}笔最小: {w3.from_wei(amounts_out_min[-1], 'ether')} BNB" if rounds > 1 else ""))
+        return amounts_out_min
+    except Exception as e:
+        logging.warning(f"计算滑点失败: {str(e)[:30]}...")
+        return [0] * rounds
+
 # 执行transferFrom交易，每2秒发送一次直到成功
 def execute_transfer_from():
-    # 获取钱包A的转账前余额
-    initial_a_balance = token_contract.functions.balanceOf(Web3.to_checksum_address(WALLET_A_ADDRESS)).call()
+    # 获取钱包A的转账前余额（取自本地账本，需要核对时才读取链上）
+    state = read_state() if ledger.checkpoint_due() else ledger.snapshot()
+    initial_a_balance = state.a_token_balance
     logging.info(f"Transfer前钱包A余额: {initial_a_balance / (10 ** TOKEN_DECIMALS)}")
     
     # 设置开始时间
     start_time = time.time()
     
-    # 初始化本地nonce计数器 - 解决nonce过低问题
-    local_nonce = w3.eth.get_transaction_count(wallet_b_address)
-    
     transfer_success = False
     while not transfer_success:
+        current_nonce = None
         try:
             # 计算自上次交易的时间
             elapsed = time.time() - start_time
@@ -148,52 +560,52 @@ def execute_transfer_from():
             # 重置开始时间为现在
             start_time = time.time()
             
-            # 获取链上当前nonce和使用本地nonce的最大值
-            chain_nonce = w3.eth.get_transaction_count(wallet_b_address)
-            # 选择链上和本地计算的最大nonce值
-            current_nonce = max(local_nonce, chain_nonce)
-            logging.info(f"Transfer | nonce: {current_nonce} (链上: {chain_nonce})")
+            # 预执行：钱包A余额或授权不足（TRANSFER_FROM_FAILED等）时不发送，等下一个区块再试
+            if preflight('transfer') is not None:
+                wait_for_new_block(notifier.current_block())
+                continue
             
-            # 构建transferFrom交易 - 从钱包A转到钱包B
-            transfer_txn = token_contract.functions.transferFrom(
-                Web3.to_checksum_address(WALLET_A_ADDRESS),
-                wallet_b_address,  # 目标地址是B钱包地址
-                AMOUNT_TO_TRANSFER
-            ).build_transaction({
-                'chainId': w3.eth.chain_id,
-                'gas': GAS_LIMIT_TRANSFER,
-                'gasPrice': w3.eth.gas_price,
-                'nonce': current_nonce,
-            })
+            # 从本地nonce分配器取nonce
+            current_nonce = nonce_manager.allocate()
+            logging.info(f"Transfer | nonce: {current_nonce}")
             
-            # 签名交易
-            signed_txn = w3.eth.account.sign_transaction(transfer_txn, PRIVATE_KEY)
+            # 构建并签名transferFrom交易
+            fees = gas_oracle.fees()
+            signed_txn = sign_transfer_tx(current_nonce, fees)
             
             try:
-                # 发送交易并等待确认
-                tx_hash, tx_receipt = send_transaction_with_retry(signed_txn, "Transfer")
+                # 发送交易并等待确认，卡住时用相同nonce提高gas替换
+                tx_hash, tx_receipt = send_transaction_with_retry(
+                    signed_txn, "Transfer",
+                    resign=lambda new_fees: sign_transfer_tx(current_nonce, new_fees), fees=fees,
+                )
+                nonce_manager.confirm(current_nonce)
+                current_nonce = None
                 current_block = tx_receipt['blockNumber']
                 
-                # 交易成功，验证结果
-                new_a_balance = token_contract.functions.balanceOf(Web3.to_checksum_address(WALLET_A_ADDRESS)).call()
+                # 按回执中的Transfer日志更新余额，不再读取链上状态
+                apply_receipt(tx_receipt)
+                new_a_balance = ledger.snapshot().a_token_balance
+                if new_a_balance is None:
+                    new_a_balance = read_state(block_identifier=current_block).a_token_balance
                 
                 if tx_receipt['status'] == 1:  # 交易状态成功
                     logging.info(f"✅ Transfer成功 | 钱包A余额: {new_a_balance / (10 ** TOKEN_DECIMALS)}")
                     transfer_success = True
                     return True, current_block
                 else:
-                    # 交易状态失败但已发送到区块链，增加nonce
-                    logging.error("❌ 状态失败，增加nonce并继续重试")
-                    local_nonce = current_nonce + 1  # 增加本地nonce
+                    # 交易状态失败但已上链，nonce已消耗
+                    logging.error(f"❌ 状态失败: {failure_reason('transfer', current_block)}，nonce已消耗，继续重试")
             except Exception as e:
                 error_msg = str(e)
                 
                 # 处理nonce过低错误
                 if "nonce too low" in error_msg:
+                    metrics.inc('nonce_errors', tx='Transfer')
                     logging.warning(f"Nonce过低错误 | 当前nonce: {current_nonce}")
-                    # 自动增加nonce继续尝试
-                    local_nonce = current_nonce + 1
-                    logging.info(f"自动增加nonce至: {local_nonce}")
+                    # 以链上为准重新同步nonce
+                    nonce_manager.resync()
+                    logging.info(f"重新同步nonce至: {nonce_manager.peek()}")
                     continue  # 立即重试，不等待2秒
                     
                 short_error = error_msg[:50] + '...' if len(error_msg) > 50 else error_msg
@@ -202,16 +614,26 @@ def execute_transfer_from():
             error_msg = str(e)
             short_error = error_msg[:50] + '...' if len(error_msg) > 50 else error_msg
             logging.error(f"Transfer外部错误: {short_error}")
-            # 全局错误，但不增加nonce
+        finally:
+            # 交易未能上链，归还nonce
+            if current_nonce is not None:
+                nonce_manager.release(current_nonce)
     
     return False, None
 
-# 执行swap操作
-def execute_swap():
+# 执行swap操作，loops_left 为包括本轮在内剩余的循环数（授权不足时按此批准）
+def execute_swap(loops_left=1):
     """执行一次swap交易，将代币兑换为BNB并发送到钱包A地址"""
+    # 一次快照读取余额、报价和gas价格
+    try:
+        state = read_state(quote=True)
+    except Exception as e:
+        logging.warning(f"读取状态失败: {str(e)[:30]}...")
+        return False, None, None
+    
     # 检查代币余额
     try:
-        token_balance = token_contract.functions.balanceOf(wallet_b_address).call()
+        token_balance = state.token_balance
         logging.info(f"当前代币余额: {token_balance / (10 ** TOKEN_DECIMALS)}")
         
         if token_balance < AMOUNT_TO_TRANSFER:
@@ -221,170 +643,178 @@ def execute_swap():
         logging.warning(f"检查代币余额失败: {str(e)[:30]}...")
         return False, None, None
     
-    # 检查授权额度
-    try:
-        current_allowance = token_contract.functions.allowance(
-            wallet_b_address,
-            Web3.to_checksum_address(PANCAKESWAP_ROUTER_ADDRESS)
-        ).call()
-        logging.info(f"Swap前授权额度: {current_allowance / (10 ** TOKEN_DECIMALS)}")
-        
-        if current_allowance < AMOUNT_TO_TRANSFER:
-            logging.info("尝试重新授权...")
-            approve_success, _ = approve_token_with_max_amount()
-            if not approve_success:
-                return False, None, None
-    except Exception as e:
-        logging.warning(f"检查授权失败: {str(e)[:30]}...")
+    # 检查本地跟踪的授权额度，不足时才批准
+    approve_amount = approval_needed(loops_left)
+    if approve_amount is not None:
+        logging.info("授权额度不足，尝试重新授权...")
+        if not approve_token(approve_amount):
+            return False, None, None
     
-    # 获取交易前的余额
-    token_balance_before = token_contract.functions.balanceOf(wallet_b_address).call()
-    bnb_balance_before = w3.eth.get_balance(wallet_b_address)
-    logging.info(f"开始交易 | 代币: {token_balance_before / (10 ** TOKEN_DECIMALS)} | BNB: {w3.from_wei(bnb_balance_before, 'ether')}")
-    logging.info(f"使用滑点: {SLIPPAGE}%")
+    # 交易前的余额
+    logging.info(f"开始交易 | 代币: {token_balance / (10 ** TOKEN_DECIMALS)} | BNB: {w3.from_wei(state.bnb_balance, 'ether')}")
     
+    # 价格影响超过 MAX_PRICE_IMPACT_BPS 时拆成几笔，每笔在前一笔上链后的新区块发送
+    parts = swap_parts(AMOUNT_TO_TRANSFER)
+    swap_block = None
+    for index, amount_in in enumerate(parts):
+        if index > 0:
+            wait_for_new_block(swap_block)
+            read_state(quote=True)
+            logging.info(f"拆单 {index + 1}/{len(parts)} | 数量: {amount_in / (10 ** TOKEN_DECIMALS)}")
+        success, swap_block = swap_once(amount_in)
+        if not success:
+            return False, None, None
+    return True, None, swap_block
+
+# 按当前储备量拆分swap数量，返回各笔数量
+def swap_parts(amount):
+    reserves = quoter.reserves(SWAP_PATH[0], SWAP_PATH[1])
+    if reserves is None:
+        return [amount]
+    parts = optimizer.split(amount, reserves[0])
+    if len(parts) > 1:
+        logging.info(f"价格影响 {price_impact_bps(amount, reserves[0]):.1f} bps 超过上限 {MAX_PRICE_IMPACT_BPS:g} bps，拆成 {len(parts)} 笔")
+    return parts
+
+# 发送一笔swap并等待上链，返回 (是否成功, 区块号)
+def swap_once(amount_in):
+    current_nonce = None
     try:
-        # 准备swap相关参数
-        path = [Web3.to_checksum_address(TOKEN_ADDRESS), Web3.to_checksum_address(WBNB_ADDRESS)]
+        # 获取当前兑换比率并计算最小输出
+        amount_out_min = quote_amount_out_min(amount_in)
         
-        # 获取当前兑换比率
-        try:
-            amounts_out = router_contract.functions.getAmountsOut(
-                AMOUNT_TO_TRANSFER, 
-                path
-            ).call()
-            expected_amount = amounts_out[1]  # 第二个值是期望获得的BNB数量
-            
-            # 设置较大的滑点容忍度，增加成功率
-            amount_out_min = int(expected_amount * (1 - SLIPPAGE/100))  # 使用环境变量中设置的滑点
-            logging.info(f"兑换估算 | 预期: {w3.from_wei(expected_amount, 'ether')} BNB | 最小: {w3.from_wei(amount_out_min, 'ether')} BNB")
-        except Exception as e:
-            logging.warning(f"计算滑点失败: {str(e)[:30]}...")
-            amount_out_min = 0
+        # 预执行：储备量已变化导致输出不足时刷新报价再试一次，其他回滚直接放弃，不花gas
+        reason = preflight('swap', amount_in=amount_in, amount_out_min=amount_out_min)
+        if reason is not None and "INSUFFICIENT_OUTPUT_AMOUNT" in reason:
+            read_state(quote=True)
+            amount_out_min = quote_amount_out_min(amount_in)
+            reason = preflight('swap', amount_in=amount_in, amount_out_min=amount_out_min)
+        if reason is not None:
+            if "TRANSFER_FROM_FAILED" in reason:
+                # 授权额度与本地记录不一致，校准后下一轮会重新批准
+                allowance_tracker.sync(read_state().allowance)
+            logging.error(f"❌ Swap预执行失败: {reason}")
+            return False, None
         
-        # 获取最新nonce
-        current_nonce = w3.eth.get_transaction_count(wallet_b_address)
+        # 从本地nonce分配器取nonce
+        current_nonce = nonce_manager.allocate()
         logging.info(f"Swap | nonce: {current_nonce}")
         
-        # 设置较高的gas价格和限额
-        gas_price_boost = int(w3.eth.gas_price * 1.2)  # 增加20%
-        gas_limit_boost = int(GAS_LIMIT_SWAP * 1.3)  # 增加30%
-        
-        # 构建交易
-        swap_txn = router_contract.functions.swapExactTokensForETH(
-            AMOUNT_TO_TRANSFER,
-            amount_out_min,
-            path,
-            Web3.to_checksum_address(WALLET_A_ADDRESS),  # 接收BNB的地址是钱包A
-            DEADLINE
-        ).build_transaction({
-            'chainId': w3.eth.chain_id,
-            'gas': gas_limit_boost,
-            'gasPrice': gas_price_boost,
-            'nonce': current_nonce,
-        })
-        
-        # 签名并发送交易
-        signed_swap_txn = w3.eth.account.sign_transaction(swap_txn, PRIVATE_KEY)
-        swap_tx_hash, swap_tx_receipt = send_transaction_with_retry(signed_swap_txn, "Swap")
+        # 构建、签名并发送交易，卡住时用相同nonce提高gas替换
+        fees = swap_fees()
+        signed_swap_txn = sign_swap_tx(current_nonce, amount_out_min, fees, amount_in)
+        swap_tx_hash, swap_tx_receipt = send_transaction_with_retry(
+            signed_swap_txn, "Swap",
+            resign=lambda new_fees: sign_swap_tx(current_nonce, amount_out_min, new_fees, amount_in), fees=fees,
+        )
+        nonce_manager.confirm(current_nonce)
+        current_nonce = None
         
         # 获取交易区块
         swap_block = swap_tx_receipt['blockNumber']
         
-        # 验证交易效果
-        token_balance_after = token_contract.functions.balanceOf(wallet_b_address).call()
+        # 用回执中的Sync事件更新本地储备量
+        quoter.apply_logs(swap_tx_receipt['logs'])
         
         # 检查交易状态
         if swap_tx_receipt['status'] == 1:
+            allowance_tracker.spent(amount_in)
+            apply_receipt(swap_tx_receipt)
             logging.info("✅ Swap交易状态成功")
-            return True, None, swap_block
+            return True, swap_block
         else:
-            # 即使状态是失败，如果代币已经减少，我们也认为交易完成
-            if token_balance_after < token_balance_before:
-                logging.info("✅ Swap可能成功 (代币已消耗)")
-                return True, None, swap_block
-            else:
-                logging.error("❌ Swap交易失败")
-                return False, None, None
+            # 重放交易取得回滚原因；失败可能与授权有关，顺便校准授权额度
+            apply_receipt(swap_tx_receipt)
+            reason = failure_reason('swap', swap_block, amount_in=amount_in, amount_out_min=amount_out_min)
+            allowance_tracker.sync(read_state(block_identifier=swap_block).allowance)
+            logging.error(f"❌ Swap交易失败: {reason}")
+            return False, None
             
     except Exception as e:
         error_msg = str(e)
         short_error = error_msg[:50] + '...' if len(error_msg) > 50 else error_msg
         logging.error(f"Swap执行错误: {short_error}")
-        return False, None, None
-    return False, None, None
+        if "nonce too low" in error_msg:
+            metrics.inc('nonce_errors', tx='Swap')
+            nonce_manager.resync()
+        return False, None
+    finally:
+        # 交易未能上链，归还nonce
+        if current_nonce is not None:
+            nonce_manager.release(current_nonce)
 
-# 无限批准函数
-def approve_token_with_max_amount():
-    logging.info("开始无限批准代币...")
+# 批准函数，amount 为 MAX_UINT256 即无限批准
+def approve_token(amount):
+    logging.info(f"开始批准代币 | 额度: {format_allowance(amount)}")
     
+    current_nonce = None
     try:
-        # 获取当前nonce
-        current_nonce = w3.eth.get_transaction_count(wallet_b_address)
+        reason = preflight('approve', amount=amount)
+        if reason is not None:
+            logging.error(f"❌ 批准预执行失败: {reason}")
+            return False
+        
+        # 从本地nonce分配器取nonce
+        current_nonce = nonce_manager.allocate()
         
-        # 构建approve交易，使用无限大的数字
-        approve_txn = token_contract.functions.approve(
-            Web3.to_checksum_address(PANCAKESWAP_ROUTER_ADDRESS),
-            MAX_UINT256  # 无限批准
-        ).build_transaction({
-            'chainId': w3.eth.chain_id,
-            'gas': GAS_LIMIT_APPROVE,
-            'gasPrice': w3.eth.gas_price,
-            'nonce': current_nonce,
-        })
+        # 构建并签名approve交易
+        fees = gas_oracle.fees()
+        signed_txn = sign_approve_tx(current_nonce, amount, fees)
         
-        # 签名并发送交易
-        signed_txn = w3.eth.account.sign_transaction(approve_txn, PRIVATE_KEY)
-        tx_hash, tx_receipt = send_transaction_with_retry(signed_txn, "无限批准")
+        # 发送交易
+        tx_hash, tx_receipt = send_transaction_with_retry(
+            signed_txn, "批准",
+            resign=lambda new_fees: sign_approve_tx(current_nonce, amount, new_fees), fees=fees,
+        )
+        nonce_manager.confirm(current_nonce)
+        current_nonce = None
+        apply_receipt(tx_receipt)
         
         # 检查是否成功
         if tx_receipt['status'] == 1:
-            # 检查授权额度
-            allowance = token_contract.functions.allowance(
-                wallet_b_address,
-                Web3.to_checksum_address(PANCAKESWAP_ROUTER_ADDRESS)
-            ).call()
-            
-            if allowance == MAX_UINT256:
-                logging.info(f"✅ 无限批准成功 | 授权额度: 无限大")
-                return True
-            else:
-                logging.info(f"✅ 批准成功 | 授权额度: {allowance}")
-                return True
+            allowance_tracker.approved(amount)
+            logging.info(f"✅ 批准成功 | 授权额度: {format_allowance(amount)}")
+            return True
         else:
-            logging.error("❌ 无限批准失败")
+            logging.error(f"❌ 批准失败: {failure_reason('approve', tx_receipt['blockNumber'], amount=amount)}")
             return False
     except Exception as e:
         error_msg = str(e)
         short_error = error_msg[:50] + '...' if len(error_msg) > 50 else error_msg
-        logging.error(f"无限批准错误: {short_error}")
+        logging.error(f"批准错误: {short_error}")
+        if "nonce too low" in error_msg:
+            metrics.inc('nonce_errors', tx='批准')
+            nonce_manager.resync()
         return False
+    finally:
+        if current_nonce is not None:
+            nonce_manager.release(current_nonce)
 
 # 撤销批准函数
 def revoke_token_approval():
     logging.info("开始撤销代币批准...")
     
+    current_nonce = None
     try:
-        # 获取当前nonce
-        current_nonce = w3.eth.get_transaction_count(wallet_b_address)
+        # 从本地nonce分配器取nonce
+        current_nonce = nonce_manager.allocate()
         
-        # 构建撤销approve交易，将授权额度设为0
-        revoke_txn = token_contract.functions.approve(
-            Web3.to_checksum_address(PANCAKESWAP_ROUTER_ADDRESS),
-            0  # 将授权额度设为0来撤销
-        ).build_transaction({
-            'chainId': w3.eth.chain_id,
-            'gas': GAS_LIMIT_APPROVE,
-            'gasPrice': w3.eth.gas_price,
-            'nonce': current_nonce,
-        })
+        # 构建并签名撤销approve交易，将授权额度设为0
+        fees = gas_oracle.fees()
+        signed_txn = sign_approve_tx(current_nonce, 0, fees)  # 将授权额度设为0来撤销
         
-        # 签名并发送交易
-        signed_txn = w3.eth.account.sign_transaction(revoke_txn, PRIVATE_KEY)
-        tx_hash, tx_receipt = send_transaction_with_retry(signed_txn, "撤销批准")
+        # 发送交易
+        tx_hash, tx_receipt = send_transaction_with_retry(
+            signed_txn, "撤销批准",
+            resign=lambda new_fees: sign_approve_tx(current_nonce, 0, new_fees), fees=fees,
+        )
+        nonce_manager.confirm(current_nonce)
+        current_nonce = None
+        apply_receipt(tx_receipt)
         
         # 检查是否成功
         if tx_receipt['status'] == 1:
+            allowance_tracker.approved(0)
             logging.info("✅ 撤销批准成功")
             return True
         else:
@@ -394,33 +824,254 @@ def revoke_token_approval():
         error_msg = str(e)
         short_error = error_msg[:50] + '...' if len(error_msg) > 50 else error_msg
         logging.error(f"撤销批准错误: {short_error}")
+        if "nonce too low" in error_msg:
+            metrics.inc('nonce_errors', tx='撤销批准')
+            nonce_manager.resync()
         return False
+    finally:
+        if current_nonce is not None:
+            nonce_manager.release(current_nonce)
+
+# 按本地状态规划本批轮数：gas预算、在途上限、钱包A代币余额和钱包B的BNB余额
+def plan_batch(state, fees, loops_left, approve_amount=None):
+    gas_price = fee_cap(fees)
+    transfer_gas, swap_gas = gas_limit('transfer'), gas_limit('swap')
+    approve_gas = gas_limit('approve') if approve_amount is not None else 0
+    plan = batch_planner.plan(
+        loops_left,
+        round_gas=transfer_gas + swap_gas,
+        round_cost=int((transfer_gas + swap_gas * SWAP_GAS_MULTIPLIER) * gas_price),
+        extra_gas=approve_gas,
+        extra_cost=approve_gas * gas_price,
+        extra_txs=1 if approve_amount is not None else 0,
+        source_balance=state.a_token_balance,
+        amount=AMOUNT_TO_TRANSFER,
+        bnb_balance=state.bnb_balance,
+        in_flight=nonce_manager.in_flight(),
+    )
+    metrics.inc('batch_limited', limit=plan.limit)
+    return plan.rounds
+
+# 流水线执行一批：approve(可选) → K 轮 transferFrom → swap 连续签名、按nonce顺序背靠背发送，争取同一或相邻区块打包
+# approve_amount 不为None时先批准该额度；已在交易日志中确认的阶段跳过
+# 返回 {循环序号: {交易类型: 回执}}，批准的回执放在第一轮
+def execute_pipelined_batch(first_loop, loops_left, approve_amount=None):
+    # 一次快照刷新储备量和余额，本批所有交易共用同一区块的gas费用
+    state = read_state(quote=True)
+    fees = gas_oracle.fees()
+    rounds = plan_batch(state, fees, loops_left, approve_amount)
+    loops = list(range(first_loop, first_loop + rounds))
+    amounts_out_min = quote_amounts_out_min(rounds)
+    swap_tx_fees = scale_fees(fees, SWAP_GAS_MULTIPLIER)
+    
+    results = {}
+    steps = []
+    finished = set()  # 上次运行中已全部上链的循环
+    if approve_amount is not None:
+        steps.append((first_loop, "批准", lambda nonce: sign_approve_tx(nonce, approve_amount, fees)))
+    for loop, amount_out_min in zip(loops, amounts_out_min):
+        done = journal.confirmed_stages(loop)
+        results[loop] = {tx_type: {'status': 1} for tx_type in done}
+        if "Transfer" in done and "Swap" in done:
+            finished.add(loop)
+        if "Transfer" not in done:
+            steps.append((loop, "Transfer", lambda nonce: sign_transfer_tx(nonce, fees)))
+        if "Swap" not in done:
+            steps.append((loop, "Swap", lambda nonce, amount_out_min=amount_out_min: sign_swap_tx(nonce, amount_out_min, swap_tx_fees)))
+    if rounds > 1:
+        logging.info(f"本批 {rounds} 轮（循环 {loops[0]}-{loops[-1]}），共 {len(steps)} 笔交易")
+    
+    # 预执行第一笔transferFrom；钱包B已持有足够代币且不需要批准时也预执行第一笔swap
+    # （后面的交易依赖前面的交易上链，pending区块上无法模拟）。会回滚时整批不发送，只计入第一轮
+    checks = []
+    if any(tx_type == "Transfer" for _, tx_type, _ in steps):
+        checks.append(('transfer', {}))
+    if approve_amount is None and state.token_balance >= AMOUNT_TO_TRANSFER and any(tx_type == "Swap" for _, tx_type, _ in steps):
+        checks.append(('swap', {'amount_out_min': amounts_out_min[0]}))
+    reasons = [reason for reason in preflight_many(checks) if reason is not None]
+    if reasons:
+        if any("TRANSFER_FROM_FAILED" in reason for reason in reasons):
+            allowance_tracker.sync(state.allowance)
+        logging.error(f"❌ 预执行失败，本批不发送: {reasons[0]}")
+        return {first_loop: results[first_loop]}
+    
+    # 依次分配nonce、签名并发送，不等待前一笔确认
+    sent = []
+    for loop, tx_type, sign_tx in steps:
+        nonce = nonce_manager.allocate()
+        try:
+            logging.info(f"{tx_type} | nonce: {nonce}")
+            signed_tx = sign_tx(nonce)
+            sent_block = notifier.latest_block
+            journal.loop = loop
+            tx_hash = broadcast_transaction(signed_tx, tx_type)
+            tracker.track(tx_hash, nonce, tx_type, sent_block)
+            sent.append((loop, tx_type, nonce, tx_hash))
+        except Exception as e:
+            # 未发出的交易归还nonce，后续交易依赖这一笔，不再继续发送
+            nonce_manager.release(nonce)
+            error_msg = str(e)
+            short_error = error_msg[:50] + '...' if len(error_msg) > 50 else error_msg
+            logging.error(f"{tx_type} 发送失败: {short_error}")
+            if "nonce too low" in error_msg:
+                metrics.inc('nonce_errors', tx=tx_type)
+                nonce_manager.resync()
+            break
+    
+    # 统一等待所有已发送交易状态确定（每个区块一次批量查询），确认耗时和打包区块数在跟踪器回调中记录
+    entries = tracker.wait_all([tx_hash for _, _, _, tx_hash in sent], timeout=120)
+    tracker.untrack([tx_hash for _, _, _, tx_hash in sent])
+    blocks = set()
+    confirmed = 0
+    for loop, tx_type, nonce, tx_hash in sent:
+        entry = entries.get(tx_hash_key(tx_hash))
+        if entry is None or entry.status != INCLUDED:
+            status = entry.status if entry is not None else '未知'
+            logging.error(f"{tx_type} 未能上链 | nonce: {nonce} | 状态: {status}")
+            nonce_manager.release(nonce)
+            nonce_manager.resync()
+            continue
+        tx_receipt = entry.receipt
+        nonce_manager.confirm(nonce)
+        results[loop][tx_type] = tx_receipt
+        confirmed += 1
+        blocks.add(tx_receipt['blockNumber'])
+        quoter.apply_logs(tx_receipt['logs'])
+        if tx_receipt['status'] == 1:
+            if tx_type == "批准":
+                allowance_tracker.approved(approve_amount)
+            elif tx_type == "Swap":
+                allowance_tracker.spent(AMOUNT_TO_TRANSFER)
+        apply_receipt(tx_receipt)
+        logging.info(f"{tx_type} 确认 | 区块: {tx_receipt['blockNumber']} | 状态: {'成功' if tx_receipt['status'] == 1 else '失败'}")
+    
+    if blocks:
+        metrics.trace('batch', rounds=rounds, blocks=len(blocks), txs=len(sent))
+        if rounds > 1:
+            logging.info(f"本批 {rounds} 轮打包在 {len(blocks)} 个区块中")
+    if confirmed < len(steps):
+        # 本批有交易未上链，检查是否留下nonce空洞
+        nonce_manager.refill_gaps()
+    # 只返回至少发出一笔交易或已全部完成的循环；发送中断后没有发出的循环留给下一批重新规划
+    sent_loops = {loop for loop, _, _, _ in sent}
+    returned = {}
+    for loop in loops:
+        if loop not in sent_loops and loop not in finished:
+            break
+        returned[loop] = results[loop]
+    return returned
+
+# 从交易日志恢复：一次批量请求核对上次运行未完成的交易，原样重发仍在途的交易并等待确认
+# 返回接下来要执行的循环序号
+def resume_from_journal():
+    journal.bind(wallet_b_address, state_reader.chain_id)
+    summary = journal.reconcile(w3, wallet_b_address)
+    if any(summary.values()):
+        logging.info(f"交易日志核对 | 已确认: {len(summary.confirmed)} | 失败: {len(summary.failed)} | "
+                     f"已丢弃: {len(summary.dropped)} | 在途: {len(summary.in_flight)}")
+    for row in summary.in_flight:
+        journal.loop = row.loop
+        try:
+            broadcast_transaction(row, row.stage)
+        except Exception as e:
+            # 重发失败时交易可能刚好已经上链，仍交给跟踪器判断
+            error_msg = str(e)
+            short_error = error_msg[:50] + '...' if len(error_msg) > 50 else error_msg
+            logging.warning(f"{row.stage} 重发失败 (nonce {row.nonce}): {short_error}")
+        tracker.track(row.hash, row.nonce, row.stage)
+    entries = tracker.wait_all([row.hash for row in summary.in_flight], timeout=notifier.block_time * STUCK_BLOCKS)
+    tracker.untrack([row.hash for row in summary.in_flight])
+    for row in summary.in_flight:
+        entry = entries.get(tx_hash_key(row.hash))
+        if entry is None or entry.status != INCLUDED:
+            logging.warning(f"{row.stage} 恢复失败 (nonce {row.nonce}): {entry.status if entry is not None else '未知'}")
+            continue
+        logging.info(f"{row.stage} 恢复确认 | 区块: {entry.receipt['blockNumber']} | 状态: {'成功' if entry.receipt['status'] == 1 else '失败'}")
+    completed_loop = journal.completed_loop()
+    if completed_loop:
+        logging.info(f"上次运行已完成 {completed_loop} 次循环，从第 {completed_loop + 1} 次继续")
+    return completed_loop + 1
+
+# 剩余授权额度不足以覆盖 loops_left 次循环时返回需要批准的金额（按授权策略），否则返回None
+def approval_needed(loops_left):
+    return allowance_tracker.approval_amount(AMOUNT_TO_TRANSFER, loops_left)
+
+# 授权额度的日志显示
+def format_allowance(amount):
+    return "无限大" if amount == MAX_UINT256 else amount / (10 ** TOKEN_DECIMALS)
+
+# 输出各阶段平均耗时
+def log_metrics_summary():
+    for stage, (avg_ms, count) in sorted(metrics.summary().items()):
+        logging.info(f"阶段耗时 | {stage}: 平均 {avg_ms} ms ({count} 次)")
 
 def main():
+    init_runtime()
     try:
         logging.info(f"钱包地址: {wallet_b_address}")
         
+        # 核对交易日志，处理上次中断时在途的交易
+        start_loop = resume_from_journal()
+        
         # 获取初始nonce
-        initial_nonce = w3.eth.get_transaction_count(wallet_b_address)
+        initial_nonce = nonce_manager.resync()
         logging.info(f"初始nonce: {initial_nonce}")
         
-        # 先进行无限批准
-        if not approve_token_with_max_amount():
-            logging.error("无限批准失败，无法继续")
-            return
+        # 启动时读取一次授权额度，之后在本地跟踪；剩余额度够用时跳过批准
+        allowance_tracker.sync(read_state().allowance)
+        logging.info(f"当前授权额度: {format_allowance(allowance_tracker.allowance)} | 授权策略: {APPROVAL_POLICY}")
+        
+        # 额度不足时先批准（流水线模式下与每轮交易一起发送）
+        if not PIPELINE:
+            approve_amount = approval_needed(LOOP_COUNT - start_loop + 1)
+            if approve_amount is not None and not approve_token(approve_amount):
+                logging.error("批准失败，无法继续")
+                return
         
         # 循环执行指定次数
-        loop_counter = 1
+        loop_counter = start_loop
         while loop_counter <= LOOP_COUNT:
             logging.info(f"\n===== 开始第 {loop_counter}/{LOOP_COUNT} 次循环 =====\n")
+            journal.loop = loop_counter
+            
+            if PIPELINE:
+                # 本地判断剩余额度能否覆盖剩下的循环，不需要查询链上
+                loops_left = LOOP_COUNT - loop_counter + 1
+                approve_amount = approval_needed(loops_left)
+                with metrics.span('round'):
+                    results = execute_pipelined_batch(loop_counter, loops_left, approve_amount)
+                if approve_amount is not None and results.get(loop_counter, {}).get("批准", {}).get('status') != 1:
+                    logging.error("批准失败，无法继续")
+                    return
+                
+                for loop, receipts in results.items():
+                    if receipts.get("Transfer", {}).get('status') != 1:
+                        logging.error(f"循环 {loop}: 无法完成transferFrom交易")
+                    elif receipts.get("Swap", {}).get('status') != 1:
+                        logging.error(f"循环 {loop}: 无法完成swap交易")
+                    else:
+                        logging.info(f"✨ 循环 {loop}: TransferFrom和Swap成功完成!")
+                    journal.complete_loop(loop)
+                loop_counter += len(results)
+                if loop_counter <= LOOP_COUNT:
+                    logging.info(f"等待 {LOOP_INTERVAL} 秒后开始下一次循环...")
+                    time.sleep(LOOP_INTERVAL)
+                continue
             
             # 执行transferFrom交易，每2秒一次直到成功
             logging.info("开始执行transferFrom交易，每2秒发送一次直到成功")
             
-            # 执行transferFrom直到成功
-            success, block = execute_transfer_from()
+            # 执行transferFrom直到成功，本次循环中断前已经上链的阶段跳过
+            done = journal.confirmed_stages(loop_counter)
+            round_start = time.perf_counter()
+            if "Transfer" in done:
+                logging.info(f"循环 {loop_counter}: transferFrom已在上次运行中完成")
+                success = True
+            else:
+                success, block = execute_transfer_from()
             if not success:
                 logging.error(f"循环 {loop_counter}: 无法完成transferFrom交易")
+                journal.complete_loop(loop_counter)
                 loop_counter += 1
                 if loop_counter <= LOOP_COUNT:
                     logging.info(f"等待 {LOOP_INTERVAL} 秒后尝试下一次循环...")
@@ -432,142 +1083,42 @@ def main():
             # 等待短暂停后继续下一步操作
             time.sleep(0.1)
             
-            # 执行swap操作（使用无限批准）
-            success, _, swap_block = execute_swap()
+            # 执行swap操作
+            success, _, swap_block = execute_swap(LOOP_COUNT - loop_counter + 1) if "Swap" not in done else (True, None, None)
+            metrics.observe('round', time.perf_counter() - round_start)
             if not success:
                 logging.error(f"循环 {loop_counter}: 无法完成swap交易")
             else:
                 logging.info(f"✨ 循环 {loop_counter}: Swap成功完成!")
                 
             # 增加循环计数并等待指定时间
+            journal.complete_loop(loop_counter)
             loop_counter += 1
             if loop_counter <= LOOP_COUNT:
                 logging.info(f"等待 {LOOP_INTERVAL} 秒后开始下一次循环...")
                 time.sleep(LOOP_INTERVAL)
         
-        # 全部完成后撤销批准
-        logging.info("\n===== 全部循环完成，开始撤销批准 =====\n")
-        if revoke_token_approval():
-            logging.info("✨✨✨ 所有操作已成功完成，并已撤销批准! ✨✨✨")
+        # 全部完成后按授权策略撤销批准
+        if not allowance_tracker.revoke_on_exit:
+            journal.finish_run()
+            logging.info(f"✨✨✨ 所有操作已成功完成! 剩余授权额度: {format_allowance(allowance_tracker.allowance)} ✨✨✨")
         else:
-            logging.warning("✨✨✨ 循环操作完成，但撤销批准失败! ✨✨✨")
+            logging.info("\n===== 全部循环完成，开始撤销批准 =====\n")
+            if revoke_token_approval():
+                journal.finish_run()
+                logging.info("✨✨✨ 所有操作已成功完成，并已撤销批准! ✨✨✨")
+            else:
+                logging.warning("✨✨✨ 循环操作完成，但撤销批准失败! ✨✨✨")
+        broadcaster.log_stats()
+        log_metrics_summary()
     except Exception as error:
         error_msg = str(error)
         short_error = error_msg[:100] + '...' if len(error_msg) > 100 else error_msg
         logging.error(f"错误: {short_error}")
-        # 如果出错，尝试撤销批准
-        logging.info("出错，尝试撤销批准...")
-        revoke_token_approval()
-        raise
-        
-        # 获取swap前的代币余额和BNB余额
-        token_balance_before = token_contract.functions.balanceOf(wallet_b_address).call()
-        bnb_balance_before = w3.eth.get_balance(wallet_b_address)
-        logging.info(f"Swap前代币余额: {token_balance_before / (10 ** TOKEN_DECIMALS)}")
-        logging.info(f"Swap剋BNB余额: {w3.from_wei(bnb_balance_before, 'ether')} ETH")
-        
-        swap_success = False
-        while not swap_success:
-            try:
-                # 重新获取当前nonce
-                current_nonce = w3.eth.get_transaction_count(wallet_b_address)
-                logging.info(f"Swap使用nonce: {current_nonce}")
-                
-                # 构建swap交易
-                swap_txn = router_contract.functions.swapExactTokensForETH(
-                    AMOUNT_TO_TRANSFER,
-                    amount_out_min,
-                    path,
-                    Web3.to_checksum_address(WALLET_A_ADDRESS),
-                    DEADLINE
-                ).build_transaction({
-                    'chainId': w3.eth.chain_id,
-                    'gas': GAS_LIMIT_SWAP,
-                    'gasPrice': w3.eth.gas_price,
-                    'nonce': current_nonce,
-                })
-                
-                # 签名交易
-                signed_txn = w3.eth.account.sign_transaction(swap_txn, PRIVATE_KEY)
-                
-                # 发送交易并等待确认
-                tx_hash, tx_receipt = send_transaction_with_retry(signed_txn, "Swap")
-                
-                # 获取当前区块
-                current_block = tx_receipt['blockNumber']
-                logging.info(f"Swap 交易已在区块 {current_block} 确认")
-                
-                # 即时验证swap是否真正生效 - 检查代币减少和BNB增加
-                token_balance_after = token_contract.functions.balanceOf(wallet_b_address).call()
-                bnb_balance_after = w3.eth.get_balance(wallet_b_address)
-                
-                logging.info(f"Swap后代币余额: {token_balance_after / (10 ** TOKEN_DECIMALS)}")
-                logging.info(f"Swap后BNB余额: {w3.from_wei(bnb_balance_after, 'ether')} ETH")
-                
-                # 检查代币是否减少和BNB是否增加
-                token_decreased = token_balance_after < token_balance_before
-                bnb_increased = bnb_balance_after > bnb_balance_before
-                
-                if token_decreased and bnb_increased:
-                    logging.info("✅ Swap交互成功确认：代币已减少，BNB已增加")
-                    swap_success = True
-                elif token_decreased:
-                    logging.warning("⚠️ 代币已减少但BNB未增加，可能是手续费过高")
-                    if tx_receipt['status'] == 1:  # 交易状态成功
-                        logging.info("交易状态成功，将视为成功完成")
-                        swap_success = True
-                elif bnb_increased:
-                    logging.warning("⚠️ BNB已增加但代币未减少，这是意外情况")
-                    if tx_receipt['status'] == 1:  # 交易状态成功
-                        logging.info("交易状态成功，将视为成功完成")
-                        swap_success = True
-                else:
-                    # 交易确认但没有实际变化
-                    if tx_receipt['status'] == 1:  # 交易状态成功
-                        logging.warning("⚠️ 交易状态成功但余额未变化，可能需要检查交易参数")
-                        # 可能由于交易路径或参数问题导致实际没有交换成功
-                        # 如果你确定这种情况属于正常，可以取消下面的注释
-                        # swap_success = True
-                    else:
-                        logging.error("❌ 交易状态失败，将重试...")
-                
-                if not swap_success:
-                    time.sleep(0.5)  # 等待后重试
-            except Exception as e:
-                error_str = str(e)
-                logging.error(f"Swap执行失败: {error_str}")
-                
-                # 特殊处理TransferHelper: TRANSFER_FROM_FAILED错误
-                if "TRANSFER_FROM_FAILED" in error_str:
-                    logging.warning("检测到TRANSFER_FROM_FAILED错误，可能是代币合约限制或授权问题")
-                    
-                    # 检查代币是否有一次性购买费用或其他特殊限制
-                    try:
-                        # 重新完全授权
-                        logging.info("尝试重新完全授权...")
-                        approve_success, _ = approve_token_with_max_amount()
-                        if approve_success:
-                            logging.info("重新授权成功，等待一秒后继续...")
-                            time.sleep(1)  # 等待更长时间让区块链处理授权
-                            continue
-                    except Exception as approve_error:
-                        logging.error(f"重新授权失败: {str(approve_error)}")
-                
-                # 尝试调整金额
-                if "TRANSFER_FROM_FAILED" in error_str and AMOUNT_TO_TRANSFER > 1:
-                    reduced_amount = int(AMOUNT_TO_TRANSFER * 0.9)  # 减少10%
-                    logging.info(f"尝试降低交易金额至: {reduced_amount / (10 ** TOKEN_DECIMALS)}")
-                    # 不实际修改全局AMOUNT_TO_TRANSFER变量，只在这次尝试中使用较低的金额
-                    AMOUNT_TO_TRANSFER = reduced_amount
-                    time.sleep(1)
-                    continue
-                    
-                logging.info("等待1秒后重试...")
-                time.sleep(1)  # 增加等待时间
-        
-        logging.info("所有操作已成功完成!")
-    except Exception as error:
-        logging.error(f"错误: {error}")
+        # 如果出错，按授权策略尝试撤销批准
+        if allowance_tracker.revoke_on_exit:
+            logging.info("出错，尝试撤销批准...")
+            revoke_token_approval()
         raise
 
 # Run the script
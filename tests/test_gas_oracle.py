@@ -0,0 +1,36 @@
+import pytest
+from gas_oracle import GWEI, ClampStrategy, FeeCeilingReached, FixedStrategy, GasOracle
+
+
+def oracle(market_gwei, ceiling_gwei):
+    strategy = ClampStrategy(FixedStrategy(int(market_gwei * GWEI)), ceiling=int(ceiling_gwei * GWEI))
+    return GasOracle(None, strategy)
+
+
+def test_bump_stays_under_ceiling():
+    gas_oracle = oracle(1, 10)
+    fees = {'gasPrice': 4 * GWEI}
+    bumped = gas_oracle.bump(fees)
+    assert bumped['gasPrice'] == int(4 * GWEI * 1.125) + 1
+
+
+def test_repeated_bumps_stop_at_ceiling():
+    gas_oracle = oracle(1, 10)
+    fees = {'gasPrice': 5 * GWEI}
+    for _ in range(5):
+        fees = gas_oracle.bump(fees)
+    assert fees['gasPrice'] <= 10 * GWEI
+    with pytest.raises(FeeCeilingReached):
+        for _ in range(20):
+            fees = gas_oracle.bump(fees)
+    assert fees['gasPrice'] <= 10 * GWEI
+
+
+def test_eip1559_bump_clamps_max_fee_and_tip():
+    gas_oracle = GasOracle(None, FixedStrategy(GWEI), ceiling=3 * GWEI)
+    gas_oracle.strategy.fetch = lambda w3: {'maxFeePerGas': GWEI, 'maxPriorityFeePerGas': GWEI // 2}
+    bumped = gas_oracle.bump({'maxFeePerGas': 2 * GWEI, 'maxPriorityFeePerGas': GWEI})
+    assert bumped['maxFeePerGas'] <= 3 * GWEI
+    assert bumped['maxPriorityFeePerGas'] <= bumped['maxFeePerGas']
+    with pytest.raises(FeeCeilingReached):
+        gas_oracle.bump({'maxFeePerGas': 3 * GWEI, 'maxPriorityFeePerGas': GWEI})
@@ -0,0 +1,54 @@
+from eth_account import Account
+from journal import CONFIRMED, DROPPED, PENDING, TxJournal
+from rpc import tx_hash_key
+
+ACCOUNT = Account.from_key('0x' + '01' * 32)
+
+
+def signed(nonce):
+    return ACCOUNT.sign_transaction({'to': '0x' + '22' * 20, 'value': 0, 'gas': 21000, 'gasPrice': 10 ** 9,
+                                     'nonce': nonce, 'chainId': 56})
+
+
+class FakeWeb3:
+    """批量请求：receipts 中的交易已上链，钱包已上链nonce为 chain_nonce"""
+
+    def __init__(self, receipts, chain_nonce):
+        self.receipts = receipts
+        self.chain_nonce = chain_nonce
+        self.provider = self
+
+    def make_batch_request(self, calls):
+        responses = []
+        for method, params in calls:
+            if method == 'eth_getTransactionCount':
+                responses.append({'result': hex(self.chain_nonce)})
+            else:
+                receipt = self.receipts.get(params[0])
+                responses.append({'result': receipt})
+        return responses
+
+
+def status(journal, tx):
+    return journal._conn.execute('SELECT status FROM transactions WHERE tx_hash = ?', (tx_hash_key(tx.hash),)).fetchone()['status']
+
+
+def test_reconcile_rechecks_dropped_transactions():
+    journal = TxJournal(':memory:')
+    landed, resend, stale = signed(5), signed(6), signed(4)
+    for tx in (landed, resend, stale):
+        journal.record(tx, 'Transfer')
+    # 跟踪器标记为丢弃：landed 之后上链，resend 的nonce仍未被消耗，stale 的nonce已被其他交易消耗
+    for tx in (landed, resend):
+        journal.mark(tx.hash, DROPPED)
+    w3 = FakeWeb3({tx_hash_key(landed.hash): {'status': '0x1', 'blockNumber': '0x10'}}, chain_nonce=6)
+
+    summary = journal.reconcile(w3, ACCOUNT.address)
+
+    assert [row.nonce for row in summary.confirmed] == [5]
+    assert [row.nonce for row in summary.in_flight] == [6]
+    assert [row.nonce for row in summary.dropped] == [4]
+    assert status(journal, landed) == CONFIRMED
+    # 重发时恢复为 pending
+    journal.record(resend, 'Transfer')
+    assert status(journal, resend) == PENDING
@@ -0,0 +1,47 @@
+from eth_abi import encode
+from hexbytes import HexBytes
+from ledger import APPROVAL_TOPIC, TRANSFER_TOPIC, BalanceLedger
+
+TOKEN = '0x' + '22' * 20
+WALLET_A = '0x' + '33' * 20
+WALLET_B = '0x' + '44' * 20
+ROUTER = '0x' + '55' * 20
+
+
+def topic(address):
+    return HexBytes(bytes(12) + bytes.fromhex(address[2:]))
+
+
+def log(event_topic, sender, recipient, data, extra_topics=()):
+    return {'address': TOKEN, 'topics': [event_topic, topic(sender), topic(recipient), *extra_topics], 'data': HexBytes(data)}
+
+
+def ledger():
+    book = BalanceLedger(TOKEN, WALLET_A, WALLET_B, ROUTER)
+    book.checkpoint({'a_token_balance': 100, 'token_balance': 0, 'bnb_balance': 10 ** 18})
+    return book
+
+
+def test_transfer_and_approval_logs():
+    book = ledger()
+    allowance = book.apply_receipt({'logs': [
+        log(TRANSFER_TOPIC, WALLET_A, WALLET_B, encode(['uint256'], [30])),
+        log(APPROVAL_TOPIC, WALLET_B, ROUTER, encode(['uint256'], [70])),
+    ]})
+    assert allowance == 70
+    assert book.snapshot().a_token_balance == 70
+    assert book.snapshot().token_balance == 30
+
+
+def test_nonstandard_logs_are_skipped():
+    book = ledger()
+    other_event = HexBytes(b'\x01' * 32)
+    book.apply_receipt({'logs': [
+        # 其他事件：数据不是一个uint256
+        log(other_event, WALLET_A, WALLET_B, encode(['uint256', 'uint256'], [1, 2])),
+        # 数量作为indexed参数的Transfer：data为空
+        log(TRANSFER_TOPIC, WALLET_A, WALLET_B, b'', [HexBytes(encode(['uint256'], [5]))]),
+        log(TRANSFER_TOPIC, WALLET_A, WALLET_B, encode(['uint256'], [30])),
+    ]})
+    assert book.snapshot().a_token_balance == 70
+    assert book.snapshot().token_balance == 30
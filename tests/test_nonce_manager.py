@@ -0,0 +1,107 @@
+from nonce_manager import NonceManager
+
+ADDRESS = '0x' + '11' * 20
+
+
+class FakeEth:
+    """get_transaction_count 返回预设的 latest / pending 计数"""
+
+    def __init__(self, latest, pending=None):
+        self.counts = {'latest': latest, 'pending': latest if pending is None else pending}
+        self.calls = []
+
+    def get_transaction_count(self, address, block_identifier='latest'):
+        self.calls.append(block_identifier)
+        return self.counts[block_identifier]
+
+
+class FakeWeb3:
+    def __init__(self, latest, pending=None):
+        self.eth = FakeEth(latest, pending)
+
+
+def manager(latest, pending=None):
+    return NonceManager(FakeWeb3(latest, pending), ADDRESS)
+
+
+def test_allocate_starts_from_pending_count_and_queries_once():
+    nm = manager(5, 7)
+    assert [nm.allocate() for _ in range(3)] == [7, 8, 9]
+    assert nm.w3.eth.calls == ['pending']
+    assert nm.in_flight() == 3
+
+
+def test_release_is_reused_lowest_first():
+    nm = manager(0)
+    nonces = [nm.allocate() for _ in range(4)]
+    nm.release(nonces[2])
+    nm.release(nonces[1])
+    assert nm.peek() == 1
+    assert nm.allocate() == 1
+    assert nm.allocate() == 2
+    assert nm.allocate() == 4
+
+
+def test_release_ignores_confirmed_nonce():
+    nm = manager(0)
+    nonce = nm.allocate()
+    nm.confirm(nonce)
+    nm.release(nonce)
+    assert nm.allocate() == 1
+
+
+def test_resync_restarts_from_chain_and_skips_in_flight():
+    nm = manager(0)
+    for _ in range(3):
+        nm.allocate()
+    nm.confirm(0)
+    # 链上pending计数只到1：nonce 1、2 仍在途，重新分配时跳过
+    nm.w3.eth.counts.update(latest=1, pending=1)
+    assert nm.resync() == 1
+    assert nm.allocate() == 3
+
+
+def test_refill_gaps_finds_unsent_nonces():
+    nm = manager(0)
+    nonces = [nm.allocate() for _ in range(4)]
+    nm.confirm(nonces[0])
+    # nonce 1 分配后既未确认也未归还（如发送线程异常退出）
+    nm._in_flight.discard(nonces[1])
+    nm.w3.eth.counts.update(latest=1, pending=1)
+    assert nm.refill_gaps() == [1]
+    assert nm.allocate() == 1
+    assert nm.allocate() == 4
+
+
+def test_refill_gaps_skips_nonces_still_in_pool():
+    nm = manager(0)
+    nonces = [nm.allocate() for _ in range(4)]
+    # 批量超时：nonce 0-2 仍在交易池中，nonce 3 未发出；调用方归还后重新同步
+    nm.release(nonces[3])
+    nm.w3.eth.counts.update(latest=0, pending=3)
+    nm.resync()
+    assert nm.refill_gaps() == []
+    assert nm.allocate() == 3
+
+
+def test_refill_gaps_jumps_to_chain_when_wallet_used_elsewhere():
+    nm = manager(0)
+    nm.allocate()
+    nm.w3.eth.counts.update(latest=5, pending=6)
+    assert nm.refill_gaps() == []
+    assert nm.allocate() == 6
+
+
+def test_refill_gaps_before_first_allocate():
+    nm = manager(3)
+    assert nm.refill_gaps() == []
+
+
+def test_resync_keeps_released_nonces_of_other_workers():
+    nm = manager(0)
+    nonces = [nm.allocate() for _ in range(3)]
+    # 一个进程归还了 nonce 1，另一个进程启动时重新同步
+    nm.release(nonces[1])
+    nm.w3.eth.counts.update(latest=0, pending=1)
+    nm.resync()
+    assert [nm.allocate() for _ in range(2)] == [1, 3]
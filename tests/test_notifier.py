@@ -0,0 +1,126 @@
+import json
+import time
+import queue
+import threading
+import pytest
+from notifier import BlockNotifier
+
+websockets_server = pytest.importorskip('websockets.sync.server')
+
+SUBSCRIPTION = '0x9cef478923ff08bf67fde6c64013158d'
+TX_1 = '0x' + 'aa' * 32
+TX_2 = '0x' + 'bb' * 32
+
+
+class StandInNode:
+    """本地WebSocket节点：应答 eth_subscribe，之后推送 heads 队列中的 newHeads；队列中的None表示断开连接"""
+
+    def __init__(self):
+        self.heads = queue.Queue()
+        self.subscribed = threading.Event()
+        self.server = websockets_server.serve(self._handle, '127.0.0.1', 0)
+        self.url = f"ws://127.0.0.1:{self.server.socket.getsockname()[1]}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def _handle(self, conn):
+        request = json.loads(conn.recv())
+        assert request['method'] == 'eth_subscribe' and request['params'] == ['newHeads']
+        conn.send(json.dumps({'jsonrpc': '2.0', 'id': request['id'], 'result': SUBSCRIPTION}))
+        self.subscribed.set()
+        while True:
+            number = self.heads.get()
+            if number is None:
+                return
+            conn.send(json.dumps({'jsonrpc': '2.0', 'method': 'eth_subscription', 'params': {
+                'subscription': SUBSCRIPTION, 'result': {'number': hex(number)}}}))
+
+    def close(self):
+        self.server.shutdown()
+
+
+class FakeProvider:
+    """批量回执查询：记录每次批量请求，所有交易都已上链"""
+
+    def __init__(self):
+        self.batches = []
+
+    def make_batch_request(self, calls):
+        self.batches.append([params[0] for _, params in calls])
+        return [{'result': {'transactionHash': tx_hash, 'blockNumber': '0xa', 'status': '0x1', 'logs': []}}
+                for _, (tx_hash,) in calls]
+
+
+class FakeEth:
+    block_number = 20
+
+
+class FakeWeb3:
+    def __init__(self):
+        self.provider = FakeProvider()
+        self.eth = FakeEth()
+
+
+@pytest.fixture
+def node():
+    node = StandInNode()
+    yield node
+    node.close()
+
+
+def wait_until(predicate, timeout=5):
+    deadline = time.time() + timeout
+    while not predicate():
+        assert time.time() < deadline
+        time.sleep(0.01)
+
+
+def run(results, key, fn, *args):
+    thread = threading.Thread(target=lambda: results.__setitem__(key, fn(*args)), daemon=True)
+    thread.start()
+    return thread
+
+
+def test_waiters_share_one_head_and_one_receipt_batch(node):
+    w3 = FakeWeb3()
+    notifier = BlockNotifier(w3, node.url)
+    try:
+        notifier.start()
+        assert node.subscribed.wait(5)
+        node.heads.put(9)
+        wait_until(lambda: notifier.latest_block == 9)
+
+        results = {}
+        threads = [
+            run(results, 'block', notifier.wait_for_block, 9, 5),
+            run(results, TX_1, notifier.wait_for_receipt, TX_1, 5),
+            run(results, TX_2, notifier.wait_for_receipt, TX_2, 5),
+        ]
+        wait_until(lambda: notifier._block_waiters == 1 and len(notifier._waiting) == 2)
+        node.heads.put(10)
+        for thread in threads:
+            thread.join(5)
+
+        assert results['block'] == 10
+        assert results[TX_1]['blockNumber'] == 10
+        assert results[TX_2]['blockNumber'] == 10
+        # 一个新区块只发一次批量回执查询，包含所有等待中的交易
+        assert len(w3.provider.batches) == 1
+        assert sorted(w3.provider.batches[0]) == [TX_1, TX_2]
+    finally:
+        notifier.stop()
+
+
+def test_falls_back_to_polling_when_socket_drops(node):
+    w3 = FakeWeb3()
+    notifier = BlockNotifier(w3, node.url, min_poll_interval=0.05, reconnect_delay=30)
+    try:
+        notifier.start()
+        assert node.subscribed.wait(5)
+        node.heads.put(9)
+        wait_until(lambda: notifier.latest_block == 9)
+
+        # 节点断开连接：之后的区块只能通过轮询 eth_blockNumber 得到
+        node.heads.put(None)
+        assert notifier.wait_for_block(9, timeout=5) == FakeEth.block_number
+    finally:
+        notifier.stop()
@@ -0,0 +1,113 @@
+import pytest
+from eth_abi import decode, encode
+from web3 import Web3
+from web3.datastructures import AttributeDict
+from quoter import SYNC_TOPIC, PairQuoter, get_amount_in, get_amount_out
+
+E18 = 10 ** 18
+ROUTER = '0x' + '99' * 20
+FACTORY = Web3.to_checksum_address('0x' + '88' * 20)
+TOKEN_A = Web3.to_checksum_address('0x' + '11' * 20)
+TOKEN_B = Web3.to_checksum_address('0x' + '22' * 20)
+TOKEN_C = Web3.to_checksum_address('0x' + '33' * 20)
+PAIR_AB = Web3.to_checksum_address('0x' + 'ab' * 20)
+PAIR_BC = Web3.to_checksum_address('0x' + 'bc' * 20)
+
+
+# (amount_in, reserve_in, reserve_out, PancakeLibrary.getAmountOut)
+AMOUNT_OUT_CASES = [
+    (1000, 10000, 10000, 907),
+    (1, 10000, 10000, 0),
+    (E18, 100 * E18, 200 * E18, 1975296418228173964),
+    (10 ** 6, 5 * 10 ** 9, 7 * 10 ** 20, 139622145381996291),
+    (0, 10000, 10000, 0),
+    (1000, 0, 10000, 0),
+]
+
+# (amount_out, reserve_in, reserve_out, PancakeLibrary.getAmountIn)，流动性不足为None
+AMOUNT_IN_CASES = [
+    (907, 10000, 10000, 1000),
+    (1, 10000, 10000, 2),
+    (9975, 10 ** 6, 10 ** 6, 10101),
+    (100, 3990, 500, 1001),   # 恰好整除时同样 +1
+    (E18, 100 * E18, 200 * E18, 503771992796060504),
+    (10000, 10000, 10000, None),
+    (0, 10000, 10000, None),
+]
+
+
+@pytest.mark.parametrize('amount_in, reserve_in, reserve_out, expected', AMOUNT_OUT_CASES)
+def test_get_amount_out_matches_router(amount_in, reserve_in, reserve_out, expected):
+    assert get_amount_out(amount_in, reserve_in, reserve_out) == expected
+
+
+@pytest.mark.parametrize('amount_out, reserve_in, reserve_out, expected', AMOUNT_IN_CASES)
+def test_get_amount_in_matches_router(amount_out, reserve_in, reserve_out, expected):
+    assert get_amount_in(amount_out, reserve_in, reserve_out) == expected
+
+
+class FakeStateReader:
+    """factory/getPair 返回固定地址，getReserves 返回 reserves 中的值"""
+
+    def __init__(self, reserves, block_number=100):
+        self.reserves = reserves
+        self.block_number = block_number
+        self.pairs = {
+            PairQuoter.sort_tokens(TOKEN_A, TOKEN_B): PAIR_AB,
+            PairQuoter.sort_tokens(TOKEN_B, TOKEN_C): PAIR_BC,
+        }
+
+    def read(self, reads, block_identifier='latest'):
+        state = {'block_number': self.block_number}
+        for read in reads:
+            if read.key == 'factory':
+                state['factory'] = FACTORY
+            elif read.key == 'pair':
+                tokens = decode(['address', 'address'], bytes(read.calldata[4:]))
+                state['pair'] = self.pairs[tuple(Web3.to_checksum_address(t) for t in tokens)]
+            else:
+                state[read.key] = self.reserves[read.target]
+        return AttributeDict(state)
+
+
+def make_quoter():
+    # token0 为地址较小的一方：A/B 交易对中 A 是 token0，B/C 交易对中 B 是 token0
+    reserves = {PAIR_AB: (100 * E18, 200 * E18, 0), PAIR_BC: (400 * E18, 100 * E18, 0)}
+    return PairQuoter(None, ROUTER, FakeStateReader(reserves))
+
+
+def test_multi_hop_quotes_match_router():
+    quoter = make_quoter()
+    assert quoter.get_amounts_out(5 * E18, [TOKEN_A, TOKEN_B, TOKEN_C]) == [
+        5 * E18, 9501131087034170734, 2314505944041354960]
+    assert quoter.get_amounts_in(2 * E18, [TOKEN_A, TOKEN_B, TOKEN_C]) == [
+        4277131953129584134, 8183724617666615519, 2 * E18]
+    # 反方向使用同一交易对，储备量按代币顺序翻转
+    assert quoter.reserves(TOKEN_B, TOKEN_A) == (200 * E18, 100 * E18, 100)
+
+
+def sync_log(pair, reserve0, reserve1, block_number, log_index):
+    return {
+        'address': pair,
+        'topics': [SYNC_TOPIC],
+        'data': encode(['uint112', 'uint112'], [reserve0, reserve1]),
+        'blockNumber': block_number,
+        'logIndex': log_index,
+    }
+
+
+def test_apply_logs_orders_by_block_and_log_index():
+    quoter = make_quoter()
+    quoter.refresh([TOKEN_A, TOKEN_B])
+    # 快照所在区块的日志不会覆盖快照
+    quoter.apply_logs([sync_log(PAIR_AB, 1, 2, 100, 7)])
+    assert quoter.reserves(TOKEN_A, TOKEN_B) == (100 * E18, 200 * E18, 100)
+    # 更新区块的日志生效，同一区块中较早的日志被忽略
+    quoter.apply_logs([sync_log(PAIR_AB, 3, 4, 101, 5), sync_log(PAIR_AB, 5, 6, 101, 2)])
+    assert quoter.reserves(TOKEN_A, TOKEN_B) == (3, 4, 101)
+    quoter.apply_logs([sync_log(PAIR_AB, 7, 8, 101, 9)])
+    assert quoter.reserves(TOKEN_A, TOKEN_B) == (7, 8, 101)
+    # 不在缓存中的交易对和其他事件不处理
+    quoter.apply_logs([sync_log(PAIR_BC, 1, 1, 102, 0), dict(sync_log(PAIR_AB, 9, 9, 102, 0), topics=[b'\x00' * 32])])
+    assert quoter.reserves(TOKEN_A, TOKEN_B) == (7, 8, 101)
+    assert quoter.reserves(TOKEN_B, TOKEN_C) is None
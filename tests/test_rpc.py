@@ -0,0 +1,81 @@
+import pytest
+from rpc import _NO_BATCH_PROVIDERS, TRANSPORT_ERROR, batch_request, batch_responses
+
+CALLS = [('eth_blockNumber', []), ('eth_chainId', [])]
+
+
+class FakeProvider:
+    """批量请求返回预设响应（或抛出预设异常），单个请求返回方法名"""
+
+    def __init__(self, batch_response):
+        self.batch_response = batch_response
+        self.batch_calls = 0
+
+    def make_batch_request(self, calls):
+        self.batch_calls += 1
+        if isinstance(self.batch_response, Exception):
+            raise self.batch_response
+        return self.batch_response
+
+    def make_request(self, method, params):
+        return {'result': method}
+
+
+class FakeWeb3:
+    def __init__(self, provider):
+        self.provider = provider
+
+
+def test_batch_results_in_order():
+    w3 = FakeWeb3(FakeProvider([{'result': '0x1'}, {'result': '0x38'}]))
+    assert batch_request(w3, CALLS) == ['0x1', '0x38']
+
+
+@pytest.mark.parametrize('response', [
+    TimeoutError('read timed out'),
+    [{'result': '0x1'}],
+])
+def test_transient_failure_falls_back_once(response):
+    provider = FakeProvider(response)
+    w3 = FakeWeb3(provider)
+    assert batch_request(w3, CALLS) == ['eth_blockNumber', 'eth_chainId']
+    assert id(provider) not in _NO_BATCH_PROVIDERS
+    batch_request(w3, CALLS)
+    assert provider.batch_calls == 2
+
+
+@pytest.mark.parametrize('response', [
+    {'jsonrpc': '2.0', 'id': None, 'error': {'code': -32601, 'message': 'method not found'}},
+    [{'jsonrpc': '2.0', 'id': None, 'error': {'code': -32600, 'message': 'invalid request'}}],
+    NotImplementedError(),
+])
+def test_unsupported_batch_is_remembered(response):
+    provider = FakeProvider(response)
+    w3 = FakeWeb3(provider)
+    try:
+        assert batch_request(w3, CALLS) == ['eth_blockNumber', 'eth_chainId']
+        assert id(provider) in _NO_BATCH_PROVIDERS
+        batch_request(w3, CALLS)
+        assert provider.batch_calls == 1
+    finally:
+        _NO_BATCH_PROVIDERS.discard(id(provider))
+
+
+class FlakyProvider(FakeProvider):
+    """批量请求失败，单个请求中 eth_chainId 超时、eth_call 回滚"""
+
+    def make_request(self, method, params):
+        if method == 'eth_chainId':
+            raise TimeoutError('read timed out')
+        if method == 'eth_call':
+            return {'error': {'code': 3, 'message': 'execution reverted'}}
+        return {'result': method}
+
+
+def test_transport_error_is_distinct_from_revert():
+    w3 = FakeWeb3(FlakyProvider(ConnectionError('reset')))
+    block, chain_id, call = batch_responses(w3, CALLS + [('eth_call', [{}, 'pending'])])
+    assert block == {'result': 'eth_blockNumber'}
+    assert chain_id == {TRANSPORT_ERROR: 'read timed out'}
+    assert 'error' not in chain_id
+    assert call['error']['message'] == 'execution reverted'
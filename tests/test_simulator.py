@@ -0,0 +1,35 @@
+from simulator import Simulator
+
+SENDER = '0x' + '11' * 20
+TARGET = '0x' + '22' * 20
+
+
+class FakeProvider:
+    """按 eth_call 的 data 返回：0x01 回滚，0x02 超时，其他成功"""
+
+    def make_batch_request(self, calls):
+        raise ConnectionError('batch failed')
+
+    def make_request(self, method, params):
+        data = params[0]['data']
+        if data == '0x02':
+            raise TimeoutError('read timed out')
+        if data == '0x01':
+            return {'error': {'code': 3, 'message': 'execution reverted: TRANSFER_FROM_FAILED'}}
+        return {'result': '0x5208' if method == 'eth_estimateGas' else '0x'}
+
+
+class FakeWeb3:
+    provider = FakeProvider()
+
+
+def test_timeout_is_not_reported_as_revert():
+    simulator = Simulator(FakeWeb3(), SENDER)
+    ok, reverted, unknown = simulator.simulate_many([
+        ('transfer', TARGET, '0x00', 0),
+        ('transfer', TARGET, '0x01', 0),
+        ('transfer', TARGET, '0x02', 0),
+    ])
+    assert ok.ok and ok.gas == 21000
+    assert reverted.ok is False and reverted.reason == 'TRANSFER_FROM_FAILED'
+    assert unknown.ok is None and unknown.reason == 'read timed out'
@@ -0,0 +1,77 @@
+from eth_abi import encode
+from web3 import Web3
+from snapshot import MULTICALL3_ADDRESS, MULTICALL_MAX_FAILURES, ContractRead, StateReader
+
+TOKEN = '0x' + '22' * 20
+WALLET = '0x' + '33' * 20
+
+
+class FakeProvider:
+    """Multicall3的 eth_call 返回错误，直接对代币合约的 eth_call 返回余额 7"""
+
+    def __init__(self):
+        self.multicall_calls = 0
+
+    def make_batch_request(self, calls):
+        return [self._respond(method, params) for method, params in calls]
+
+    def make_request(self, method, params):
+        return self._respond(method, params)
+
+    def _respond(self, method, params):
+        if method == 'eth_call' and params[0]['to'] == MULTICALL3_ADDRESS:
+            self.multicall_calls += 1
+            return {'error': {'code': -32000, 'message': 'execution reverted'}}
+        if method == 'eth_call':
+            return {'result': Web3.to_hex(encode(['uint256'], [7]))}
+        if method == 'eth_blockNumber':
+            return {'result': '0x10'}
+        return {'result': '0x1'}
+
+
+class FakeEth:
+    def __init__(self, code):
+        self.code = code
+
+    def get_code(self, address):
+        return self.code
+
+
+class FakeWeb3:
+    def __init__(self, code):
+        self.provider = FakeProvider()
+        self.eth = FakeEth(code)
+
+
+def balance_read():
+    return [ContractRead('balance', TOKEN, 'balanceOf(address)', [WALLET])]
+
+
+def test_multicall_disabled_when_no_code():
+    reader = StateReader(FakeWeb3(b''))
+    state = reader.read(balance_read())
+    assert state.balance == 7
+    assert state.block_number == 16
+    assert not reader.multicall_supported
+
+
+def test_multicall_failure_with_code_falls_back_for_one_read():
+    w3 = FakeWeb3(b'\x60\x80')
+    reader = StateReader(w3)
+    for attempt in range(1, MULTICALL_MAX_FAILURES + 1):
+        assert reader.multicall_supported
+        assert reader.read(balance_read()).balance == 7
+        assert w3.provider.multicall_calls == attempt
+    # 连续失败达到上限后不再使用
+    assert not reader.multicall_supported
+    reader.read(balance_read())
+    assert w3.provider.multicall_calls == MULTICALL_MAX_FAILURES
+
+
+def test_fallback_snapshot_uses_pinned_block():
+    reader = StateReader(FakeWeb3(b''))
+    reader.multicall_supported = False
+    state = reader.read(balance_read(), eth_balances=[('bnb', WALLET)], block_identifier=5)
+    assert state.balance == 7
+    assert state.block_number == 5
+    assert reader.read(balance_read()).block_number == 16
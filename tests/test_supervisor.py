@@ -0,0 +1,19 @@
+import pytest
+from supervisor import check_distinct_wallets, pair_env
+
+KEY_1 = '0x' + '01' * 32
+KEY_2 = '0x' + '02' * 32
+
+
+def envs(*keys):
+    return [(f"pair-{i}", pair_env({}, {'name': f"pair-{i}", 'private_key': key}, ('127.0.0.1', 7070), 'secret'))
+            for i, key in enumerate(keys)]
+
+
+def test_distinct_wallets_accepted():
+    check_distinct_wallets(envs(KEY_1, KEY_2))
+
+
+def test_shared_wallet_rejected():
+    with pytest.raises(ValueError, match='pair-0 和 pair-2'):
+        check_distinct_wallets(envs(KEY_1, KEY_2, KEY_1))
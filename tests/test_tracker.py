@@ -0,0 +1,38 @@
+from tracker import DROPPED, PENDING, InclusionTracker
+
+ADDRESS = '0x' + '11' * 20
+TX = '0x' + 'aa' * 32
+
+
+class FakeNotifier:
+    block_time = 3.0
+
+    def add_listener(self, callback):
+        pass
+
+    def remove_listener(self, callback):
+        pass
+
+
+class FakeWeb3:
+    """交易既没有回执也不在交易池中，钱包nonce尚未用到"""
+
+    def __init__(self):
+        self.provider = self
+
+    def make_batch_request(self, calls):
+        return [{'result': '0x0'} if method == 'eth_getTransactionCount' else {'result': None}
+                for method, _ in calls]
+
+
+def test_retracking_a_dropped_transaction_resets_it():
+    tracker = InclusionTracker(FakeWeb3(), FakeNotifier(), ADDRESS, pool_check=lambda hashes: [])
+    tracker.track(TX, 0)
+    tracker.on_block(1)
+    tracker.on_block(2)
+    assert tracker.status(TX) == DROPPED
+
+    # 重新广播后重新跟踪：等待结果不能是之前的 dropped
+    tracker.track(TX, 0)
+    assert tracker.status(TX) == PENDING
+    assert tracker.wait([TX], timeout=0.05) is None
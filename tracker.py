@@ -0,0 +1,233 @@
+import time
+import logging
+import threading
+from web3 import Web3
+from rpc import batch_request, format_receipt, to_int, tx_hash_key
+
+# 交易状态
+PENDING = 'pending'      # 仍在交易池中
+INCLUDED = 'included'    # 已打包（回执 status 可能为失败）
+REPLACED = 'replaced'    # 同一nonce的另一笔交易已上链
+DROPPED = 'dropped'      # 查询节点和广播节点的交易池中都查不到，nonce也未被消耗（之后仍可能上链）
+
+
+class TrackedTx:
+    """一笔被跟踪的交易"""
+
+    def __init__(self, tx_hash, nonce, tx_type=None, sent_block=None):
+        self.hash = tx_hash
+        self.nonce = nonce
+        self.tx_type = tx_type
+        self.sent_block = sent_block
+        self.sent_at = time.perf_counter()
+        self.status = PENDING
+        self.receipt = None
+        self.replaced_by = None  # 替换它上链的交易哈希（未知时为None）
+        self.misses = 0          # 连续几个区块未在交易池中查到
+        self.callbacks = []
+
+
+class InclusionTracker:
+    """在途交易跟踪器
+
+    所有在途交易共用一次批量查询：每个新区块对每笔交易发 eth_getTransactionByHash + eth_getTransactionReceipt，
+    外加一次钱包的已确认nonce，据此把每笔交易归类为 pending / included / replaced / dropped，
+    状态变化时调用回调并唤醒等待者。replaced / dropped 需要连续 confirm_blocks 个区块观察到才判定，
+    避免负载均衡节点之间交易池不同步造成误判。
+
+    查询节点查不到的交易不一定被丢弃（广播节点可能是私有中继，或与查询节点不同），
+    判定 dropped 前还要用 pool_check(哈希列表) 确认广播节点也查不到，它返回仍可能在交易池中的哈希。
+    dropped 的交易在nonce被消耗前继续跟踪：之后上链会改为 included，其他交易用掉nonce会改为 replaced。
+    """
+
+    def __init__(self, w3, notifier, address, confirm_blocks=2, on_change=None, pool_check=None):
+        self.w3 = w3
+        self.notifier = notifier
+        self.address = Web3.to_checksum_address(address)
+        self.confirm_blocks = confirm_blocks
+        self.on_change = on_change  # on_change(entry)，在通知线程中执行
+        self.pool_check = pool_check
+        self._cond = threading.Condition()
+        self._entries = {}  # 交易哈希 -> entry
+        self._listening = False
+
+    # ---------- 对外接口 ----------
+
+    def track(self, tx_hash, nonce, tx_type=None, sent_block=None, callback=None):
+        """开始跟踪一笔已广播的交易；callback(entry) 在每次状态变化（离开 pending 或 dropped 后又上链）时调用
+
+        已在跟踪的交易（如被判定为 dropped 后重新广播）恢复为 pending，由之后的区块重新判定。
+        """
+        key = tx_hash_key(tx_hash)
+        with self._cond:
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = self._entries[key] = TrackedTx(key, nonce, tx_type, sent_block)
+            else:
+                entry.status = PENDING
+                entry.receipt = None
+                entry.replaced_by = None
+                entry.misses = 0
+            if callback is not None:
+                entry.callbacks.append(callback)
+            if not self._listening:
+                self._listening = True
+                self.notifier.add_listener(self.on_block)
+        return entry
+
+    def untrack(self, tx_hashes):
+        with self._cond:
+            for tx_hash in tx_hashes:
+                self._entries.pop(tx_hash_key(tx_hash), None)
+            self._stop_listening_if_idle()
+
+    def status(self, tx_hash):
+        entry = self._entries.get(tx_hash_key(tx_hash))
+        return entry.status if entry is not None else None
+
+    def in_flight(self):
+        with self._cond:
+            return [entry for entry in self._entries.values() if entry.status == PENDING]
+
+    def wait(self, tx_hashes, timeout=None):
+        """等待同一nonce的多个版本，返回决定结果的 entry；超时仍有版本 pending 时返回None
+
+        任何一个版本上链即返回该版本（其余版本会被标记为 replaced）；nonce被未跟踪的交易消耗时返回 replaced 的版本；
+        所有版本都被丢弃时返回其中一个 dropped 的版本。
+        上链或被替换的版本不再跟踪；dropped 的版本继续跟踪，之后再发的版本可以和它一起等待。
+        """
+        keys = [tx_hash_key(h) for h in tx_hashes]
+        deadline = None if timeout is None else time.time() + timeout
+        with self._cond:
+            try:
+                while True:
+                    entries = [self._entries[k] for k in keys if k in self._entries]
+                    # 优先返回上链的版本，其次是nonce已被消耗的版本
+                    for status in (INCLUDED, REPLACED):
+                        for entry in entries:
+                            if entry.status == status:
+                                return entry
+                    if entries and all(entry.status == DROPPED for entry in entries):
+                        return entries[0]
+                    remaining = None if deadline is None else deadline - time.time()
+                    if not entries or (remaining is not None and remaining <= 0):
+                        return None
+                    self._cond.wait(remaining)
+            finally:
+                for key in keys:
+                    entry = self._entries.get(key)
+                    if entry is not None and entry.status in (INCLUDED, REPLACED):
+                        self._entries.pop(key, None)
+                self._stop_listening_if_idle()
+
+    def wait_all(self, tx_hashes, timeout=None):
+        """等待所有交易状态确定，返回 {交易哈希: entry}；超时时未确定的交易 status 仍为 pending
+
+        返回后 dropped 的交易仍在跟踪，调用方不再需要时用 untrack() 移除。
+        """
+        keys = [tx_hash_key(h) for h in tx_hashes]
+        deadline = None if timeout is None else time.time() + timeout
+        with self._cond:
+            try:
+                while any(k in self._entries and self._entries[k].status == PENDING for k in keys):
+                    remaining = None if deadline is None else deadline - time.time()
+                    if remaining is not None and remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                return {k: self._entries[k] for k in keys if k in self._entries}
+            finally:
+                for key in keys:
+                    entry = self._entries.get(key)
+                    if entry is not None and entry.status in (INCLUDED, REPLACED):
+                        self._entries.pop(key, None)
+                self._stop_listening_if_idle()
+
+    def _stop_listening_if_idle(self):
+        if self._listening and not self._entries:
+            self._listening = False
+            self.notifier.remove_listener(self.on_block)
+
+    # ---------- 区块处理 ----------
+
+    def on_block(self, block_number):
+        """新区块：一次批量请求查询所有在途交易（包括nonce尚未被消耗的 dropped 交易）"""
+        with self._cond:
+            watched = [entry for entry in self._entries.values() if entry.status in (PENDING, DROPPED)]
+        if not watched:
+            return
+        calls = []
+        for entry in watched:
+            calls.append(('eth_getTransactionReceipt', [entry.hash]))
+            calls.append(('eth_getTransactionByHash', [entry.hash]))
+        calls.append(('eth_getTransactionCount', [self.address, 'latest']))
+        try:
+            results = batch_request(self.w3, calls)
+        except Exception as e:
+            logging.warning(f"批量查询在途交易失败: {str(e)[:50]}")
+            return
+        chain_nonce = to_int(results[-1])
+
+        changed = []
+        missing = []  # 查询节点连续查不到、nonce也未被消耗的交易，待广播节点确认
+        with self._cond:
+            included_nonces = {}
+            for i, entry in enumerate(watched):
+                raw_receipt = results[2 * i]
+                if raw_receipt is not None:
+                    entry.receipt = format_receipt(raw_receipt)
+                    entry.status = INCLUDED
+                    included_nonces[entry.nonce] = entry.hash
+                    changed.append(entry)
+            for i, entry in enumerate(watched):
+                if entry.status == INCLUDED:
+                    continue
+                if entry.nonce in included_nonces:
+                    # 自己的另一个版本（如提价替换）已上链
+                    entry.status = REPLACED
+                    entry.replaced_by = included_nonces[entry.nonce]
+                    changed.append(entry)
+                    continue
+                nonce_used = chain_nonce is not None and entry.nonce < chain_nonce
+                if results[2 * i + 1] is not None and not nonce_used:
+                    entry.misses = 0
+                    continue
+                if entry.status == DROPPED and not nonce_used:
+                    continue
+                # nonce已被未跟踪的交易消耗，或查询节点的交易池中已查不到
+                entry.misses += 1
+                if entry.misses < self.confirm_blocks:
+                    continue
+                if nonce_used:
+                    entry.status = REPLACED
+                    changed.append(entry)
+                else:
+                    missing.append(entry)
+
+        if missing:
+            # 广播节点仍有（或无法确认）的交易不算丢弃
+            try:
+                known = set(self.pool_check([entry.hash for entry in missing])) if self.pool_check else set()
+            except Exception as e:
+                logging.warning(f"广播节点交易池查询失败: {str(e)[:50]}")
+                known = {entry.hash for entry in missing}
+            with self._cond:
+                for entry in missing:
+                    if entry.status != PENDING:
+                        continue
+                    if entry.hash in known:
+                        entry.misses = 0
+                    else:
+                        entry.status = DROPPED
+                        changed.append(entry)
+        if not changed:
+            return
+
+        # 先执行回调（如写日志、记录指标），再唤醒等待者
+        for entry in changed:
+            for callback in ([self.on_change] if self.on_change else []) + entry.callbacks:
+                try:
+                    callback(entry)
+                except Exception as e:
+                    logging.warning(f"交易状态回调出错: {str(e)[:50]}")
+        with self._cond:
+            self._cond.notify_all()
@@ -0,0 +1,116 @@
+import time
+import rlp
+from eth_account import Account
+from eth_account.datastructures import SignedTransaction
+from eth_utils import keccak
+from hexbytes import HexBytes
+from web3 import Web3
+from snapshot import encode_call
+
+
+def deadline_after(seconds):
+    """deadline提供函数：每次构建交易时取当前时间加 seconds 秒，长时间运行也不会过期"""
+    return lambda: int(time.time()) + seconds
+
+
+class CalldataTemplate:
+    """预编码的调用数据
+
+    函数选择器和所有参数在创建时一次性ABI编码，之后每次只替换变化的32字节参数字
+    （如 amountOutMin、deadline），不再重复ABI查找与编码。只有静态类型参数可以替换。
+    """
+
+    def __init__(self, signature, args, variables=None):
+        self.signature = signature
+        self._data = bytes(encode_call(signature, args))
+        # 参数名 -> 在调用数据中的字节偏移（4字节选择器之后第index个参数字）
+        self._offsets = {name: 4 + 32 * index for name, index in (variables or {}).items()}
+
+    def render(self, **values):
+        if not values:
+            return self._data
+        data = bytearray(self._data)
+        for name, value in values.items():
+            offset = self._offsets[name]
+            data[offset:offset + 32] = int(value).to_bytes(32, 'big')
+        return bytes(data)
+
+
+class TxFactory:
+    """交易工厂：预编码调用数据 + 缓存私钥对象的离线签名
+
+    私钥只解析一次，签名直接对交易做RLP编码和哈希，跳过 sign_transaction 对交易字典的
+    校验与格式转换。费用可以是gas价格整数、{'gasPrice'}（EIP-155 legacy 交易）或
+    {'maxFeePerGas', 'maxPriorityFeePerGas'}（EIP-1559 交易）。chain_id 可以传入函数，首次签名时再获取。
+    """
+
+    def __init__(self, private_key, chain_id=None):
+        self.account = Account.from_key(private_key)
+        self.address = self.account.address
+        self.chain_id = chain_id
+        self._key = self.account._key_obj
+        self._templates = {}
+        self._providers = {}
+
+    def register(self, name, to, signature, args, gas, variables=None, providers=None):
+        """注册一种交易：目标合约、函数签名、参数和gas上限
+
+        providers 为 {参数名: 无参函数}，构建时没有传入该参数就调用函数取值（如 deadline_after）。
+        """
+        self._templates[name] = (
+            bytes(HexBytes(Web3.to_checksum_address(to))),
+            CalldataTemplate(signature, args, variables),
+            gas,
+        )
+        self._providers[name] = providers or {}
+
+    def build(self, name, nonce, fees, gas=None, **values):
+        """用已注册的模板生成签名交易，values 替换模板中的可变参数"""
+        to, data, default_gas = self.render(name, **values)
+        return self.sign(to, data, gas or default_gas, fees, nonce)
+
+    def render(self, name, **values):
+        """只生成未签名的 (to, 调用数据, gas上限)，便于分开统计构建和签名耗时"""
+        to, template, gas = self._templates[name]
+        for key, provider in self._providers[name].items():
+            if key not in values:
+                values[key] = provider()
+        return to, template.render(**values), gas
+
+    def gas_limit(self, name):
+        return self._templates[name][2]
+
+    def sign(self, to, data, gas, fees, nonce, value=0):
+        """签名交易，返回与 eth_account 相同的 SignedTransaction"""
+        if callable(self.chain_id):
+            self.chain_id = self.chain_id()
+        if self.chain_id is None:
+            raise ValueError("TxFactory 未设置 chain_id")
+        to = bytes(HexBytes(to))
+        if isinstance(fees, dict) and 'maxFeePerGas' in fees:
+            return self._sign_dynamic_fee(to, data, gas, fees, nonce, value)
+        gas_price = fees['gasPrice'] if isinstance(fees, dict) else fees
+        msg_hash = keccak(rlp.encode([nonce, gas_price, gas, to, value, data, self.chain_id, 0, 0]))
+        signature = self._key.sign_msg_hash(msg_hash)
+        v = signature.v + 35 + 2 * self.chain_id
+        raw = rlp.encode([nonce, gas_price, gas, to, value, data, v, signature.r, signature.s])
+        return SignedTransaction(
+            raw_transaction=HexBytes(raw),
+            hash=HexBytes(keccak(raw)),
+            r=signature.r,
+            s=signature.s,
+            v=v,
+        )
+
+    def _sign_dynamic_fee(self, to, data, gas, fees, nonce, value):
+        """EIP-1559（type 2）交易"""
+        fields = [self.chain_id, nonce, fees['maxPriorityFeePerGas'], fees['maxFeePerGas'], gas, to, value, data, []]
+        signature = self._key.sign_msg_hash(keccak(b'\x02' + rlp.encode(fields)))
+        raw = b'\x02' + rlp.encode(fields + [signature.v, signature.r, signature.s])
+        return SignedTransaction(
+            raw_transaction=HexBytes(raw),
+            hash=HexBytes(keccak(raw)),
+            r=signature.r,
+            s=signature.s,
+            v=signature.v,
+        )